@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+import asyncio, functools, os, threading, weakref
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import List, AsyncIterator, Callable
+
+import serialize
+import unity
+from stream import FileStream
+
+_executor: Executor = None
+_concurrency: int = os.cpu_count() or 1
+_limiters = weakref.WeakKeyDictionary()  # event loop -> semaphore, asyncio primitives cannot be shared between loops
+
+def set_concurrency(concurrency: int, executor: Executor = None):
+    global _executor, _concurrency
+    _concurrency = max(1, concurrency)
+    if executor: _executor = executor
+    _limiters.clear()
+
+def get_executor() -> Executor:
+    global _executor
+    if not _executor: _executor = ThreadPoolExecutor(max_workers=_concurrency, thread_name_prefix='bundle')
+    return _executor
+
+def get_limiter() -> asyncio.Semaphore:  # caps blocking work of all bundles on this host, not per bundle
+    loop = asyncio.get_running_loop()
+    limiter = _limiters.get(loop)
+    if not limiter: limiter = _limiters[loop] = asyncio.Semaphore(_concurrency)
+    return limiter
+
+async def run_blocking(function: Callable, *args, cleanup: Callable = None, **kwargs):
+    async with get_limiter():
+        future = asyncio.get_running_loop().run_in_executor(get_executor(), functools.partial(function, *args, **kwargs))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # the worker thread cannot be interrupted, release whatever it produces once it finishes
+            if cleanup: future.add_done_callback(lambda x: x.cancelled() or x.exception() or cleanup(x.result()))
+            raise
+
+class AsyncObject(object):
+    def __init__(self, serializer: serialize.SerializedFile, info: serialize.ObjectInfo, data: dict = None):
+        self.serializer: serialize.SerializedFile = serializer
+        self.info: serialize.ObjectInfo = info
+        self.data = data  # dict, or a records.Record when decoded with records=True
+
+    @property
+    def node(self) -> str:
+        return self.serializer.node.path
+
+    @property
+    def path_id(self) -> int:
+        return self.info.local_identifier_in_file
+
+    @property
+    def type_tree(self) -> serialize.MetadataTypeTree:
+        return self.serializer.type_trees[self.info.type_id]
+
+    def __repr__(self):
+        return '{{node={}, path_id={}, type={}, size={:,}}}'.format(self.node, self.path_id, self.type_tree.name, self.info.byte_size)
+
+class AsyncBundle(object):
+    def __init__(self, file_path: str):
+        self.file_path: str = file_path
+        self.archive: unity.UnityArchiveFile = None
+        self.stream: FileStream = None
+        self.serializers: List[serialize.SerializedFile] = []
+        self.lock: threading.Lock = threading.Lock()  # executor threads share one stream position
+
+    def load(self):
+        self.archive, self.stream, nodes = unity.open_archive(self.file_path)
+        try:
+            for node in nodes:
+                self.serializers.append(unity.decode_serialized_file(node, self.stream))
+        except Exception:
+            self.stream.close()
+            raise
+        return self
+
+    def deserialize(self, serializer: serialize.SerializedFile, o: serialize.ObjectInfo, records: bool = False):
+        type_tree = serializer.type_trees[o.type_id]
+        if not type_tree.type_dict: raise ValueError('incomplete type tree: {}'.format(type_tree.name))
+        with self.lock:
+            if not self.stream: raise ValueError('bundle is closed: {}'.format(self.file_path))
+            self.stream.seek(serializer.node.offset + serializer.header.data_offset + o.byte_start)
+            if records: return serializer.deserialize_record(self.stream, meta_type=type_tree.type_dict.get(0))
+            return serializer.deserialize(self.stream, meta_type=type_tree.type_dict.get(0))
+
+    def find_object(self, path_id: int, node: str = None) -> AsyncObject:
+        for serializer in self.serializers:
+            if node and serializer.node.path != node: continue
+            for o in serializer.objects:
+                if o.local_identifier_in_file == path_id: return AsyncObject(serializer, o)
+        raise KeyError('object not found: {}'.format(path_id))
+
+    async def read(self, path_id: int, node: str = None, records: bool = False) -> AsyncObject:
+        target = self.find_object(path_id, node=node)
+        target.data = await run_blocking(self.deserialize, target.serializer, target.info, records=records)
+        return target
+
+    async def objects(self, types: List[int] = None, decode: bool = True, records: bool = False) -> AsyncIterator[AsyncObject]:
+        for serializer in self.serializers:
+            for o in serializer.objects:
+                type_tree = serializer.type_trees[o.type_id]
+                if types and type_tree.persistent_type_id not in types: continue
+                target = AsyncObject(serializer, o)
+                if decode:
+                    if not type_tree.type_dict: continue
+                    target.data = await run_blocking(self.deserialize, serializer, o, records=records)
+                else: await asyncio.sleep(0)  # stay cancellable while listing large files
+                yield target
+
+    def close(self):
+        with self.lock:  # waits for a decode still running in the executor
+            if self.stream:
+                self.stream.close()
+                self.stream = None
+
+    async def aclose(self):
+        await asyncio.get_running_loop().run_in_executor(get_executor(), self.close)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+
+async def open_bundle(file_path: str) -> AsyncBundle:
+    return await run_blocking(AsyncBundle(file_path).load, cleanup=AsyncBundle.close)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+import io
+import numpy as np
+from stream import FileStream
+from arrays import BufferBudget, read_struct, get_array, unstructured
+from typing import List
+
+KEYFRAME_CURVES = (
+    ('rotation', 'm_RotationCurves'),
+    ('euler', 'm_EulerCurves'),
+    ('position', 'm_PositionCurves'),
+    ('scale', 'm_ScaleCurves'),
+    ('float', 'm_FloatCurves'),
+    ('pptr', 'm_PPtrCurves'),
+)
+CURVE_KINDS = tuple(x for x, _ in KEYFRAME_CURVES) + ('streamed', 'dense', 'constant')
+TRANSFORM_DIMENSIONS = {1: 3, 2: 4, 3: 3, 4: 3}  # position, rotation, scale, euler
+
+class Curve(object):
+    def __init__(self, kind: str, path: any, attribute: any = ''):
+        self.kind: str = kind
+        self.path: any = path  # string for editor curves, crc32 of the path for clip curves
+        self.attribute: any = attribute
+        self.type_id: int = 0
+        self.script: int = 0
+        self.component: int = 0
+        self.time: np.ndarray = None
+        self.value: np.ndarray = None
+        self.in_slope: np.ndarray = None
+        self.out_slope: np.ndarray = None
+
+    @property
+    def dimension(self) -> int:
+        return 1 if self.value.ndim == 1 else self.value.shape[1]
+
+    def __repr__(self):
+        return '{{kind={}, path={}, attribute={}, keys={}}}'.format(self.kind, self.path, self.attribute, len(self.time))
+
+class AnimationData(object):
+    def __init__(self):
+        self.name: str = ''
+        self.sample_rate: float = 0
+        self.start_time: float = 0
+        self.stop_time: float = 0
+        self.curves: List[Curve] = []
+        self.compressed_curve_count: int = 0  # m_CompressedRotationCurves are left packed
+
+    @property
+    def key_count(self) -> int:
+        return sum(len(x.time) for x in self.curves)
+
+    def __repr__(self):
+        return '{{name={}, curves={:,}, keys={:,}, sample_rate={}, length={:.3f}}}'.format(self.name, len(self.curves), self.key_count, self.sample_rate, self.stop_time - self.start_time)
+
+def to_str(value) -> any:
+    return value.decode('utf-8', errors='replace') if isinstance(value, bytes) else value
+
+def decode_keyframe_curves(target: dict) -> List[Curve]:
+    curves = []
+    for kind, field in KEYFRAME_CURVES:
+        items = get_array(target.get(field, {}))
+        if not isinstance(items, list): continue
+        for item in items:
+            curve = Curve(kind, path=to_str(item.get('path', b'')), attribute=to_str(item.get('attribute', b'')))
+            curve.type_id = item.get('classID', 0)
+            curve.script = item.get('script', {}).get('m_PathID', 0)
+            keys = get_array(item['curve'] if kind == 'pptr' else item['curve']['m_Curve'])
+            if not isinstance(keys, np.ndarray): continue
+            curve.time = keys['time']
+            if kind == 'pptr':
+                curve.value = keys['value']['m_PathID']
+            else:
+                curve.value = unstructured(keys['value'])
+                curve.in_slope = unstructured(keys['inSlope'])
+                curve.out_slope = unstructured(keys['outSlope'])
+            curves.append(curve)
+    return curves
+
+def decode_streamed_clip(data: np.ndarray):
+    words = np.ascontiguousarray(data, dtype=np.uint32)
+    values = words.view(np.float32)
+    frames = []
+    position = 0
+    while position + 2 <= len(words):
+        key_count = int(words[position + 1])
+        keys = words[position + 2:position + 2 + key_count * 5].reshape(-1, 5)
+        frames.append((values[position], keys))
+        position += 2 + key_count * 5
+    frames = frames[1:-1]  # first and last frames are -inf/+inf sentinels
+    if not frames: return []
+    time = np.concatenate([np.full(len(keys), t, dtype=np.float32) for t, keys in frames])
+    keys = np.concatenate([keys for _, keys in frames])
+    index = keys[:, 0].astype(np.int64)
+    coeff = keys[:, 1:].view(np.float32)
+    order = np.argsort(index, kind='stable')
+    index, time, coeff = index[order], time[order], coeff[order]
+    indices, starts = np.unique(index, return_index=True)
+    curves = []
+    for curve_index, start, stop in zip(indices, starts, list(starts[1:]) + [len(index)]):
+        t, c = time[start:stop], coeff[start:stop]
+        value, out_slope = c[:, 3], c[:, 2]
+        in_slope = np.zeros(len(t), dtype=np.float32)
+        if len(t) > 1:
+            dx = np.maximum(np.diff(t), 0.0001)
+            dy = np.diff(value)
+            d1 = out_slope[:-1] * dx
+            slope = (dy * 3 - d1 * 2 - c[:-1, 1] * dx * dx) / dx
+            stepped = (c[:-1, 0] == 0) & (c[:-1, 1] == 0) & (c[:-1, 2] == 0)
+            in_slope[1:] = np.where(stepped, np.inf, slope)
+        curves.append((int(curve_index), t, value, in_slope, out_slope))
+    return curves
+
+def decode_clip_curves(target: dict) -> List[Curve]:
+    clip = target.get('m_MuscleClip', {}).get('m_Clip', {}).get('data', {})
+    if not clip: return []
+    bindings = []
+    generic_bindings = get_array(target.get('m_ClipBindingConstant', {}).get('genericBindings', {}))
+    for binding in generic_bindings if generic_bindings is not None else []:
+        type_id, attribute = int(binding['typeID']), int(binding['attribute'])
+        dimension = TRANSFORM_DIMENSIONS.get(attribute, 1) if type_id == 4 else 1
+        for component in range(dimension):
+            bindings.append((int(binding['path']), attribute, type_id, int(binding['script']['m_PathID']), component))
+
+    def create_curve(kind: str, curve_index: int) -> Curve:
+        if curve_index < len(bindings):
+            path, attribute, type_id, script, component = bindings[curve_index]
+        else:
+            path, attribute, type_id, script, component = 0, curve_index, 0, 0, 0
+        curve = Curve(kind, path=path, attribute=attribute)
+        curve.type_id, curve.script, curve.component = type_id, script, component
+        return curve
+
+    curves = []
+    streamed = clip.get('m_StreamedClip', {})
+    streamed_count = streamed.get('curveCount', 0)
+    data = get_array(streamed.get('data', {}))
+    if isinstance(data, np.ndarray) and len(data):
+        for curve_index, time, value, in_slope, out_slope in decode_streamed_clip(data):
+            curve = create_curve('streamed', curve_index)
+            curve.time, curve.value, curve.in_slope, curve.out_slope = time, value, in_slope, out_slope
+            curves.append(curve)
+    dense = clip.get('m_DenseClip', {})
+    dense_count = dense.get('m_CurveCount', 0)
+    samples = get_array(dense.get('m_SampleArray', {}))
+    frame_count = dense.get('m_FrameCount', 0)
+    if dense_count and frame_count and isinstance(samples, np.ndarray):
+        samples = samples[:frame_count * dense_count].reshape(frame_count, dense_count)
+        time = (dense.get('m_BeginTime', 0) + np.arange(frame_count, dtype=np.float32) / max(dense.get('m_SampleRate', 0), 1e-6)).astype(np.float32)
+        for n in range(dense_count):
+            curve = create_curve('dense', streamed_count + n)
+            curve.time, curve.value = time, samples[:, n]
+            curves.append(curve)
+    constants = get_array(clip.get('m_ConstantClip', {}).get('data', {}))
+    if isinstance(constants, np.ndarray) and len(constants):
+        muscle = target.get('m_MuscleClip', {})
+        time = np.array([muscle.get('m_StartTime', 0), muscle.get('m_StopTime', 0)], dtype=np.float32)
+        for n in range(len(constants)):
+            curve = create_curve('constant', streamed_count + dense_count + n)
+            curve.time, curve.value = time, np.repeat(constants[n:n + 1], 2)
+            curves.append(curve)
+    return curves
+
+def decode_animation(serializer, stream: FileStream, o) -> AnimationData:
+    type_tree = serializer.type_trees[o.type_id]
+    stream.seek(serializer.node.offset + serializer.header.data_offset + o.byte_start)
+    budget = BufferBudget(serializer.budget, stream.position) if serializer.budget and serializer.budget.active else None
+    buffer = stream.read(o.byte_size)
+    target, _ = read_struct(buffer, 0, type_tree.type_dict.get(0), endian='<' if stream.endian == '<' else '>', budget=budget)
+    animation = AnimationData()
+    animation.name = to_str(target.get('m_Name', b''))
+    animation.sample_rate = target.get('m_SampleRate', 0)
+    muscle = target.get('m_MuscleClip', {})
+    animation.start_time, animation.stop_time = muscle.get('m_StartTime', 0), muscle.get('m_StopTime', 0)
+    compressed = get_array(target.get('m_CompressedRotationCurves', {}))
+    animation.compressed_curve_count = len(compressed) if compressed is not None else 0
+    animation.curves = decode_keyframe_curves(target) + decode_clip_curves(target)
+    return animation
+
+def encode_npz(animation: AnimationData) -> bytes:
+    curves = [x for x in animation.curves if x.kind != 'pptr']
+    pptr_curves = [x for x in animation.curves if x.kind == 'pptr']
+    offsets = np.cumsum([0] + [len(x.time) for x in curves])
+    total = int(offsets[-1])
+    columns = {}
+    for name in ('value', 'in_slope', 'out_slope'):
+        column = columns[name] = np.full((total, 4), np.nan, dtype=np.float32)
+        for curve, start in zip(curves, offsets):
+            values = getattr(curve, name)
+            if values is None: continue
+            values = values.reshape(len(curve.time), -1)
+            column[start:start + len(values), :values.shape[1]] = values
+    pptr_offsets = np.cumsum([0] + [len(x.time) for x in pptr_curves])
+    arrays = {
+        'time': np.concatenate([x.time for x in curves]).astype(np.float32) if curves else np.zeros(0, dtype=np.float32),
+        'offsets': offsets,
+        'kind': np.array([CURVE_KINDS.index(x.kind) for x in curves], dtype=np.uint8),
+        'dimension': np.array([x.dimension for x in curves], dtype=np.uint8),
+        'path': np.array([str(x.path) for x in curves]),
+        'attribute': np.array([str(x.attribute) for x in curves]),
+        'type_id': np.array([x.type_id for x in curves], dtype=np.int32),
+        'component': np.array([x.component for x in curves], dtype=np.uint8),
+        'pptr_time': np.concatenate([x.time for x in pptr_curves]).astype(np.float32) if pptr_curves else np.zeros(0, dtype=np.float32),
+        'pptr_value': np.concatenate([x.value for x in pptr_curves]).astype(np.int64) if pptr_curves else np.zeros(0, dtype=np.int64),
+        'pptr_offsets': pptr_offsets,
+        'pptr_path': np.array([str(x.path) for x in pptr_curves]),
+        'pptr_attribute': np.array([str(x.attribute) for x in pptr_curves]),
+    }
+    arrays.update(columns)
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
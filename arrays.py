@@ -0,0 +1,112 @@
+import struct, weakref
+import numpy as np
+from typing import Tuple
+
+from serialize import PRIMITIVE_TYPES
+
+dtype_cache = weakref.WeakKeyDictionary()
+
+class BufferBudget(object):  # applies DecodeBudget checks to buffer offsets, base is the stream position of the buffer start
+    def __init__(self, budget, base: int = 0):
+        self.budget = budget
+        self.base: int = base
+        self.position: int = base  # read by DecodeBudget in place of a stream position
+
+    def enter(self, position: int, field: str):
+        self.position = self.base + position
+        self.budget.enter(self, field)
+
+    def leave(self):
+        self.budget.leave()
+
+    def check_count(self, position: int, field: str, count: int, element_size: int):
+        self.position = self.base + position
+        self.budget.check_count(self, field, count, element_size)
+
+def get_dtype(meta_type, endian: str = '<') -> np.dtype:  # None when the layout has arrays, strings or alignment
+    cache = dtype_cache.setdefault(meta_type, {})
+    if endian in cache: return cache[endian]
+    names, formats = [], []
+    for node in meta_type.fields:
+        if node.is_array or node.type == 'string' or node.meta_flags & 0x4000 != 0:
+            formats = None
+            break
+        if node.type in PRIMITIVE_TYPES: item = np.dtype(endian + PRIMITIVE_TYPES[node.type].code)
+        elif node.byte_size == 0: continue
+        else:
+            nested = meta_type.type_tree.type_dict.get(node.index)
+            item = get_dtype(nested, endian) if nested else np.dtype([])
+            if item is None:
+                formats = None
+                break
+        names.append(node.name)
+        formats.append(item)
+    dtype = cache[endian] = np.dtype({'names': names, 'formats': formats}) if formats is not None else None
+    return dtype
+
+def align(position: int, size: int = 4) -> int:
+    return (position + size - 1) // size * size
+
+def read_array(buffer: bytes, position: int, type_tree, element_type, endian: str = '<', budget: BufferBudget = None, field: str = '') -> Tuple[any, int]:
+    count, = struct.unpack_from(endian + 'i', buffer, position)
+    position += 4
+    if element_type.type in PRIMITIVE_TYPES:
+        dtype = np.dtype(endian + PRIMITIVE_TYPES[element_type.type].code)
+    elif element_type.type == 'string':
+        if budget: budget.check_count(position, field, count, 4)
+        items = []
+        for _ in range(max(count, 0)):
+            size, = struct.unpack_from(endian + 'i', buffer, position)
+            if budget: budget.check_count(position + 4, field, size, 1)
+            items.append(bytes(buffer[position + 4:position + 4 + max(size, 0)]))
+            position = align(position + 4 + max(size, 0))
+        return items, position
+    else:
+        element_meta = type_tree.type_dict.get(element_type.index)
+        dtype = get_dtype(element_meta, endian) if element_meta else np.dtype([])
+        if dtype is None:
+            if budget: budget.check_count(position, field, count, 4)  # variable layouts carry at least one count or aligned field
+            items = []
+            for _ in range(max(count, 0)):
+                it, position = read_struct(buffer, position, element_meta, endian, budget)
+                items.append(it)
+            return items, align(position) if count > 0 else position
+    if budget: budget.check_count(position, field, count, dtype.itemsize)
+    count = max(count, 0)
+    array = np.ndarray(shape=(count,), dtype=dtype, buffer=buffer, offset=position) if count else np.zeros(0, dtype=dtype)
+    position += count * dtype.itemsize
+    if count > 0 and (dtype.itemsize == 1 or element_type.type not in PRIMITIVE_TYPES): position = align(position)
+    return array, position
+
+# mirrors SerializedFile.deserialize, but arrays of fixed layout elements become numpy views over the buffer
+def read_struct(buffer: bytes, position: int, meta_type, endian: str = '<', budget: BufferBudget = None) -> Tuple[dict, int]:
+    result = {}
+    if not meta_type: return result, position
+    if budget: budget.enter(position, meta_type.name)
+    type_tree = meta_type.type_tree
+    for node in meta_type.fields:
+        if node.is_array:
+            result[node.name], position = read_array(buffer, position, type_tree, type_tree.nodes[node.index + 2], endian, budget, node.name)
+        elif node.type == 'string':
+            size, = struct.unpack_from(endian + 'i', buffer, position)
+            if budget: budget.check_count(position + 4, node.name, size, 1)
+            result[node.name] = bytes(buffer[position + 4:position + 4 + max(size, 0)])
+            position = align(position + 4 + max(size, 0))
+        elif node.type in PRIMITIVE_TYPES:
+            result[node.name], = struct.unpack_from(endian + PRIMITIVE_TYPES[node.type].code, buffer, position)
+            position += node.byte_size
+            if node.meta_flags & 0x4000 != 0: position = align(position)
+        elif node.byte_size == 0: continue
+        else:
+            result[node.name], position = read_struct(buffer, position, type_tree.type_dict.get(node.index), endian, budget)
+    if budget: budget.leave()
+    return result, position
+
+def get_array(value) -> any:  # unwrap vector/staticvector containers
+    while isinstance(value, dict) and len(value) == 1 and 'Array' in value: value = value['Array']
+    return value
+
+def unstructured(array: np.ndarray) -> np.ndarray:  # Vector3f/Quaternionf records as (n, k) columns
+    if array.dtype.names is None: return array
+    from numpy.lib import recfunctions
+    return recfunctions.structured_to_unstructured(array)
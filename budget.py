@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+import time
+
+class DecodeError(Exception):
+    def __init__(self, reason: str, limit, value, field: str = '', path_id: int = 0, position: int = -1):
+        super(DecodeError, self).__init__('{} {} exceeds {} at {} (object {}, position {})'.format(reason, value, limit, field or '<root>', path_id, position))
+        self.reason: str = reason  # bytes, elements, depth, seconds, file_seconds, count
+        self.limit = limit
+        self.value = value
+        self.field: str = field
+        self.path_id: int = path_id
+        self.position: int = position
+
+    def to_json(self) -> dict:
+        return {'reason': self.reason, 'limit': self.limit, 'value': self.value, 'field': self.field, 'path_id': self.path_id, 'position': self.position}
+
+class DecodeBudget(object):
+    TIME_CHECK_INTERVAL = 1024  # structures decoded between clock reads
+
+    def __init__(self, max_bytes: int = 0, max_elements: int = 0, max_depth: int = 0, max_seconds: float = 0, max_file_seconds: float = 0):
+        self.max_bytes: int = max_bytes  # per object, zero disables a limit
+        self.max_elements: int = max_elements
+        self.max_depth: int = max_depth
+        self.max_seconds: float = max_seconds
+        self.max_file_seconds: float = max_file_seconds
+        self.active: bool = False  # limits apply between begin() and finish()
+        self.path_id: int = 0
+        self.size: int = 0
+        self.start: int = None  # stream position of the object, taken on the first structure decoded
+        self.end: int = None
+        self.elements: int = 0
+        self.depth: int = 0
+        self.ticks: int = 0
+        self.deadline: float = 0
+        self.file_deadline: float = 0
+
+    def begin_file(self):
+        self.file_deadline = time.monotonic() + self.max_file_seconds if self.max_file_seconds > 0 else 0
+
+    @property
+    def file_expired(self) -> bool:
+        return 0 < self.file_deadline < time.monotonic()
+
+    def begin(self, o):  # o is an ObjectInfo, checked before any of its bytes are read
+        self.active = True
+        self.path_id, self.size = o.local_identifier_in_file, o.byte_size
+        self.start = self.end = None
+        self.elements = self.depth = self.ticks = 0
+        now = time.monotonic()
+        self.deadline = now + self.max_seconds if self.max_seconds > 0 else 0
+        if self.file_deadline and self.file_deadline < now: raise DecodeError('file_seconds', self.max_file_seconds, round(now - self.file_deadline + self.max_file_seconds, 3), path_id=self.path_id)
+        if 0 < self.max_bytes < o.byte_size: raise DecodeError('bytes', self.max_bytes, o.byte_size, path_id=self.path_id)
+
+    def finish(self):
+        self.active = False
+
+    def enter(self, fs, field: str):
+        if self.depth == 0 and self.start is None:
+            self.start = fs.position
+            self.end = self.start + self.size if self.size > 0 else None
+        self.depth += 1
+        if 0 < self.max_depth < self.depth: raise DecodeError('depth', self.max_depth, self.depth, field, self.path_id, fs.position)
+        self.ticks += 1
+        if self.ticks % self.TIME_CHECK_INTERVAL == 0: self.check_time(fs, field)
+
+    def leave(self):
+        self.depth -= 1
+
+    def check_time(self, fs, field: str):
+        now = time.monotonic()
+        if 0 < self.deadline < now: raise DecodeError('seconds', self.max_seconds, round(now - self.deadline + self.max_seconds, 3), field, self.path_id, fs.position)
+        if 0 < self.file_deadline < now: raise DecodeError('file_seconds', self.max_file_seconds, round(now - self.file_deadline + self.max_file_seconds, 3), field, self.path_id, fs.position)
+
+    def check_count(self, fs, field: str, count: int, element_size: int):  # before an array or string is allocated
+        if count < 0: raise DecodeError('count', 0, count, field, self.path_id, fs.position)
+        if self.end is not None and count * max(1, element_size) > self.end - fs.position:
+            raise DecodeError('bytes', self.end - fs.position, count * max(1, element_size), field, self.path_id, fs.position)
+        if element_size != 1:  # byte arrays are bounded by the size check alone
+            self.elements += count
+            if 0 < self.max_elements < self.elements: raise DecodeError('elements', self.max_elements, self.elements, field, self.path_id, fs.position)
+        if count > self.TIME_CHECK_INTERVAL: self.check_time(fs, field)
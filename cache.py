@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+import hashlib, mmap, os, tempfile, time
+import os.path as p
+from typing import BinaryIO, List, Tuple
+
+try: import fcntl
+except ImportError: fcntl = None  # no cross-process eviction lock, concurrent evictions only race on unlink
+
+ENTRY_EXTENSION = '.bin'
+
+class DecompressedCache(object):
+    def __init__(self, directory: str, max_bytes: int = 0):
+        self.directory: str = directory
+        self.max_bytes: int = max_bytes  # LRU budget over all entries, zero keeps everything
+        os.makedirs(directory, exist_ok=True)
+
+    def get_key(self, file_path: str, fs, archive) -> str:  # archive metadata must be decoded from fs, the open bundle file
+        position = fs.position
+        fs.seek(0)
+        metadata = fs.read(archive.blocks_offset)  # header, blocks info with uncompressed data hash, directory
+        if archive.header.has_blocks_at_the_end:
+            fs.seek(archive.header.get_blocks_info_offset())
+            metadata += fs.read(archive.header.compressed_blocks_info_size)
+        fs.seek(position)
+        stat = os.stat(file_path)
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(stat.st_size.to_bytes(8, 'little'))
+        digest.update(metadata)
+        # in-place patches keep the size, metadata and hash, so the key is always pinned to this file version
+        digest.update('{}:{}'.format(stat.st_ino, stat.st_mtime_ns).encode())
+        if not any(archive.blocks_info.uncompressed_data_hash): digest.update(p.abspath(file_path).encode())  # builds often leave the hash empty
+        return digest.hexdigest()
+
+    def get_path(self, key: str) -> str:
+        return p.join(self.directory, key[:2], key + ENTRY_EXTENSION)
+
+    def open(self, key: str, size: int) -> mmap.mmap:  # mapped entry or None on a miss
+        file_path = self.get_path(key)
+        try:
+            with open(file_path, 'rb') as fp:
+                if os.fstat(fp.fileno()).st_size != size:
+                    self.discard(file_path)
+                    return None
+                data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError): return None
+        try: os.utime(file_path)  # mtime is the LRU clock
+        except OSError: pass
+        return data
+
+    def create(self) -> BinaryIO:
+        os.makedirs(self.directory, exist_ok=True)
+        return tempfile.NamedTemporaryFile(dir=self.directory, prefix='.', suffix='.tmp', delete=False)
+
+    def commit(self, fp: BinaryIO, key: str) -> mmap.mmap:  # publish a fully written temporary entry, readers never see partial data
+        fp.flush()
+        file_path = self.get_path(key)
+        os.makedirs(p.dirname(file_path), exist_ok=True)
+        data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        os.chmod(fp.name, 0o644)  # temporary files are private, entries are shared with other users' workers
+        os.replace(fp.name, file_path)
+        fp.close()
+        if self.max_bytes > 0: self.evict(keep=file_path)
+        return data
+
+    def abort(self, fp: BinaryIO):
+        fp.close()
+        self.discard(fp.name)
+
+    def discard(self, file_path: str):
+        try: os.unlink(file_path)
+        except FileNotFoundError: pass
+
+    def get_entries(self) -> List[Tuple[float, int, str]]:  # mtime, size, path
+        entries = []
+        for folder, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(ENTRY_EXTENSION): continue
+                file_path = p.join(folder, name)
+                try: stat = os.stat(file_path)
+                except FileNotFoundError: continue
+                entries.append((stat.st_mtime, stat.st_size, file_path))
+        return entries
+
+    def evict(self, keep: str = None) -> int:  # unlinked entries stay valid for processes that already mapped them
+        with open(p.join(self.directory, '.lock'), 'a') as lock:
+            if fcntl: fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            entries = self.get_entries()
+            total = sum(x[1] for x in entries)
+            removed = 0
+            for _, size, file_path in sorted(entries):
+                if total <= self.max_bytes: break
+                if file_path == keep: continue
+                self.discard(file_path)
+                total -= size
+                removed += 1
+            self.clean_temporary()
+        return removed
+
+    def clean_temporary(self, age: float = 3600):  # temporary files left behind by killed writers
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith('.tmp'): continue
+            file_path = p.join(self.directory, name)
+            try:
+                if now - os.stat(file_path).st_mtime > age: os.unlink(file_path)
+            except FileNotFoundError: pass
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+import argparse, os, sqlite3, sys, time, uuid
+import os.path as p
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
+import serialize
+import unity
+from duplicates import find_bundles
+from stats import decode_metadata
+from stream import FileStream
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS bundles (id INTEGER PRIMARY KEY, path TEXT UNIQUE, size INTEGER, mtime_ns INTEGER, indexed_at REAL);
+CREATE TABLE IF NOT EXISTS nodes (bundle_id INTEGER, node_index INTEGER, path TEXT, offset INTEGER, size INTEGER, flags INTEGER);
+CREATE TABLE IF NOT EXISTS objects (bundle_id INTEGER, node TEXT, path_id INTEGER, persistent_type_id INTEGER, type TEXT,
+    byte_start INTEGER, byte_size INTEGER, script_file_id INTEGER, script_path_id INTEGER, script TEXT);
+CREATE TABLE IF NOT EXISTS externals (bundle_id INTEGER, node TEXT, file_id INTEGER, guid TEXT, type INTEGER, path TEXT);
+CREATE INDEX IF NOT EXISTS nodes__bundle_id ON nodes (bundle_id);
+CREATE INDEX IF NOT EXISTS nodes__path ON nodes (path);
+CREATE INDEX IF NOT EXISTS objects__bundle_id ON objects (bundle_id);
+CREATE INDEX IF NOT EXISTS objects__path_id ON objects (path_id);
+CREATE INDEX IF NOT EXISTS objects__type ON objects (type);
+CREATE INDEX IF NOT EXISTS objects__script_path_id ON objects (script_path_id);
+CREATE INDEX IF NOT EXISTS objects__script ON objects (script);
+CREATE INDEX IF NOT EXISTS externals__bundle_id ON externals (bundle_id);
+CREATE INDEX IF NOT EXISTS externals__path ON externals (path);
+'''
+
+NodeRow = Tuple[int, str, int, int, int]  # index, path, offset, size, flags
+ObjectRow = Tuple[str, int, int, str, int, int, int, int, str]  # node, path id, persistent type, type, start, size, script file id, script path id, script
+ExternalRow = Tuple[str, int, str, int, str]  # node, file id, guid, type, path
+
+class BundleRecord(object):
+    def __init__(self, file_path: str, signature: Tuple[int, int]):
+        self.file_path: str = file_path
+        self.signature: Tuple[int, int] = signature
+        self.nodes: List[NodeRow] = []
+        self.objects: List[ObjectRow] = []
+        self.externals: List[ExternalRow] = []
+
+def get_signature(file_path: str) -> Tuple[int, int]:
+    stat = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns
+
+def scan_bundle(file_path: str) -> BundleRecord:
+    record = BundleRecord(file_path, get_signature(file_path))
+    archive = unity.UnityArchiveFile(debug=False)
+    fs = FileStream(file_path=file_path)
+    try:
+        archive.decode_metadata(fs)
+        for node in archive.direcory_info.nodes:
+            record.nodes.append((node.index, node.path, node.offset, node.size, node.flags))
+            if not node.is_serialized_file: continue
+            serializer = decode_metadata(archive, fs, node)
+            for o in serializer.objects:
+                type_tree = serializer.type_trees[o.type_id]
+                script_file_id = script_path_id = script = None
+                if 0 <= type_tree.script_index < len(serializer.typeinfos):
+                    info = serializer.typeinfos[type_tree.script_index]
+                    script_file_id, script_path_id = info.local_serialized_file_index, info.local_identifier_in_file
+                    script = unity.resolve_script(script_path_id)
+                record.objects.append((node.path, o.local_identifier_in_file, type_tree.persistent_type_id, type_tree.name,
+                                       o.byte_start, o.byte_size, script_file_id, script_path_id, script))
+            for n, external in enumerate(serializer.externals):  # file id 0 is the node itself, externals start at 1
+                record.externals.append((node.path, n + 1, str(uuid.UUID(bytes=external.guid)), external.type, external.path))
+    finally:
+        fs.close()
+    return record
+
+def scan_bundle_safely(file_path: str) -> Tuple[str, BundleRecord, str]:
+    try: return file_path, scan_bundle(file_path), ''
+    except Exception as error: return file_path, None, '{}: {}'.format(type(error).__name__, error)
+
+class ObjectCatalog(object):
+    def __init__(self, file_path: str):
+        self.file_path: str = file_path
+        self.connection: sqlite3.Connection = sqlite3.connect(file_path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+
+    def get_stale(self, files: List[str]) -> List[str]:
+        known = {k: (s, m) for k, s, m in self.connection.execute('SELECT path, size, mtime_ns FROM bundles')}
+        stale = []
+        for file_path in files:
+            try: signature = get_signature(file_path)
+            except OSError: continue
+            if known.get(file_path) != signature: stale.append(file_path)
+        return stale
+
+    def remove(self, file_path: str):
+        row = self.connection.execute('SELECT id FROM bundles WHERE path = ?', (file_path,)).fetchone()
+        if not row: return
+        for table in ('nodes', 'objects', 'externals'):
+            self.connection.execute('DELETE FROM {} WHERE bundle_id = ?'.format(table), row)
+        self.connection.execute('DELETE FROM bundles WHERE id = ?', row)
+
+    def store(self, record: BundleRecord):
+        with self.connection:  # one transaction per bundle so an interrupted update leaves whole bundles behind
+            self.remove(record.file_path)
+            cursor = self.connection.execute('INSERT INTO bundles (path, size, mtime_ns, indexed_at) VALUES (?, ?, ?, ?)',
+                                             (record.file_path,) + record.signature + (time.time(),))
+            bundle_id = cursor.lastrowid
+            self.connection.executemany('INSERT INTO nodes VALUES (?, ?, ?, ?, ?, ?)', ((bundle_id,) + x for x in record.nodes))
+            self.connection.executemany('INSERT INTO objects VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', ((bundle_id,) + x for x in record.objects))
+            self.connection.executemany('INSERT INTO externals VALUES (?, ?, ?, ?, ?, ?)', ((bundle_id,) + x for x in record.externals))
+
+    def prune(self, directory: str) -> int:  # drop bundles under the directory that no longer exist
+        prefix = p.join(directory, '')
+        removed = 0
+        for file_path, in self.connection.execute('SELECT path FROM bundles').fetchall():
+            if file_path.startswith(prefix) and not p.exists(file_path):
+                with self.connection: self.remove(file_path)
+                removed += 1
+        return removed
+
+    def update(self, files: List[str], jobs: int = 0, initializer=None) -> Tuple[int, int]:
+        stale = self.get_stale(files)
+        jobs = jobs if jobs > 0 else os.cpu_count() or 1
+        failed = 0
+        with ProcessPoolExecutor(max_workers=jobs, initializer=initializer) as executor:
+            for file_path, record, error in executor.map(scan_bundle_safely, stale, chunksize=max(1, min(64, len(stale) // (jobs * 4) or 1))):
+                if error:
+                    print('\033[31m[E] {} {}\033[0m'.format(file_path, error))
+                    failed += 1
+                else: self.store(record)
+        return len(stale) - failed, failed
+
+    def query(self, condition: str, parameters: tuple) -> List[dict]:
+        cursor = self.connection.execute('SELECT b.path, o.* FROM objects o JOIN bundles b ON b.id = o.bundle_id WHERE {} ORDER BY b.path, o.node, o.path_id'.format(condition), parameters)
+        columns = ['bundle'] + [x[0] for x in cursor.description[1:]]
+        return [dict(zip(columns, x)) for x in cursor]
+
+    def find_object(self, path_id: int) -> List[dict]:
+        return self.query('o.path_id = ?', (path_id,))
+
+    def find_script(self, script) -> List[dict]:  # class name or MonoScript path id
+        if isinstance(script, int): return self.query('o.script_path_id = ?', (script,))
+        return self.query('o.script = ?', (script,))
+
+    def find_type(self, type_name: str) -> List[dict]:
+        return self.query('o.type = ?', (type_name,))
+
+    def get_dependencies(self, file_path: str) -> List[Tuple[str, str]]:  # (external path, bundle providing that node)
+        rows = self.connection.execute('''SELECT DISTINCT e.path, d.path FROM externals e JOIN bundles b ON b.id = e.bundle_id
+            LEFT JOIN nodes n ON n.path = substr(e.path, length(rtrim(e.path, replace(e.path, '/', ''))) + 1)
+            LEFT JOIN bundles d ON d.id = n.bundle_id WHERE b.path = ? ORDER BY e.path''', (file_path,))
+        return rows.fetchall()
+
+    def close(self):
+        self.connection.close()
+
+def print_objects(rows: List[dict]):
+    for row in rows:
+        print('\033[36m{bundle} \033[0m{node} \033[33m{path_id} {type}\033[0m {byte_start:,}+{byte_size:,} \033[2m{script}\033[0m'.format(**row))
+
+def main():
+    arguments = argparse.ArgumentParser()
+    arguments.add_argument('--database', '-db', default='catalog.sqlite')
+    arguments.add_argument('--directory', '-d')
+    arguments.add_argument('--file', '-f', nargs='+')
+    arguments.add_argument('--prune', action='store_true')
+    arguments.add_argument('--jobs', '-j', type=int, default=0)
+    arguments.add_argument('--path-id', type=int)
+    arguments.add_argument('--script')
+    arguments.add_argument('--type')
+    arguments.add_argument('--dependencies')
+    options = arguments.parse_args(sys.argv[1:])
+    catalog = ObjectCatalog(options.database)
+    try:
+        files = [p.abspath(x) for x in options.file or []]
+        if options.directory: files.extend(p.abspath(x) for x in find_bundles(options.directory))
+        if files:
+            start = time.perf_counter()
+            updated, failed = catalog.update(files, jobs=options.jobs, initializer=unity.init_worker)
+            print('[+] {:,} bundles, updated={:,} failed={:,} elapsed={:.1f}s'.format(len(files), updated, failed, time.perf_counter() - start))
+        if options.prune and options.directory:
+            print('[+] pruned {:,} bundles'.format(catalog.prune(p.abspath(options.directory))))
+        if options.path_id is not None: print_objects(catalog.find_object(options.path_id))
+        if options.script: print_objects(catalog.find_script(int(options.script) if options.script.lstrip('-').isdigit() else options.script))
+        if options.type: print_objects(catalog.find_type(options.type))
+        if options.dependencies:
+            for external, bundle in catalog.get_dependencies(p.abspath(options.dependencies)):
+                print('{} \033[36m{}\033[0m'.format(external, bundle if bundle else '\033[31mmissing'))
+    finally:
+        catalog.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+import argparse, json, sys, time
+import os.path as p
+from typing import Dict, Iterable, List, Set
+
+import serialize
+import unity
+from catalog import ObjectCatalog
+from duplicates import find_bundles
+
+def get_node_name(path: str) -> str:  # external paths look like archive:/CAB-xxx/CAB-xxx
+    return path[path.rfind('/') + 1:].lower()
+
+class DependencyGraph(object):
+    def __init__(self):
+        self.bundles: List[str] = []
+        self.edges: Dict[str, Set[str]] = {}  # bundle -> bundles providing its externals
+        self.reverse: Dict[str, Set[str]] = {}
+        self.missing: Dict[str, Set[str]] = {}  # bundle -> externals no bundle provides
+        self.component_of: Dict[str, int] = None  # strongly connected components, built on demand
+        self.components: List[List[str]] = None  # dependencies before dependents
+
+    @classmethod
+    def load(cls, catalog: ObjectCatalog):  # from the catalog tables, no bundle is opened
+        graph = cls()
+        connection = catalog.connection
+        providers: Dict[str, Set[str]] = {}
+        for bundle, node in connection.execute('SELECT b.path, n.path FROM nodes n JOIN bundles b ON b.id = n.bundle_id'):
+            providers.setdefault(get_node_name(node), set()).add(bundle)
+        graph.bundles = [x for x, in connection.execute('SELECT path FROM bundles ORDER BY path')]
+        for bundle in graph.bundles:
+            graph.edges[bundle] = set()
+            graph.reverse[bundle] = set()
+        for bundle, external in connection.execute('SELECT DISTINCT b.path, e.path FROM externals e JOIN bundles b ON b.id = e.bundle_id'):
+            targets = providers.get(get_node_name(external))
+            if not targets:
+                graph.missing.setdefault(bundle, set()).add(external)
+                continue
+            for target in targets:
+                if target == bundle: continue  # nodes of one bundle referencing each other
+                graph.edges[bundle].add(target)
+                graph.reverse[target].add(bundle)
+        return graph
+
+    def find(self, name: str) -> str:  # absolute path, or a unique file name
+        if name in self.edges: return name
+        path = p.abspath(name)
+        if path in self.edges: return path
+        matches = [x for x in self.bundles if p.basename(x) == name]
+        if len(matches) != 1: raise KeyError('{} bundle: {}'.format('ambiguous' if matches else 'unknown', name))
+        return matches[0]
+
+    def build_components(self):  # iterative Tarjan, emits each component after every component it depends on
+        index: Dict[str, int] = {}
+        low: Dict[str, int] = {}
+        stack: List[str] = []
+        on_stack: Set[str] = set()
+        self.component_of, self.components = {}, []
+        for root in self.bundles:
+            if root in index: continue
+            work = [(root, iter(sorted(self.edges[root])))]
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                bundle, children = work[-1]
+                child = next(children, None)
+                if child is not None:
+                    if child not in index:
+                        index[child] = low[child] = len(index)
+                        stack.append(child)
+                        on_stack.add(child)
+                        work.append((child, iter(sorted(self.edges[child]))))
+                    elif child in on_stack: low[bundle] = min(low[bundle], index[child])
+                    continue
+                work.pop()
+                if work: low[work[-1][0]] = min(low[work[-1][0]], low[bundle])
+                if low[bundle] != index[bundle]: continue
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    self.component_of[member] = len(self.components)
+                    component.append(member)
+                    if member == bundle: break
+                self.components.append(sorted(component))
+
+    def get_closure(self, entries: Iterable[str]) -> Set[str]:  # entries and everything they load transitively
+        if self.components is None: self.build_components()
+        visited = {self.component_of[self.find(x)] for x in entries}
+        pending = list(visited)
+        while pending:  # depth first over the condensation, each component and edge visited once per query
+            for member in self.components[pending.pop()]:
+                for target in self.edges[member]:
+                    component = self.component_of[target]
+                    if component in visited: continue
+                    visited.add(component)
+                    pending.append(component)
+        return {x for component in visited for x in self.components[component]}
+
+    def get_load_order(self, entries: Iterable[str]) -> List[List[str]]:  # groups in load order, bundles of one group depend on each other
+        closure = self.get_closure(entries)
+        components = sorted({self.component_of[x] for x in closure})
+        return [self.components[x] for x in components]
+
+    def get_dependents(self, bundle: str, transitive: bool = False) -> Set[str]:
+        bundle = self.find(bundle)
+        if not transitive: return set(self.reverse[bundle])
+        result, pending = set(), [bundle]
+        while pending:
+            for dependent in self.reverse[pending.pop()]:
+                if dependent not in result and dependent != bundle:
+                    result.add(dependent)
+                    pending.append(dependent)
+        return result
+
+    def get_cycles(self) -> List[List[str]]:
+        if self.components is None: self.build_components()
+        return [x for x in self.components if len(x) > 1]
+
+    def __repr__(self):
+        return '{{bundles={:,}, edges={:,}, missing={:,}}}'.format(len(self.bundles), sum(len(x) for x in self.edges.values()), sum(len(x) for x in self.missing.values()))
+
+def main():
+    arguments = argparse.ArgumentParser()
+    arguments.add_argument('--database', '-db', default='catalog.sqlite')
+    arguments.add_argument('--directory', '-d')  # refreshes stale catalog entries before building the graph
+    arguments.add_argument('--jobs', '-j', type=int, default=0)
+    arguments.add_argument('--closure', nargs='+')
+    arguments.add_argument('--load-order', nargs='+')
+    arguments.add_argument('--dependents')
+    arguments.add_argument('--transitive', action='store_true')
+    arguments.add_argument('--cycles', action='store_true')
+    arguments.add_argument('--missing', action='store_true')
+    arguments.add_argument('--output', '-o')  # load order of every --load-order entry as json
+    options = arguments.parse_args(sys.argv[1:])
+    catalog = ObjectCatalog(options.database)
+    try:
+        start = time.perf_counter()
+        if options.directory:
+            files = [p.abspath(x) for x in find_bundles(options.directory)]
+            updated, failed = catalog.update(files, jobs=options.jobs, initializer=unity.init_worker)
+            print('[+] {:,} bundles, updated={:,} failed={:,} pruned={:,}'.format(len(files), updated, failed, catalog.prune(p.abspath(options.directory))))
+        graph = DependencyGraph.load(catalog)
+        print('[+] {} elapsed={:.2f}s'.format(graph, time.perf_counter() - start))
+        if options.closure:
+            for bundle in sorted(graph.get_closure(options.closure)): print(bundle)
+        if options.load_order:
+            if options.output:
+                with open(options.output, 'w') as fp:
+                    json.dump({x: [m for group in graph.get_load_order([x]) for m in group] for x in options.load_order}, fp, indent=1)
+            else:
+                for n, group in enumerate(graph.get_load_order(options.load_order)):
+                    print('{:4d} {}'.format(n, ' \033[33m<->\033[0m '.join(group)))
+        if options.dependents:
+            for bundle in sorted(graph.get_dependents(options.dependents, transitive=options.transitive)): print(bundle)
+        if options.cycles:
+            for cycle in graph.get_cycles(): print('\033[33m[C]\033[0m {}'.format(' '.join(cycle)))
+        if options.missing:
+            for bundle, externals in sorted(graph.missing.items()):
+                for external in sorted(externals): print('{} \033[31m{}\033[0m'.format(bundle, external))
+    finally:
+        catalog.close()
+
+if __name__ == '__main__':
+    main()
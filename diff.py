@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+import argparse, hashlib, json, sys, time
+from typing import List, Dict, Tuple
+
+import serialize
+import unity
+from stream import FileStream
+
+class ObjectState(object):
+    def __init__(self, serializer: serialize.SerializedFile, info: serialize.ObjectInfo, digest: bytes):
+        self.serializer: serialize.SerializedFile = serializer
+        self.info: serialize.ObjectInfo = info
+        self.digest: bytes = digest
+
+    @property
+    def type_tree(self) -> serialize.MetadataTypeTree:
+        return self.serializer.type_trees[self.info.type_id]
+
+    def to_json(self) -> dict:
+        return {'path_id': self.info.local_identifier_in_file, 'type': self.type_tree.name, 'size': self.info.byte_size}
+
+class BundleSnapshot(object):
+    def __init__(self, file_path: str):
+        self.file_path: str = file_path
+        self.stream: FileStream = None
+        self.nodes: Dict[str, Dict[int, ObjectState]] = {}  # serialized node -> path id -> state
+        self.resources: Dict[str, Tuple[int, bytes]] = {}  # other nodes -> (size, digest)
+        self.type_hashes: Dict[Tuple[int, bytes], Tuple[str, bytes]] = {}  # (persistent id, script hash) -> (name, type hash)
+
+    def decode(self, memory_limit: int = 0):
+        archive, self.stream, nodes = unity.open_archive(self.file_path, memory_limit=memory_limit)
+        for node in archive.direcory_info.nodes:
+            if node.is_serialized_file: continue
+            self.resources[node.path] = node.size, self.hash_range(node.offset, node.size)
+        for node in nodes:
+            serializer = unity.decode_serialized_file(node, self.stream)
+            for type_tree in serializer.type_trees:
+                self.type_hashes[type_tree.persistent_type_id, type_tree.mono_hash] = type_tree.name, type_tree.type_hash
+            base_offset = node.offset + serializer.header.data_offset
+            objects = self.nodes[node.path] = {}
+            for o in sorted(serializer.objects, key=lambda x: x.byte_start):  # one sequential pass over the data
+                objects[o.local_identifier_in_file] = ObjectState(serializer, o, self.hash_range(base_offset + o.byte_start, o.byte_size))
+        return self
+
+    def hash_range(self, offset: int, size: int) -> bytes:
+        hasher = hashlib.blake2b(digest_size=16)
+        self.stream.seek(offset)
+        position = 0
+        while position < size:
+            chunk = self.stream.read(min(1 << 20, size - position))
+            hasher.update(chunk)
+            position += len(chunk)
+        return hasher.digest()
+
+    def deserialize(self, state: ObjectState) -> dict:
+        serializer, o = state.serializer, state.info
+        meta_type = state.type_tree.type_dict.get(0)
+        if not meta_type: return None
+        self.stream.seek(serializer.node.offset + serializer.header.data_offset + o.byte_start)
+        target = serializer.deserialize(self.stream, meta_type=meta_type)
+        unity.standardize(target)
+        return target
+
+    def close(self):
+        if self.stream: self.stream.close()
+
+def match_nodes(old: BundleSnapshot, new: BundleSnapshot) -> List[Tuple[str, str]]:
+    pairs = [(x, x) for x in old.nodes.keys() if x in new.nodes]
+    if not pairs and len(old.nodes) == 1 and len(new.nodes) == 1:  # CAB names follow the bundle name, a renamed bundle keeps its only node
+        pairs = [(next(iter(old.nodes)), next(iter(new.nodes)))]
+    return pairs
+
+def get_changed_fields(old: dict, new: dict) -> List[str]:
+    if old is None or new is None: return []
+    return sorted(k for k in set(old.keys()) | set(new.keys()) if old.get(k) != new.get(k))
+
+def diff_bundles(old: BundleSnapshot, new: BundleSnapshot, fields: bool = False) -> dict:
+    changes = {'old': old.file_path, 'new': new.file_path, 'added': [], 'removed': [], 'modified': [], 'retyped': [], 'resources': [], 'types': []}
+    summary = {'unchanged': 0, 'bytes_added': 0, 'bytes_removed': 0, 'bytes_modified': 0}
+    pairs = match_nodes(old, new)
+    matched_old, matched_new = {x[0] for x in pairs}, {x[1] for x in pairs}
+    for node in old.nodes.keys() - matched_old:
+        for state in old.nodes[node].values():
+            changes['removed'].append(dict(state.to_json(), node=node))
+            summary['bytes_removed'] += state.info.byte_size
+    for node in new.nodes.keys() - matched_new:
+        for state in new.nodes[node].values():
+            changes['added'].append(dict(state.to_json(), node=node))
+            summary['bytes_added'] += state.info.byte_size
+    for old_node, new_node in pairs:
+        old_objects, new_objects = old.nodes[old_node], new.nodes[new_node]
+        for path_id, state in old_objects.items():
+            if path_id in new_objects: continue
+            changes['removed'].append(dict(state.to_json(), node=old_node))
+            summary['bytes_removed'] += state.info.byte_size
+        for path_id, state in new_objects.items():
+            previous = old_objects.get(path_id)
+            if not previous:
+                changes['added'].append(dict(state.to_json(), node=new_node))
+                summary['bytes_added'] += state.info.byte_size
+                continue
+            if previous.type_tree.persistent_type_id != state.type_tree.persistent_type_id or previous.type_tree.type_hash != state.type_tree.type_hash:
+                changes['retyped'].append({'node': new_node, 'path_id': path_id, 'old_type': previous.type_tree.name, 'new_type': state.type_tree.name,
+                                           'old_hash': previous.type_tree.type_hash.hex(), 'new_hash': state.type_tree.type_hash.hex()})
+            if previous.digest == state.digest:
+                summary['unchanged'] += 1
+                continue
+            item = {'node': new_node, 'path_id': path_id, 'type': state.type_tree.name, 'old_size': previous.info.byte_size, 'new_size': state.info.byte_size}
+            if fields:  # only objects whose bytes differ get decoded
+                try: item['fields'] = get_changed_fields(old.deserialize(previous), new.deserialize(state))
+                except Exception as error: item['error'] = '{}: {}'.format(type(error).__name__, error)
+            changes['modified'].append(item)
+            summary['bytes_modified'] += state.info.byte_size
+    renames = {a: b for a, b in pairs if a != b}
+    old_resources = {}
+    for path, value in old.resources.items():  # .resS nodes are named after their serialized node
+        for a, b in renames.items():
+            if path.startswith(a + '.'): path = b + path[len(a):]
+        old_resources[path] = value
+    for path in sorted(old_resources.keys() | new.resources.keys()):
+        before, after = old_resources.get(path), new.resources.get(path)
+        if before == after: continue
+        changes['resources'].append({'node': path, 'old_size': before[0] if before else None, 'new_size': after[0] if after else None})
+    for key in sorted(old.type_hashes.keys() | new.type_hashes.keys()):
+        before, after = old.type_hashes.get(key), new.type_hashes.get(key)
+        if before and after and before[1] == after[1]: continue
+        name = (after or before)[0]
+        changes['types'].append({'type': name, 'persistent_id': key[0], 'script_hash': key[1].hex() if key[1] else None,
+                                 'old_hash': before[1].hex() if before else None, 'new_hash': after[1].hex() if after else None})
+    changes['summary'] = summary
+    return changes
+
+def main():
+    arguments = argparse.ArgumentParser()
+    arguments.add_argument('old')
+    arguments.add_argument('new')
+    arguments.add_argument('--fields', action='store_true')
+    arguments.add_argument('--memory-limit', type=int, default=0)  # MiB, see unity.py
+    arguments.add_argument('--output', '-o')
+    options = arguments.parse_args(sys.argv[1:])
+    start = time.perf_counter()
+    old = BundleSnapshot(options.old).decode(memory_limit=options.memory_limit << 20)
+    new = BundleSnapshot(options.new).decode(memory_limit=options.memory_limit << 20)
+    try: changes = diff_bundles(old, new, fields=options.fields)
+    finally:
+        old.close()
+        new.close()
+    summary = changes['summary']
+    for item in changes['added']: print('\033[32m+ {node} {path_id} {type} {size:,}\033[0m'.format(**item))
+    for item in changes['removed']: print('\033[31m- {node} {path_id} {type} {size:,}\033[0m'.format(**item))
+    for item in changes['modified']:
+        print('\033[33m~ {node} {path_id} {type} {old_size:,} => {new_size:,}\033[0m {}'.format(','.join(item.get('fields', [])), **item))
+    for item in changes['retyped']: print('\033[35m! {node} {path_id} {old_type} => {new_type}\033[0m'.format(**item))
+    for item in changes['resources']: print('\033[36m# {node} {old_size} => {new_size}\033[0m'.format(**item))
+    for item in changes['types']: print('\033[35m# type {type} {old_hash} => {new_hash}\033[0m'.format(**item))
+    print('[=] added={:,} removed={:,} modified={:,} unchanged={:,} bytes +{:,} -{:,} ~{:,} elapsed={:.2f}s'.format(
+        len(changes['added']), len(changes['removed']), len(changes['modified']), summary['unchanged'],
+        summary['bytes_added'], summary['bytes_removed'], summary['bytes_modified'], time.perf_counter() - start))
+    if options.output:
+        with open(options.output, 'w') as fp:
+            json.dump(changes, fp, indent=1, ensure_ascii=False, default=repr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+import argparse, csv, hashlib, json, os, sys, time
+import os.path as p
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Tuple
+
+import serialize
+import unity
+from resources import ResourceReader, get_stream_field
+
+ARCHIVE_SIGNATURE = b'UnityFS\x00'
+
+# bundle, node, path id, type, name, byte size, digest, resource size
+ObjectRecord = Tuple[str, str, int, str, str, int, bytes, int]
+
+def find_bundles(directory: str) -> List[str]:
+    bundles = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            file_path = p.join(root, name)
+            try:
+                with open(file_path, 'rb') as fp:
+                    if fp.read(len(ARCHIVE_SIGNATURE)) == ARCHIVE_SIGNATURE: bundles.append(file_path)
+            except OSError: continue
+    bundles.sort()
+    return bundles
+
+def hash_resource(reader: ResourceReader, resource: dict, hasher) -> int:
+    try:
+        size = 0
+        for chunk in reader.iter_chunks(resource):
+            hasher.update(chunk)
+            size += len(chunk)
+        return size
+    except (KeyError, ValueError): return 0
+
+def scan_bundle(file_path: str, types: List[int] = None, min_size: int = 0) -> List[ObjectRecord]:
+    records = []
+    archive, stream, nodes = unity.open_archive(file_path)
+    reader = ResourceReader(archive, stream)
+    for node in nodes:
+        serializer = unity.decode_serialized_file(node, stream)
+        base_offset = serializer.node.offset + serializer.header.data_offset
+        for o in serializer.objects:
+            type_tree = serializer.type_trees[o.type_id]
+            if types and type_tree.persistent_type_id not in types: continue
+            meta_type = type_tree.type_dict.get(0)
+            name, resource, stream_field = '', None, get_stream_field(meta_type) if meta_type else ''
+            wanted = {'m_Name', stream_field} if stream_field else {'m_Name'}
+            if meta_type and any(x.name in wanted for x in meta_type.fields):
+                stream.seek(base_offset + o.byte_start)
+                try:
+                    fields = serializer.deserialize_fields(stream, meta_type, {x.name for x in meta_type.fields if x.name in wanted})
+                    name = unity.b2s(fields.get('m_Name', b''))
+                    resource = fields.get(stream_field)
+                except Exception: pass  # keep hashing raw bytes for objects whose type tree does not fit
+            hasher = hashlib.blake2b(digest_size=16)
+            resource_size = hash_resource(reader, resource, hasher) if isinstance(resource, dict) else 0
+            if resource_size == 0:  # objects with external data are keyed by that data since their header carries file offsets
+                stream.seek(base_offset + o.byte_start)
+                hasher.update(stream.read(o.byte_size))
+            if o.byte_size + resource_size < min_size: continue
+            records.append((file_path, node.path, o.local_identifier_in_file, type_tree.name, name, o.byte_size, hasher.digest(), resource_size))
+    stream.close()
+    return records
+
+def scan_bundle_safely(arguments: Tuple[str, List[int], int]) -> Tuple[str, List[ObjectRecord], str]:
+    file_path, types, min_size = arguments
+    try: return file_path, scan_bundle(file_path, types=types, min_size=min_size), ''
+    except Exception as error: return file_path, [], '{}: {}'.format(type(error).__name__, error)
+
+class DuplicateGroup(object):
+    def __init__(self, type_name: str, name: str, digest: bytes, size: int):
+        self.type_name: str = type_name
+        self.name: str = name
+        self.digest: bytes = digest
+        self.size: int = size
+        self.objects: List[Tuple[str, str, int]] = []  # bundle, node, path id
+
+    @property
+    def bundle_count(self) -> int:
+        return len({x[0] for x in self.objects})
+
+    @property
+    def wasted_bytes(self) -> int:
+        return self.size * (len(self.objects) - 1)
+
+    def to_json(self) -> dict:
+        return {'type': self.type_name, 'name': self.name, 'hash': self.digest.hex(), 'size': self.size, 'copies': len(self.objects),
+                'wasted': self.wasted_bytes, 'objects': [{'bundle': b, 'node': n, 'path_id': i} for b, n, i in self.objects]}
+
+def group_duplicates(records: List[ObjectRecord]) -> List[DuplicateGroup]:
+    groups = {}  # type: Dict[Tuple[str, str, bytes], DuplicateGroup]
+    for bundle, node, path_id, type_name, name, byte_size, digest, resource_size in records:
+        key = type_name, name, digest
+        group = groups.get(key)
+        if not group: group = groups[key] = DuplicateGroup(type_name, name, digest, byte_size + resource_size)
+        group.objects.append((bundle, node, path_id))
+    duplicates = [x for x in groups.values() if len(x.objects) > 1]
+    duplicates.sort(key=lambda x: -x.wasted_bytes)
+    return duplicates
+
+def summarize_pairs(groups: List[DuplicateGroup]) -> List[Tuple[str, str, int, int]]:
+    pairs = {}  # type: Dict[Tuple[str, str], List[int]]
+    for group in groups:
+        bundles = sorted(x[0] for x in group.objects)
+        canonical = bundles[0]  # waste is charged against the first copy so large groups stay linear
+        for bundle in bundles[1:]:
+            stats = pairs.setdefault((canonical, bundle), [0, 0])
+            stats[0] += group.size
+            stats[1] += 1
+    result = [(a, b, wasted, count) for (a, b), (wasted, count) in pairs.items()]
+    result.sort(key=lambda x: -x[2])
+    return result
+
+def main():
+    arguments = argparse.ArgumentParser()
+    arguments.add_argument('--directory', '-d', required=True)
+    arguments.add_argument('--types', '-t', nargs='+', type=int)
+    arguments.add_argument('--min-size', type=int, default=0)
+    arguments.add_argument('--jobs', '-j', type=int, default=0)
+    arguments.add_argument('--top', type=int, default=20)
+    arguments.add_argument('--output', '-o')
+    arguments.add_argument('--csv')
+    options = arguments.parse_args(sys.argv[1:])
+    start = time.perf_counter()
+    bundles = find_bundles(options.directory)
+    print('[+] {:,} bundles under {}'.format(len(bundles), options.directory))
+    records = []  # type: List[ObjectRecord]
+    jobs = options.jobs if options.jobs > 0 else os.cpu_count() or 1
+    tasks = [(x, options.types, options.min_size) for x in bundles]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for file_path, items, error in executor.map(scan_bundle_safely, tasks, chunksize=max(1, min(64, len(tasks) // (jobs * 4) or 1))):
+            if error: print('\033[31m[E] {} {}\033[0m'.format(file_path, error))
+            records.extend(items)
+    groups = group_duplicates(records)
+    pairs = summarize_pairs(groups)
+    wasted = sum(x.wasted_bytes for x in groups)
+    print('[=] objects={:,} duplicate_groups={:,} wasted={:,} bytes elapsed={:.1f}s'.format(len(records), len(groups), wasted, time.perf_counter() - start))
+    for group in groups[:options.top]:
+        print('\033[33m{:>14,} \033[36m{} \033[0m{} x{} in {} bundles'.format(group.wasted_bytes, group.type_name, group.name, len(group.objects), group.bundle_count))
+    for a, b, size, count in pairs[:options.top]:
+        print('\033[33m{:>14,} \033[0m{} <> {} ({} objects)'.format(size, a, b, count))
+    if options.output:
+        with open(options.output, 'w') as fp:
+            json.dump({'wasted': wasted, 'groups': [x.to_json() for x in groups],
+                       'pairs': [{'bundle': a, 'duplicate': b, 'wasted': s, 'objects': c} for a, b, s, c in pairs]}, fp, indent=1)
+    if options.csv:
+        with open(options.csv, 'w', newline='') as fp:
+            writer = csv.writer(fp)
+            writer.writerow(('bundle', 'duplicate', 'wasted', 'objects'))
+            writer.writerows(pairs)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+import io, json
+import lxml.etree as etree
+from budget import DecodeError
+from stream import FileStream
+from typing import List, Dict, Iterator, Tuple, Callable
+
+GAME_OBJECT_PERSISTENT_ID = 1
+TRANSFORM_PERSISTENT_ID = 4
+MONO_BEHAVIOUR_PERSISTENT_ID = 114
+
+GAME_OBJECT_FIELDS = {'m_Component', 'm_Name'}
+TRANSFORM_FIELDS = {'m_GameObject', 'm_Children', 'm_Father'}
+
+def to_str(value) -> str:
+    return value.decode('utf-8', errors='replace') if isinstance(value, bytes) else value
+
+def get_path_ids(value: dict, field: str = None) -> List[int]:
+    array = value.get('Array', value)
+    if array.get('size', 0) <= 0: return []
+    return [x[field]['m_PathID'] if field else x['m_PathID'] for x in array['data']]
+
+class HierarchyIndex(object):
+    def __init__(self):
+        self.names: Dict[int, str] = {}  # game object -> name
+        self.components: Dict[int, List[int]] = {}  # game object -> components
+        self.component_types: Dict[int, str] = {}  # component -> type or script class name
+        self.game_objects: Dict[int, int] = {}  # transform -> game object
+        self.transforms: Dict[int, int] = {}  # game object -> transform
+        self.parents: Dict[int, int] = {}  # transform -> parent transform
+        self.children: Dict[int, List[int]] = {}  # transform -> child transforms
+        self.roots: List[int] = []  # transforms without parent in file order
+
+    def decode(self, serializer, stream: FileStream, resolve_script: Callable[[int, int], str] = None):  # resolve_script maps m_FileID, m_PathID to a class name
+        base_offset = serializer.node.offset + serializer.header.data_offset
+        for o in serializer.objects:
+            type_tree = serializer.type_trees[o.type_id]
+            persistent_id = type_tree.persistent_type_id
+            self.component_types[o.local_identifier_in_file] = type_tree.name
+            if persistent_id not in (GAME_OBJECT_PERSISTENT_ID, TRANSFORM_PERSISTENT_ID, MONO_BEHAVIOUR_PERSISTENT_ID): continue
+            if not type_tree.type_dict: continue
+            meta_type = type_tree.type_dict.get(0)
+            stream.seek(base_offset + o.byte_start)
+            try:
+                if serializer.budget: serializer.budget.begin(o)
+                self.decode_object(serializer, stream, o, meta_type, resolve_script)
+            except DecodeError as error:
+                print('\033[31m[E][BUDGET] {}\033[0m'.format(json.dumps(error.to_json())))
+            finally:
+                if serializer.budget: serializer.budget.finish()
+        return self
+
+    def decode_object(self, serializer, stream: FileStream, o, meta_type, resolve_script: Callable[[int, int], str] = None):
+        persistent_id = meta_type.type_tree.persistent_type_id
+        if persistent_id == GAME_OBJECT_PERSISTENT_ID:
+            target = serializer.deserialize_fields(stream, meta_type, GAME_OBJECT_FIELDS)
+            self.names[o.local_identifier_in_file] = to_str(target.get('m_Name', b''))
+            self.components[o.local_identifier_in_file] = get_path_ids(target.get('m_Component', {}), field='component')
+        elif persistent_id == TRANSFORM_PERSISTENT_ID:
+            target = serializer.deserialize_fields(stream, meta_type, TRANSFORM_FIELDS)
+            game_object = target['m_GameObject']['m_PathID']
+            father = target['m_Father']['m_PathID']
+            self.game_objects[o.local_identifier_in_file] = game_object
+            self.transforms[game_object] = o.local_identifier_in_file
+            self.children[o.local_identifier_in_file] = get_path_ids(target.get('m_Children', {}))
+            if father != 0: self.parents[o.local_identifier_in_file] = father
+            else: self.roots.append(o.local_identifier_in_file)
+        elif resolve_script:
+            script = serializer.deserialize_fields(stream, meta_type, {'m_Script'}).get('m_Script')
+            class_name = resolve_script(script['m_FileID'], script['m_PathID']) if script else None
+            if class_name: self.component_types[o.local_identifier_in_file] = class_name
+
+    def __repr__(self):
+        return '{{game_objects={:,}, transforms={:,}, roots={:,}}}'.format(len(self.names), len(self.game_objects), len(self.roots))
+
+    def get_name(self, transform: int) -> str:
+        return self.names.get(self.game_objects.get(transform), '')
+
+    def get_parent(self, transform: int) -> int:
+        return self.parents.get(transform, 0)
+
+    def get_children(self, transform: int) -> List[int]:
+        return self.children.get(transform, [])
+
+    def get_ancestors(self, transform: int) -> List[int]:
+        ancestors = []
+        parent = self.parents.get(transform)
+        while parent and parent not in ancestors:
+            ancestors.append(parent)
+            parent = self.parents.get(parent)
+        return ancestors
+
+    def get_root(self, transform: int) -> int:
+        ancestors = self.get_ancestors(transform)
+        return ancestors[-1] if ancestors else transform
+
+    def get_path(self, transform: int) -> str:
+        names = [self.get_name(x) for x in reversed(self.get_ancestors(transform))]
+        names.append(self.get_name(transform))
+        return '/'.join(names)
+
+    def walk(self, transform: int) -> Iterator[Tuple[int, int]]:  # depth first (depth, transform) without recursion
+        stack = [(0, transform)]
+        visited = set()
+        while stack:
+            depth, transform = stack.pop()
+            if transform in visited: continue
+            visited.add(transform)
+            yield depth, transform
+            children = self.children.get(transform, [])
+            for n in range(len(children) - 1, -1, -1):
+                stack.append((depth + 1, children[n]))
+
+    def get_descendants(self, transform: int) -> List[int]:
+        return [x for _, x in self.walk(transform)][1:]
+
+    def find(self, path: str) -> List[int]:
+        components = path.strip('/').split('/')
+        matches = [x for x in self.roots if self.get_name(x) == components[0]]
+        for name in components[1:]:
+            matches = [c for x in matches for c in self.children.get(x, []) if self.get_name(c) == name]
+        return matches
+
+    def find_by_component(self, component_type: str) -> List[int]:
+        return [self.transforms[go] for go, components in self.components.items()
+                if go in self.transforms and any(self.component_types.get(x) == component_type for x in components)]
+
+    def write_prefab(self, fp, transform: int, pretty_print: bool = True):
+        with etree.xmlfile(fp, encoding='utf-8') as xf:
+            xf.write_declaration()
+            opened = []  # (depth, element context) of game objects whose children are still being written
+            for depth, current in self.walk(transform):
+                while opened and opened[-1][0] >= depth:
+                    closing_depth, context = opened.pop()
+                    if pretty_print: xf.write('\n' + '  ' * closing_depth)
+                    context.__exit__(None, None, None)
+                if pretty_print and depth > 0: xf.write('\n' + '  ' * depth)
+                game_object = self.game_objects.get(current, 0)
+                context = xf.element('GameObject', name=self.names.get(game_object, ''), id=repr(game_object))
+                context.__enter__()
+                opened.append((depth, context))
+                if pretty_print: xf.write('\n' + '  ' * (depth + 1))
+                with xf.element('Components'):
+                    for component in self.components.get(game_object, []):
+                        if pretty_print: xf.write('\n' + '  ' * (depth + 2))
+                        xf.write(etree.Element(self.component_types.get(component, 'Missing'), id=repr(component)))
+                    if pretty_print: xf.write('\n' + '  ' * (depth + 1))
+            while opened:
+                closing_depth, context = opened.pop()
+                if pretty_print: xf.write('\n' + '  ' * closing_depth)
+                context.__exit__(None, None, None)
+        if pretty_print: fp.write(b'\n')
+
+    def dump_prefab(self, transform: int, pretty_print: bool = True) -> bytes:
+        buffer = io.BytesIO()
+        self.write_prefab(buffer, transform, pretty_print=pretty_print)
+        return buffer.getvalue()
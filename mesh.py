@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+import io
+import numpy as np
+from stream import FileStream
+from packed import unpack_ints, unpack_floats
+from typing import List, Dict, Tuple
+
+CHANNELS = ('vertex', 'normal', 'tangent', 'color', 'uv0', 'uv1', 'uv2', 'uv3', 'uv4', 'uv5', 'uv6', 'uv7', 'weight', 'bone_index')
+LEGACY_CHANNELS = ('vertex', 'normal', 'color', 'uv0', 'uv1', 'uv2', 'uv3', 'tangent')
+
+CHANNEL_FORMATS = {0: 'f4', 1: 'f2', 2: 'u1', 3: 'u1', 4: 'u4'}  # 5.x VertexChannelFormat
+VERTEX_FORMATS_2017 = {0: 'f4', 1: 'f2', 2: 'u1', 3: 'u1', 4: 'i1', 5: 'u2', 6: 'i2', 7: 'u1', 8: 'i1', 9: 'u2', 10: 'i2', 11: 'u4', 12: 'i4'}  # 2017 and 2018
+VERTEX_FORMATS = {0: 'f4', 1: 'f2', 2: 'u1', 3: 'i1', 4: 'u2', 5: 'i2', 6: 'u1', 7: 'i1', 8: 'u2', 9: 'i2', 10: 'u4', 11: 'i4'}
+
+class MeshData(object):
+    def __init__(self):
+        self.name: str = ''
+        self.vertex_count: int = 0
+        self.channels: Dict[str, np.ndarray] = {}
+        self.indices: np.ndarray = np.zeros(0, dtype=np.uint16)
+        self.submeshes: List[dict] = []
+        self.compressed: bool = False
+        self.stream_data: dict = None  # vertex data kept in an external resource
+
+    @property
+    def positions(self) -> np.ndarray: return self.channels.get('vertex')
+
+    @property
+    def normals(self) -> np.ndarray: return self.channels.get('normal')
+
+    @property
+    def uvs(self) -> List[np.ndarray]:
+        return [self.channels[x] for x in CHANNELS[4:12] if x in self.channels]
+
+    @property
+    def weights(self) -> np.ndarray: return self.channels.get('weight')
+
+    @property
+    def bone_indices(self) -> np.ndarray: return self.channels.get('bone_index')
+
+    @property
+    def triangle_count(self) -> int:
+        return sum(x['indexCount'] // 3 for x in self.submeshes if x.get('topology', 0) == 0)
+
+    def get_triangles(self, submesh: dict) -> np.ndarray:
+        item_size = self.indices.dtype.itemsize
+        start = submesh['firstByte'] // item_size if not self.compressed else submesh['firstByte'] // 2
+        count = submesh['indexCount'] // 3 * 3
+        triangles = self.indices[start:start + count].astype(np.uint32).reshape(-1, 3)
+        return triangles + submesh.get('baseVertex', 0)
+
+    def __repr__(self):
+        return '{{name={}, vertices={:,}, triangles={:,}, submeshes={}, channels={}}}'.format(self.name, self.vertex_count, self.triangle_count, len(self.submeshes), list(self.channels.keys()))
+
+def get_major_version(version: str) -> int:
+    try: return int(version.split('.')[0])
+    except ValueError: return 0
+
+def get_channel_views(buffer: bytes, offset: int, vertex_count: int, channels: List[dict], version: str, endian: str) -> Dict[str, np.ndarray]:
+    names = CHANNELS if len(channels) > len(LEGACY_CHANNELS) else LEGACY_CHANNELS
+    major = get_major_version(version)
+    formats = VERTEX_FORMATS if major >= 2019 else VERTEX_FORMATS_2017 if major >= 2017 else CHANNEL_FORMATS
+    stream_count = max([x['stream'] for x in channels] + [-1]) + 1
+    views = {}
+    for s in range(stream_count):
+        layout = []
+        stride = 0
+        for n in range(len(channels)):
+            channel = channels[n]
+            dimension = channel['dimension'] & 0xF
+            if channel['stream'] != s or dimension == 0: continue
+            item = np.dtype(formats[channel['format']]).newbyteorder(endian)
+            layout.append((names[n], channel['offset'], item, dimension))
+            stride += item.itemsize * dimension
+        for name, channel_offset, item, dimension in layout:
+            views[name] = np.ndarray(shape=(vertex_count, dimension), dtype=item, buffer=buffer, offset=offset + channel_offset, strides=(stride, item.itemsize))
+        offset += stride * vertex_count
+        offset = (offset + 15) & ~15
+    return views
+
+def decode_compressed_mesh(mesh: MeshData, compressed: dict):
+    vertices = compressed['m_Vertices']
+    mesh.vertex_count = vertex_count = vertices['m_NumItems'] // 3
+    mesh.channels['vertex'] = unpack_floats(vertices).reshape(-1, 3)
+    uv = compressed['m_UV']
+    uv_info = compressed.get('m_UVInfo', 0)
+    if uv['m_NumItems'] > 0:
+        if uv_info:
+            offset = 0
+            for n in range(8):
+                bits = uv_info >> (n * 4)
+                if bits & 0x4 == 0: continue
+                dimension = 1 + (bits & 0x3)
+                mesh.channels['uv{}'.format(n)] = unpack_floats(uv, offset=offset, count=vertex_count * dimension).reshape(-1, dimension)
+                offset += vertex_count * dimension
+        else:
+            for n in range(min(2, uv['m_NumItems'] // (vertex_count * 2))):
+                mesh.channels['uv{}'.format(n)] = unpack_floats(uv, offset=n * vertex_count * 2, count=vertex_count * 2).reshape(-1, 2)
+    normals = compressed['m_Normals']
+    if normals['m_NumItems'] > 0:
+        xy = unpack_floats(normals).reshape(-1, 2)
+        signs = unpack_ints(compressed['m_NormalSigns'])
+        z = np.sqrt(np.maximum(0, 1 - (xy * xy).sum(axis=1)))
+        z[signs[:len(z)] == 0] *= -1
+        mesh.channels['normal'] = np.column_stack((xy, z)).astype(np.float32)
+    mesh.indices = unpack_ints(compressed['m_Triangles'])
+
+def extract_mesh(serializer, stream: FileStream, o) -> MeshData:
+    type_tree = serializer.type_trees[o.type_id]
+    meta_type = type_tree.type_dict.get(0)
+    stream.seek(serializer.node.offset + serializer.header.data_offset + o.byte_start)
+    buffer = stream.read(o.byte_size)
+    fs = FileStream(data=buffer)
+    fs.endian = stream.endian
+    endian = '<' if stream.endian == '<' else '>'
+    mesh = MeshData()
+    vertex_data = index_buffer = skin = None  # type: Tuple[int, int]
+    fields = {}
+    for node in meta_type.fields:
+        if node.name in ('m_IndexBuffer', 'm_Skin'):
+            element_type, count = serializer.read_array_header(fs, meta_type, node)
+            if node.name == 'm_IndexBuffer': index_buffer = fs.position, count
+            else: skin = fs.position, count
+            serializer.skip_array(fs, type_tree, element_type, count)
+        elif node.name == 'm_VertexData':
+            vertex_meta = type_tree.type_dict.get(node.index)
+            for field in vertex_meta.fields:
+                if field.is_array and field.name == 'm_DataSize':
+                    element_type, count = serializer.read_array_header(fs, vertex_meta, field)
+                    vertex_data = fs.position, count
+                    serializer.skip_array(fs, type_tree, element_type, count)
+                else:
+                    fields[field.name] = serializer.deserialize_field(fs, vertex_meta, field)
+        elif node.name in ('m_Name', 'm_SubMeshes', 'm_MeshCompression', 'm_IndexFormat', 'm_CompressedMesh', 'm_StreamData'):
+            fields[node.name] = serializer.deserialize_field(fs, meta_type, node)
+        else:
+            serializer.skip_field(fs, meta_type, node)
+    name = fields.get('m_Name', b'')
+    mesh.name = name.decode('utf-8') if isinstance(name, bytes) else name
+    mesh.submeshes = fields['m_SubMeshes']['Array'].get('data', [])
+    if fields.get('m_MeshCompression', 0) != 0:
+        mesh.compressed = True
+        decode_compressed_mesh(mesh, fields['m_CompressedMesh'])
+        return mesh
+    mesh.vertex_count = fields.get('m_VertexCount', 0)
+    channels = fields.get('m_Channels', {}).get('Array', {}).get('data', [])
+    offset, size = vertex_data if vertex_data else (0, 0)
+    if size > 0:
+        mesh.channels = get_channel_views(buffer, offset, mesh.vertex_count, channels, version=serializer.version, endian=endian)
+    elif mesh.vertex_count > 0 and fields.get('m_StreamData', {}).get('size', 0) > 0:
+        mesh.stream_data = fields.get('m_StreamData')
+    if skin and skin[1] > 0 and 'weight' not in mesh.channels:
+        influence = np.dtype([('weight', endian + 'f4', (4,)), ('boneIndex', endian + 'i4', (4,))])
+        influences = np.ndarray(shape=(skin[1],), dtype=influence, buffer=buffer, offset=skin[0])
+        mesh.channels['weight'] = influences['weight']
+        mesh.channels['bone_index'] = influences['boneIndex']
+    index_type = np.dtype('u4' if fields.get('m_IndexFormat', 0) == 1 else 'u2').newbyteorder(endian)
+    if index_buffer:
+        offset, size = index_buffer
+        mesh.indices = np.frombuffer(buffer, dtype=index_type, count=size // index_type.itemsize, offset=offset)
+    return mesh
+
+def encode_npz(mesh: MeshData) -> bytes:
+    arrays = {'indices': mesh.indices}
+    for name, view in mesh.channels.items(): arrays[name] = view
+    if mesh.submeshes:
+        arrays['submeshes'] = np.array([(x['firstByte'], x['indexCount'], x.get('topology', 0), x.get('baseVertex', 0), x.get('firstVertex', 0), x.get('vertexCount', 0)) for x in mesh.submeshes], dtype=np.int64)
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+def encode_obj(mesh: MeshData) -> bytes:
+    buffer = io.StringIO()
+    buffer.write('o {}\n'.format(mesh.name))
+    positions = mesh.positions
+    if positions is not None:
+        np.savetxt(buffer, positions[:, :3].astype(np.float32) * (-1, 1, 1) + 0, fmt='v %.6g %.6g %.6g')  # unity is left-handed
+    uvs = mesh.uvs
+    if uvs:
+        np.savetxt(buffer, uvs[0][:, :2].astype(np.float32), fmt='vt %.6g %.6g')
+    normals = mesh.normals
+    if normals is not None:
+        np.savetxt(buffer, normals[:, :3].astype(np.float32) * (-1, 1, 1) + 0, fmt='vn %.6g %.6g %.6g')
+    face = 'f {0}/{0}/{0} {1}/{1}/{1} {2}/{2}/{2}' if uvs and normals is not None else 'f {0}//{0} {1}//{1} {2}//{2}' if normals is not None else 'f {0}/{0} {1}/{1} {2}/{2}' if uvs else 'f {0} {1} {2}'
+    face = face.replace('{0}', '%d', 3).replace('{1}', '%d', 3).replace('{2}', '%d', 3)
+    for n in range(len(mesh.submeshes)):
+        submesh = mesh.submeshes[n]
+        if submesh.get('topology', 0) != 0: continue
+        buffer.write('g submesh_{}\n'.format(n))
+        triangles = mesh.get_triangles(submesh)[:, ::-1] + 1  # flip winding with the x axis
+        np.savetxt(buffer, np.repeat(triangles, face.count('%d') // 3, axis=1), fmt=face)
+    return buffer.getvalue().encode('utf-8')
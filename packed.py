@@ -0,0 +1,20 @@
+import numpy as np
+
+def get_vector_data(vector: dict) -> bytes:
+    data = vector.get('m_Data', {})
+    if 'Array' in data: data = data['Array']
+    return data.get('data', b'')
+
+def unpack_ints(vector: dict, offset: int = 0, count: int = -1) -> np.ndarray:
+    bit_size = vector.get('m_BitSize', 0)
+    if count < 0: count = vector.get('m_NumItems', 0) - offset
+    if count <= 0 or bit_size == 0: return np.zeros(max(count, 0), dtype=np.uint32)
+    bits = np.unpackbits(np.frombuffer(get_vector_data(vector), dtype=np.uint8), bitorder='little')
+    bits = bits[offset * bit_size:(offset + count) * bit_size].reshape(count, bit_size)
+    return bits.astype(np.uint64).dot(np.left_shift(np.uint64(1), np.arange(bit_size, dtype=np.uint64))).astype(np.uint32)
+
+def unpack_floats(vector: dict, offset: int = 0, count: int = -1) -> np.ndarray:
+    bit_size = vector.get('m_BitSize', 0)
+    values = unpack_ints(vector, offset=offset, count=count).astype(np.float32)
+    scale = vector.get('m_Range', 0) / ((1 << bit_size) - 1) if bit_size else 0
+    return (values * np.float32(scale) + np.float32(vector.get('m_Start', 0))).astype(np.float32)
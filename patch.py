@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+import argparse, bisect, os, re, shutil, struct, sys
+from typing import List, Dict
+
+import lz4.block
+
+import serialize
+import unity
+from stats import decode_metadata
+from stream import FileStream
+
+HEADER_SIZES = struct.Struct('>QIII')  # trailing header fields: archive size, compressed and uncompressed blocks info size, flags
+BLOCK_SIZES = struct.Struct('>II')  # uncompressed and compressed size at the start of each StorageBlock entry
+FIELD_PATTERN = re.compile(r'^(.+?)(?:\[(\d+)\])?$')
+
+def parse_value(field_type: str, text: str):
+    if field_type == 'bool': return text.lower() in ('1', 'true', 'yes', 'on')
+    if field_type in ('float', 'double'): return float(text)
+    return int(text, 0)
+
+def compress_block(data: bytes, compression_type: unity.CompressionType) -> bytes:
+    if compression_type == unity.CompressionType.NONE: return data
+    if compression_type == unity.CompressionType.LZ4: return lz4.block.compress(data, store_size=False)
+    if compression_type == unity.CompressionType.LZ4HC: return lz4.block.compress(data, mode='high_compression', store_size=False)
+    raise NotImplementedError('compression {!r}'.format(compression_type))
+
+class FieldLocation(object):
+    def __init__(self, offset: int, node: serialize.TypeField, endian: str):
+        self.offset: int = offset  # in decompressed archive data
+        self.node: serialize.TypeField = node
+        self.endian: str = endian
+
+    def __repr__(self):
+        return '{{offset={:,}, type={}, size={}}}'.format(self.offset, self.node.type, self.node.byte_size)
+
+class BundlePatcher(object):
+    def __init__(self, file_path: str):
+        self.file_path: str = file_path
+        self.archive: unity.UnityArchiveFile = None
+        self.fs: FileStream = None
+        self.block_starts: List[int] = []  # decompressed offset of each block
+        self.block_positions: List[int] = []  # file position of each block
+        self.serializers: Dict[str, serialize.SerializedFile] = {}
+        self.changes: Dict[int, bytearray] = {}  # block index -> patched decompressed data
+        self.open()
+
+    def open(self):
+        self.archive = unity.UnityArchiveFile(debug=False)
+        self.fs = FileStream(file_path=self.file_path)
+        self.archive.decode_metadata(self.fs)
+        offset, position = 0, self.archive.blocks_offset
+        self.block_starts, self.block_positions, self.serializers, self.changes = [], [], {}, {}
+        for block in self.archive.blocks_info.blocks:
+            self.block_starts.append(offset)
+            self.block_positions.append(position)
+            offset += block.uncompressed_size
+            position += block.compressed_size
+
+    def get_serializer(self, node_path: str = None) -> serialize.SerializedFile:
+        for node in self.archive.direcory_info.nodes:
+            if not node.is_serialized_file or (node_path and node.path != node_path): continue
+            if node.path not in self.serializers: self.serializers[node.path] = decode_metadata(self.archive, self.fs, node)
+            return self.serializers[node.path]
+        raise KeyError('node not found: {}'.format(node_path))
+
+    def find_field(self, path_id: int, field_path: str, node_path: str = None) -> FieldLocation:
+        serializer = self.get_serializer(node_path)
+        for o in serializer.objects:
+            if o.local_identifier_in_file != path_id: continue
+            type_tree = serializer.type_trees[o.type_id]
+            if not type_tree.type_dict: raise ValueError('incomplete type tree: {}'.format(type_tree.name))
+            base_offset = serializer.node.offset + serializer.header.data_offset + o.byte_start
+            stream = FileStream(data=self.read(base_offset, o.byte_size))
+            stream.endian = '>' if serializer.header.endianess else '<'
+            node = self.locate(serializer, stream, type_tree.type_dict.get(0), field_path.split('.'))
+            return FieldLocation(base_offset + stream.position, node, stream.endian)
+        raise KeyError('object not found: {}'.format(path_id))
+
+    def locate(self, serializer: serialize.SerializedFile, fs: FileStream, meta_type: serialize.MetadataType, names: List[str]) -> serialize.TypeField:
+        name, index = FIELD_PATTERN.match(names[0]).groups()
+        for node in meta_type.fields:
+            if node.name != name:
+                serializer.skip_field(fs, meta_type, node)
+                continue
+            type_tree = meta_type.type_tree
+            if index is not None:  # seek to one array element without walking the rest
+                node, count = serializer.read_array_header(fs, meta_type, node)
+                if not 0 <= int(index) < count: raise IndexError('{} has {} elements'.format(names[0], count))
+                self.skip_elements(serializer, fs, type_tree, node, int(index))
+            if len(names) > 1:
+                nested = type_tree.type_dict.get(node.index)
+                if node.type in serialize.PRIMITIVE_TYPES or not nested: raise KeyError('{} is not a structure'.format(names[0]))
+                return self.locate(serializer, fs, nested, names[1:])
+            if node.type not in serialize.PRIMITIVE_TYPES: raise ValueError('{} is {}, only fixed-size primitives can be patched'.format(names[0], node.type))
+            return node
+        raise KeyError('field not found: {}'.format(names[0]))
+
+    @staticmethod
+    def skip_elements(serializer: serialize.SerializedFile, fs: FileStream, type_tree: serialize.MetadataTypeTree, element: serialize.TypeField, count: int):
+        if element.type in serialize.PRIMITIVE_TYPES: fs.seek(count * element.byte_size, os.SEEK_CUR)
+        elif element.type == 'string':
+            for _ in range(count):
+                size = fs.read_sint32()
+                if size > 0: fs.seek(size, os.SEEK_CUR)
+                fs.align()
+        else:
+            for _ in range(count): serializer.skip(fs, type_tree.type_dict.get(element.index))
+
+    def get_blocks(self, offset: int, size: int) -> range:
+        first = max(0, bisect.bisect_right(self.block_starts, offset) - 1)
+        last = first
+        while last + 1 < len(self.block_starts) and self.block_starts[last + 1] < offset + size: last += 1
+        return range(first, last + 1)
+
+    def load_block(self, n: int) -> bytearray:
+        if n in self.changes: return self.changes[n]
+        block = self.archive.blocks_info.blocks[n]
+        self.fs.seek(self.block_positions[n])
+        data = self.fs.read(block.compressed_size)
+        if block.compression_type != unity.CompressionType.NONE: data = lz4.block.decompress(data, block.uncompressed_size)
+        return bytearray(data)
+
+    def read(self, offset: int, size: int) -> bytes:
+        if not self.changes: return self.archive.read_range(self.fs, offset, size)
+        chunks = []
+        for n in self.get_blocks(offset, size):
+            data, start = self.load_block(n), self.block_starts[n]
+            chunks.append(bytes(data[max(0, offset - start):offset + size - start]))
+        return b''.join(chunks)
+
+    def get(self, location: FieldLocation):
+        stream = FileStream(data=self.read(location.offset, location.node.byte_size))
+        stream.endian = location.endian
+        return serialize.PRIMITIVE_TYPES[location.node.type].reader(stream)
+
+    def set(self, location: FieldLocation, value):
+        blocks = self.get_blocks(location.offset, location.node.byte_size)
+        buffer = FileStream(data=b''.join(self.load_block(n) for n in blocks))  # a field may straddle two blocks
+        buffer.endian = location.endian
+        buffer.seek(location.offset - self.block_starts[blocks[0]])
+        serialize.PRIMITIVE_TYPES[location.node.type].writer(buffer, value)
+        buffer.seek(0)
+        for n in blocks:
+            self.changes[n] = bytearray(buffer.read(self.archive.blocks_info.blocks[n].uncompressed_size))
+
+    def commit(self) -> bool:  # True when the blocks were rewritten in place
+        if not self.changes: return True
+        blocks = self.archive.blocks_info.blocks
+        compressed = {n: compress_block(bytes(data), blocks[n].compression_type) for n, data in self.changes.items()}
+        self.fs.close()
+        if all(len(compressed[n]) == blocks[n].compressed_size for n in compressed):
+            with open(self.file_path, 'r+b') as fp:
+                for n, data in compressed.items():
+                    fp.seek(self.block_positions[n])
+                    fp.write(data)
+            in_place = True
+        else:
+            self.rewrite(compressed)
+            in_place = False
+        self.open()
+        return in_place
+
+    def rewrite(self, compressed: Dict[int, bytes]):
+        header = self.archive.header
+        blocks = self.archive.blocks_info.blocks
+        with open(self.file_path, 'rb') as source:
+            source.seek(0)
+            header_data = bytearray(source.read(header.header_size))
+            source.seek(header.get_blocks_info_offset())
+            info = source.read(header.compressed_blocks_info_size)
+            if header.compression_type != unity.CompressionType.NONE: info = lz4.block.decompress(info, header.uncompressed_blocks_info_size)
+            info = bytearray(info)
+            for n, data in compressed.items():  # entries follow the 16 byte hash and the block count
+                BLOCK_SIZES.pack_into(info, 20 + n * 10, blocks[n].uncompressed_size, len(data))
+            info = compress_block(bytes(info), header.compression_type)
+            size = header.header_size + len(info) + sum(len(compressed[n]) if n in compressed else x.compressed_size for n, x in enumerate(blocks))
+            HEADER_SIZES.pack_into(header_data, header.header_size - HEADER_SIZES.size, size, len(info), header.uncompressed_blocks_info_size, header.flags)
+            temp_path = '{}.patch{}'.format(self.file_path, os.getpid())
+            with open(temp_path, 'wb') as fp:
+                fp.write(header_data)
+                if not header.has_blocks_at_the_end: fp.write(info)
+                for n, block in enumerate(blocks):
+                    if n in compressed: fp.write(compressed[n])
+                    else:
+                        source.seek(self.block_positions[n])
+                        copy_bytes(source, fp, block.compressed_size)
+                if header.has_blocks_at_the_end: fp.write(info)
+                fp.flush()
+                os.fsync(fp.fileno())
+        shutil.copymode(self.file_path, temp_path)
+        os.replace(temp_path, self.file_path)
+
+    def close(self):
+        self.fs.close()
+
+def copy_bytes(source, target, size: int):
+    while size > 0:
+        chunk = source.read(min(1 << 20, size))
+        if not chunk: raise EOFError('expect {} more bytes'.format(size))
+        target.write(chunk)
+        size -= len(chunk)
+
+def main():
+    arguments = argparse.ArgumentParser()
+    arguments.add_argument('--file', '-f', required=True)
+    arguments.add_argument('--node', '-n')
+    arguments.add_argument('--path-id', '-p', type=int, required=True)
+    arguments.add_argument('--field', '-k', nargs='+', required=True)  # m_Enabled or m_Color.r=0.5, array elements as m_Items[2].m_Value
+    arguments.add_argument('--dry-run', action='store_true')
+    options = arguments.parse_args(sys.argv[1:])
+    patcher = BundlePatcher(options.file)
+    try:
+        for item in options.field:
+            field_path, _, text = item.partition('=')
+            location = patcher.find_field(options.path_id, field_path, node_path=options.node)
+            before = patcher.get(location)
+            if text:
+                patcher.set(location, parse_value(location.node.type, text))
+                print('\033[33m{} {} \033[36m{} => {}\033[0m'.format(options.path_id, field_path, before, patcher.get(location)))
+            else: print('\033[33m{} {} \033[36m{}\033[0m {}'.format(options.path_id, field_path, before, location))
+        if patcher.changes and not options.dry_run:
+            blocks = len(patcher.changes)
+            in_place = patcher.commit()
+            print('[+] {} {} block(s) {}'.format(options.file, blocks, 'patched in place' if in_place else 'recompressed'))
+    finally:
+        patcher.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+import array, keyword, re, sys
+from typing import Dict, List, Tuple
+
+NATIVE_ENDIAN = '<' if sys.byteorder == 'little' else '>'
+
+class Record(object):
+    __slots__ = ()
+    __fields__: Tuple[str, ...] = ()  # type tree field names in order
+    __arrays__: frozenset = frozenset()  # field names decoded from Array nodes
+    __attributes__: Dict[str, str] = {}  # field name -> slot name
+
+    def __getitem__(self, name: str):
+        try: return getattr(self, self.__attributes__[name])
+        except (KeyError, AttributeError): raise KeyError(name)
+
+    def __contains__(self, name: str) -> bool:
+        attribute = self.__attributes__.get(name)
+        return attribute is not None and hasattr(self, attribute)
+
+    def get(self, name: str, default=None):
+        attribute = self.__attributes__.get(name)
+        return getattr(self, attribute, default) if attribute else default
+
+    def items(self):
+        for name in self.__fields__:
+            attribute = self.__attributes__[name]
+            if hasattr(self, attribute): yield name, getattr(self, attribute)
+
+    def to_dict(self) -> dict:  # the nested dict shape SerializedFile.deserialize produces
+        result = {}
+        for name, value in self.items():
+            if name in self.__arrays__:
+                result[name] = {'size': len(value)}
+                if len(value) > 0: result[name]['data'] = to_plain(value)
+            else: result[name] = to_plain(value)
+        return result
+
+    def __eq__(self, other):
+        return type(self) is type(other) and list(self.items()) == list(other.items())
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join('{}={!r}'.format(k, v) for k, v in self.items()))
+
+def to_plain(value):
+    if isinstance(value, Record): return value.to_dict()
+    if isinstance(value, array.array): return value.tolist()
+    if isinstance(value, list): return [to_plain(x) for x in value]
+    return value
+
+RESERVED_NAMES = set(dir(Record))
+record_classes: Dict[tuple, type] = {}
+
+def get_attribute_name(name: str, used: set) -> str:
+    attribute = re.sub(r'\W', '_', name)
+    if not attribute or attribute[0].isdigit() or keyword.iskeyword(attribute) or attribute in RESERVED_NAMES: attribute = '_' + attribute
+    while attribute in used: attribute += '_'
+    used.add(attribute)
+    return attribute
+
+def get_record_class(meta_type) -> type:  # one class per type layout, shared by every file with the same type hash
+    type_tree = meta_type.type_tree
+    key = type_tree.persistent_type_id, type_tree.mono_hash, type_tree.type_hash, meta_type.index
+    if not type_tree.type_hash: key += tuple((x.name, x.type, x.is_array) for x in meta_type.fields)
+    record_class = record_classes.get(key)
+    if record_class: return record_class
+    names, attributes, used, arrays = [], {}, set(), set()
+    for node in meta_type.fields:
+        names.append(node.name)
+        attributes[node.name] = get_attribute_name(node.name, used)
+        if node.is_array: arrays.add(node.name)
+    class_name = re.sub(r'\W', '_', meta_type.name) or 'Record'
+    record_class = type(class_name, (Record,), {'__slots__': tuple(attributes[x] for x in names), '__fields__': tuple(names),
+                                                '__arrays__': frozenset(arrays), '__attributes__': attributes})
+    record_classes[key] = record_class
+    return record_class
+
+def read_typed_array(fs, code: str, count: int) -> array.array:  # code of a primitive wider than a byte, see serialize.PRIMITIVE_TYPES
+    items = array.array(code)
+    items.frombytes(fs.read(count * items.itemsize))
+    if fs.endian != NATIVE_ENDIAN: items.byteswap()
+    return items
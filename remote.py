@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+import argparse, http.client, http.server, os, re, sys, threading
+import os.path as p
+import urllib.parse
+from collections import OrderedDict
+from typing import List, Tuple
+
+import serialize
+import unity
+from stats import SERIALIZED_HEADER
+from stream import FileStream
+
+PAGE_SIZE = 1 << 16
+CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+RANGE = re.compile(r'bytes=(\d*)-(\d*)$')
+
+class ConnectionPool(object):  # keep-alive connections to one origin, shared between threads
+    def __init__(self, url: str, size: int = 4, timeout: float = 30):
+        parts = urllib.parse.urlsplit(url)
+        self.scheme: str = parts.scheme
+        self.host: str = parts.netloc
+        self.path: str = urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+        self.size: int = size
+        self.timeout: float = timeout
+        self.idle: List[http.client.HTTPConnection] = []
+        self.lock = threading.Lock()
+
+    def acquire(self) -> http.client.HTTPConnection:
+        with self.lock:
+            if self.idle: return self.idle.pop()
+        connection_class = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        return connection_class(self.host, timeout=self.timeout)
+
+    def release(self, connection: http.client.HTTPConnection):
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append(connection)
+                return
+        connection.close()
+
+    def request(self, method: str, headers: dict) -> Tuple[int, dict, bytes]:
+        for attempt in range(2):  # an idle connection may have been closed by the server, retry once on a fresh one
+            connection = self.acquire()
+            try:
+                connection.request(method, self.path, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (http.client.RemoteDisconnected, http.client.BadStatusLine, ConnectionError) as error:
+                connection.close()
+                if attempt: raise error
+                continue
+            if response.will_close: connection.close()
+            else: self.release(connection)
+            return response.status, {k.lower(): v for k, v in response.getheaders()}, body
+
+    def close(self):
+        with self.lock:
+            for connection in self.idle: connection.close()
+            self.idle.clear()
+
+class RangeFile(object):  # read-only seekable file over HTTP range requests, backed by a page cache
+    def __init__(self, url: str, page_size: int = PAGE_SIZE, max_pages: int = 4096, gap: int = PAGE_SIZE, pool_size: int = 4, timeout: float = 30):
+        self.url: str = url
+        self.pool: ConnectionPool = ConnectionPool(url, size=pool_size, timeout=timeout)
+        self.page_size: int = page_size
+        self.max_pages: int = max_pages
+        self.gap: int = gap  # unwanted bytes worth fetching to merge two ranges into one request
+        self.pages: OrderedDict = OrderedDict()  # type: OrderedDict[int, bytes]
+        self.body: bytes = None  # whole file, when the server answers range requests with 200
+        self.position: int = 0
+        self.request_count: int = 0
+        self.bytes_received: int = 0
+        self.length: int = self.get_length()
+
+    def get_length(self) -> int:
+        status, headers, _ = self.pool.request('HEAD', {})
+        if status == 200 and 'content-length' in headers and headers.get('accept-ranges') == 'bytes': return int(headers['content-length'])
+        status, headers, body = self.pool.request('GET', {'Range': 'bytes=0-0'})
+        self.request_count += 1
+        self.bytes_received += len(body)
+        if status == 200:  # range ignored, the body already is the whole file
+            self.body = body
+            return len(body)
+        match = CONTENT_RANGE.match(headers.get('content-range', ''))
+        if status != 206 or not match or match.group(3) == '*': raise IOError('range requests not supported: {} {}'.format(status, self.url))
+        return int(match.group(3))
+
+    def fetch(self, start: int, end: int) -> bytes:  # bytes [start, end)
+        status, headers, body = self.pool.request('GET', {'Range': 'bytes={}-{}'.format(start, end - 1)})
+        self.request_count += 1
+        self.bytes_received += len(body)
+        if status == 200:  # server ignored the range, keep the body so later misses never download it again
+            if len(body) != self.length: raise IOError('unexpected length {} of {} bytes for {}'.format(len(body), self.length, self.url))
+            self.body = body
+            self.pages.clear()
+            return body[start:end]
+        match = CONTENT_RANGE.match(headers.get('content-range', ''))
+        if status != 206 or not match or int(match.group(1)) != start: raise IOError('unexpected response {} {} for {}-{}'.format(status, headers.get('content-range'), start, end))
+        if len(body) != end - start: raise IOError('short range {} of {} bytes at {}'.format(len(body), end - start, start))
+        return body
+
+    def load_pages(self, pages: List[int]):  # one request per run of consecutive missing pages
+        if self.body is not None: return
+        missing = sorted(set(x for x in pages if x not in self.pages))
+        runs = []
+        for page in missing:
+            if runs and page == runs[-1][1] + 1: runs[-1][1] = page
+            else: runs.append([page, page])
+        for first, last in runs:
+            start = first * self.page_size
+            data = self.fetch(start, min(self.length, (last + 1) * self.page_size))
+            if self.body is not None: return
+            for page in range(first, last + 1):
+                self.pages[page] = data[(page - first) * self.page_size:(page - first + 1) * self.page_size]
+        for page in pages:
+            if page in self.pages: self.pages.move_to_end(page)
+        while len(self.pages) > max(self.max_pages, len(pages)): self.pages.popitem(last=False)
+
+    def prefetch(self, ranges: List[Tuple[int, int]]):  # offset and size pairs, ranges closer than gap are merged
+        pages = []
+        last = -1
+        for offset, size in sorted(ranges):
+            if size <= 0: continue
+            first, end = offset // self.page_size, (min(self.length, offset + size) - 1) // self.page_size
+            if last >= 0 and first > last and (first - last - 1) * self.page_size <= self.gap: first = last + 1
+            pages.extend(range(max(first, last + 1), end + 1))
+            last = max(last, end)
+        self.load_pages(pages)
+
+    def read(self, n: int = -1) -> bytes:
+        end = self.length if n < 0 else min(self.length, self.position + n)
+        if end <= self.position: return b''
+        first, last = self.position // self.page_size, (end - 1) // self.page_size
+        self.load_pages(list(range(first, last + 1)))
+        if self.body is not None: data = self.body[self.position:end]
+        else:
+            data = b''.join(self.pages[x] for x in range(first, last + 1))
+            start = first * self.page_size
+            data = data[self.position - start:end - start]
+        self.position = end
+        return data
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR: offset += self.position
+        elif whence == os.SEEK_END: offset += self.length
+        self.position = max(0, offset)
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+    def close(self):
+        self.pages.clear()
+        self.body = None
+        self.pool.close()
+
+class RemoteBundle(object):
+    def __init__(self, url: str, **options):
+        self.url: str = url
+        self.file: RangeFile = RangeFile(url, **options)
+        self.stream: FileStream = FileStream()
+        self.stream.attach(self.file)
+        self.archive: unity.UnityArchiveFile = unity.UnityArchiveFile(debug=False)
+
+    def open(self):  # header, blocks info and directory only
+        self.archive.decode_metadata(self.stream)
+        return self
+
+    @property
+    def nodes(self) -> List[unity.FileNode]:
+        return self.archive.direcory_info.nodes
+
+    def find_node(self, path: str) -> unity.FileNode:
+        for node in self.nodes:
+            if node.path == path: return node
+        raise KeyError('node not found: {}'.format(path))
+
+    def read(self, offset: int, size: int) -> bytes:  # decompressed range, fetching its blocks in coalesced requests
+        self.file.prefetch(self.archive.get_block_ranges(offset, size))
+        return self.archive.read_range(self.stream, offset, size)
+
+    def read_node(self, node: unity.FileNode) -> bytes:
+        return self.read(node.offset, node.size)
+
+    def open_serialized_file(self, node: unity.FileNode) -> serialize.SerializedFile:  # metadata of one node, object data stays remote
+        _, _, _, data_offset = SERIALIZED_HEADER.unpack(self.read(node.offset, SERIALIZED_HEADER.size))
+        local = unity.FileNode()  # decoded from its own buffer like stats.decode_metadata
+        local.size, local.flags, local.path, local.index = node.size, node.flags, node.path, node.index
+        serializer = unity.decode_serialized_file(local, FileStream(data=self.read(node.offset, data_offset)))
+        serializer.node = node
+        return serializer
+
+    def read_object(self, serializer: serialize.SerializedFile, o: serialize.ObjectInfo) -> FileStream:
+        stream = FileStream(data=self.read(serializer.node.offset + serializer.header.data_offset + o.byte_start, o.byte_size))
+        stream.endian = '>' if serializer.header.endianess else '<'
+        return stream
+
+    def deserialize(self, serializer: serialize.SerializedFile, o: serialize.ObjectInfo) -> dict:
+        type_tree = serializer.type_trees[o.type_id]
+        return serializer.deserialize(self.read_object(serializer, o), meta_type=type_tree.type_dict.get(0))
+
+    def close(self):
+        self.file.close()
+
+class RangeRequestHandler(http.server.SimpleHTTPRequestHandler):  # local stand-in for a CDN, single byte ranges over keep-alive
+    protocol_version = 'HTTP/1.1'
+
+    def send_head(self):
+        range_header = self.headers.get('Range')
+        if not range_header: return super(RangeRequestHandler, self).send_head()
+        file_path = self.translate_path(self.path)
+        match = RANGE.match(range_header.strip())
+        if not p.isfile(file_path) or not match:
+            self.send_error(404 if match else 416)
+            return None
+        size = os.path.getsize(file_path)
+        start, end = match.group(1), match.group(2)
+        if start: start, end = int(start), min(size - 1, int(end)) if end else size - 1
+        else: start, end = max(0, size - int(end or 0)), size - 1
+        if start > end:
+            self.send_response(416)
+            self.send_header('Content-Range', 'bytes */{}'.format(size))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return None
+        fp = open(file_path, 'rb')
+        fp.seek(start)
+        self.send_response(206)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, end, size))
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        self.range_size = end - start + 1
+        return fp
+
+    def copyfile(self, source, outputfile):
+        size = getattr(self, 'range_size', -1)
+        if size < 0: return super(RangeRequestHandler, self).copyfile(source, outputfile)
+        self.range_size = -1
+        while size > 0:
+            chunk = source.read(min(size, 1 << 20))
+            if not chunk: break
+            outputfile.write(chunk)
+            size -= len(chunk)
+
+    def end_headers(self):
+        if not self.headers.get('Range'): self.send_header('Accept-Ranges', 'bytes')
+        super(RangeRequestHandler, self).end_headers()
+
+    def log_message(self, format, *args): pass
+
+def serve(directory: str, port: int = 0, bind: str = '127.0.0.1') -> http.server.ThreadingHTTPServer:
+    handler = lambda *args, **kwargs: RangeRequestHandler(*args, directory=directory, **kwargs)
+    return http.server.ThreadingHTTPServer((bind, port), handler)
+
+def main():
+    arguments = argparse.ArgumentParser()
+    arguments.add_argument('--url', '-u')
+    arguments.add_argument('--node', '-n')
+    arguments.add_argument('--path-id', '-p', type=int, nargs='+')
+    arguments.add_argument('--serve')
+    arguments.add_argument('--port', type=int, default=8000)
+    options = arguments.parse_args(sys.argv[1:])
+    if options.serve:
+        server = serve(options.serve, port=options.port)
+        print('[+] serving {} on http://{}:{}'.format(options.serve, *server.server_address))
+        try: server.serve_forever()
+        finally: server.server_close()
+        return
+    if not options.url: arguments.error('one of --url or --serve is required')
+    bundle = RemoteBundle(options.url).open()
+    try:
+        for node in bundle.nodes:
+            print('[+] {} {:,}'.format(node.path, node.size))
+            if not node.is_serialized_file or options.node and node.path != options.node: continue
+            serializer = bundle.open_serialized_file(node)
+            for o in serializer.objects:
+                if options.path_id and o.local_identifier_in_file not in options.path_id: continue
+                print('\033[33m{} \033[36m{}\033[0m'.format(o, bundle.deserialize(serializer, o) if options.path_id else ''))
+        print('[=] length={:,} requests={:,} received={:,}'.format(bundle.file.length, bundle.file.request_count, bundle.file.bytes_received))
+    finally:
+        bundle.close()
+
+if __name__ == '__main__':
+    main()
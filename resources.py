@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+import os
+from typing import BinaryIO, Iterator, Tuple
+
+import serialize
+import unity
+from stream import FileStream
+
+CHUNK_SIZE = 1 << 20
+STREAM_FIELDS = ('m_StreamData', 'm_Resource', 'm_ExternalResources')  # Texture2D/Mesh, AudioClip, VideoClip
+
+def get_stream_field(meta_type) -> str:
+    for node in meta_type.fields:
+        if node.name in STREAM_FIELDS: return node.name
+    return ''
+
+def get_stream_info(resource: dict) -> Tuple[str, int, int]:  # path, offset, size for StreamingInfo and StreamedResource
+    path = unity.b2s(resource.get('path', resource.get('m_Source', b'')))
+    return path, resource.get('offset', resource.get('m_Offset', 0)), resource.get('size', resource.get('m_Size', 0))
+
+class ResourceReader(object):
+    def __init__(self, archive: unity.UnityArchiveFile, stream: FileStream, file_path: str = None):
+        self.archive: unity.UnityArchiveFile = archive
+        self.stream: FileStream = stream
+        self.file_path: str = file_path
+        self.raw_offset: int = -1  # bundle file position of decompressed offset zero when no block is compressed
+        blocks = archive.blocks_info.blocks if archive else []
+        if file_path and blocks and all(x.compression_type == unity.CompressionType.NONE for x in blocks):
+            self.raw_offset = archive.blocks_offset
+
+    def find_node(self, path: str) -> unity.FileNode:
+        name = path[path.rfind('/') + 1:]
+        for node in self.archive.direcory_info.nodes if self.archive else []:
+            if node.path == name or node.path.endswith('/' + name): return node
+        return None
+
+    def resolve(self, resource: dict) -> Tuple[int, int]:  # decompressed offset and size, size is zero when unresolved
+        path, offset, size = get_stream_info(resource)
+        if not path or size <= 0: return 0, 0
+        node = self.find_node(path)
+        if not node: raise KeyError('resource node not found: {}'.format(path))
+        if offset + size > node.size: raise ValueError('resource range {}+{} exceeds {} {}'.format(offset, size, node.path, node.size))
+        return node.offset + offset, size
+
+    def iter_chunks(self, resource: dict, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        offset, size = self.resolve(resource)
+        self.stream.seek(offset)
+        position = 0
+        while position < size:
+            chunk = self.stream.read(min(chunk_size, size - position))
+            position += len(chunk)
+            yield chunk
+
+    def read(self, resource: dict) -> bytes:
+        offset, size = self.resolve(resource)
+        if size <= 0: return b''
+        self.stream.seek(offset)
+        return self.stream.read(size)
+
+    def copy_to(self, resource: dict, fp: BinaryIO) -> int:
+        offset, size = self.resolve(resource)
+        if size <= 0: return 0
+        if self.raw_offset >= 0:  # uncompressed bundles copy straight from the file, in kernel when possible
+            fp.flush()
+            with open(self.file_path, 'rb') as source:
+                copy_file_range(source.fileno(), fp.fileno(), self.raw_offset + offset, size)
+            fp.seek(0, os.SEEK_END)
+            return size
+        for chunk in self.iter_chunks(resource):
+            fp.write(chunk)
+        return size
+
+def copy_file_range(source: int, target: int, offset: int, size: int):
+    position = 0
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while position < size:
+                count = os.copy_file_range(source, target, size - position, offset + position)
+                if count <= 0: break
+                position += count
+        except OSError: pass  # cross-device or unsupported file system, fall through to sendfile
+    if position < size and hasattr(os, 'sendfile'):
+        try:
+            while position < size:
+                count = os.sendfile(target, source, offset + position, size - position)
+                if count <= 0: break
+                position += count
+        except OSError: pass
+    while position < size:
+        chunk = os.pread(source, min(CHUNK_SIZE, size - position), offset + position)
+        if not chunk: raise EOFError('expect {} more bytes'.format(size - position))
+        position += os.write(target, chunk)
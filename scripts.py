@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+import argparse, contextlib, mmap, os, struct, sys
+import os.path as p
+from typing import Dict, Tuple, List, Iterator
+
+try: import fcntl
+except ImportError: fcntl = None  # single process only
+
+INDEX_MAGIC = b'MSIX'
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct('<4sIQQ')  # magic, version, indexed data length, entry count
+INDEX_ENTRY = struct.Struct('<qQ')  # path id, record offset
+RECORD_HEADER = struct.Struct('<q')
+FIELD_SIZE = struct.Struct('<i')
+REINDEX_TAIL = 4096  # tail records tolerated before flush folds them into the sorted index
+
+ScriptRecord = Tuple[bytes, bytes, bytes]  # class name, namespace, assembly
+
+def decode_record(buffer, offset: int) -> Tuple[int, ScriptRecord, int]:
+    identifier, = RECORD_HEADER.unpack_from(buffer, offset)
+    offset += RECORD_HEADER.size
+    values = []
+    for _ in range(3):
+        size, = FIELD_SIZE.unpack_from(buffer, offset)
+        offset += FIELD_SIZE.size
+        if size < 0 or offset + size > len(buffer): raise ValueError('broken record')
+        values.append(bytes(buffer[offset:offset + size]))
+        offset += size
+    return identifier, tuple(values), offset
+
+def encode_record(identifier: int, record: ScriptRecord) -> bytes:
+    chunks = [RECORD_HEADER.pack(identifier)]
+    for value in record:
+        chunks.append(FIELD_SIZE.pack(len(value)))
+        chunks.append(value)
+    return b''.join(chunks)
+
+def write_atomic(file_path: str, chunks: Iterator[bytes]):
+    temp_path = '{}.tmp{}'.format(file_path, os.getpid())
+    with open(temp_path, 'wb') as fp:
+        for chunk in chunks: fp.write(chunk)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(temp_path, file_path)
+
+# MonoScript names keyed by path id, records stay in the mono_scrips.bin layout and a sorted index is read through mmap
+class ScriptStore(object):
+    def __init__(self, file_path: str, index_path: str = None):
+        self.file_path: str = file_path
+        self.index_path: str = index_path if index_path else '{}.idx'.format(p.splitext(file_path)[0])
+        self.lock_path: str = '{}.lock'.format(p.splitext(file_path)[0])
+        self.data_length: int = 0
+        self.entry_count: int = 0
+        self.tail: Dict[int, int] = {}  # records appended after the index was written
+        self.pending: Dict[int, ScriptRecord] = {}
+        self.__data: mmap.mmap = None
+        self.__index: mmap.mmap = None
+        self.open()
+
+    @contextlib.contextmanager
+    def lock(self):  # serializes appends and index writes between handles and processes sharing the store, not reentrant
+        with open(self.lock_path, 'a') as fp:
+            if fcntl: fcntl.flock(fp.fileno(), fcntl.LOCK_EX)
+            yield
+
+    def open(self):
+        with self.lock(): self.reload()
+
+    def reload(self):  # re-reads data, index and tail from disk, callers hold the lock
+        self.close()
+        if not p.exists(self.file_path): open(self.file_path, 'ab').close()
+        length = p.getsize(self.file_path)
+        if length > 0:
+            with open(self.file_path, 'rb') as fp:
+                self.__data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        if not self.load_index(length): self.rebuild_index()
+
+    def load_index(self, length: int) -> bool:
+        if not p.exists(self.index_path): return length == 0
+        with open(self.index_path, 'rb') as fp:
+            header = fp.read(INDEX_HEADER.size)
+            if len(header) < INDEX_HEADER.size: return False
+            magic, version, data_length, entry_count = INDEX_HEADER.unpack(header)
+            if magic != INDEX_MAGIC or version != INDEX_VERSION or data_length > length: return False
+            if p.getsize(self.index_path) != INDEX_HEADER.size + entry_count * INDEX_ENTRY.size: return False
+            if entry_count > 0: self.__index = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data_length, self.entry_count = data_length, entry_count
+        self.scan_tail(length)
+        return True
+
+    def scan_tail(self, length: int):  # records appended after the last index write, dropping a torn final record
+        offset = self.data_length
+        self.tail = {}
+        while offset < length:
+            try: identifier, _, end = decode_record(self.__data, offset)
+            except (ValueError, struct.error):
+                print('\033[31m[E] truncate broken script record at {:,}\033[0m'.format(offset))
+                self.close()
+                with open(self.file_path, 'r+b') as fp: fp.truncate(offset)
+                self.reload()
+                return
+            self.tail[identifier] = offset  # later records win like the legacy loader
+            offset = end
+
+    def rebuild_index(self):
+        offsets = {}
+        if self.__data:
+            offset = 0
+            while offset < len(self.__data):
+                try: identifier, _, end = decode_record(self.__data, offset)
+                except (ValueError, struct.error): break
+                offsets[identifier] = offset
+                offset = end
+            if offset < len(self.__data):
+                self.close()
+                with open(self.file_path, 'r+b') as fp: fp.truncate(offset)
+                self.open_data()
+        self.write_index(offsets, length=offset if self.__data else 0)
+
+    def open_data(self):
+        if p.getsize(self.file_path) > 0:
+            with open(self.file_path, 'rb') as fp:
+                self.__data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def write_index(self, offsets: Dict[int, int], length: int):
+        entries = sorted(offsets.items())
+        def generate():
+            yield INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, length, len(entries))
+            for n in range(0, len(entries), 4096):
+                yield b''.join(INDEX_ENTRY.pack(*x) for x in entries[n:n + 4096])
+        if self.__index:
+            self.__index.close()
+            self.__index = None
+        write_atomic(self.index_path, generate())
+        self.data_length, self.entry_count, self.tail = length, len(entries), {}
+        if entries:
+            with open(self.index_path, 'rb') as fp:
+                self.__index = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def get_entry(self, n: int) -> Tuple[int, int]:
+        return INDEX_ENTRY.unpack_from(self.__index, INDEX_HEADER.size + n * INDEX_ENTRY.size)
+
+    def find(self, identifier: int) -> int:
+        if identifier in self.tail: return self.tail[identifier]
+        return self.index_find(identifier)
+
+    def index_find(self, identifier: int) -> int:
+        lower, upper = 0, self.entry_count
+        while lower < upper:
+            middle = (lower + upper) // 2
+            key, offset = self.get_entry(middle)
+            if key == identifier: return offset
+            if key < identifier: lower = middle + 1
+            else: upper = middle
+        return -1
+
+    def get(self, identifier: int, default: ScriptRecord = None) -> ScriptRecord:
+        if identifier in self.pending: return self.pending[identifier]
+        offset = self.find(identifier)
+        if offset < 0: return default
+        return decode_record(self.__data, offset)[1]
+
+    def __getitem__(self, identifier: int) -> ScriptRecord:
+        record = self.get(identifier)
+        if record is None: raise KeyError(identifier)
+        return record
+
+    def __contains__(self, identifier: int) -> bool:
+        return identifier in self.pending or self.find(identifier) >= 0
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def keys(self) -> List[int]:
+        keys = [self.get_entry(n)[0] for n in range(self.entry_count)]
+        keys.extend(x for x in self.tail.keys() if self.index_find(x) < 0)
+        keys.extend(self.pending.keys())
+        return keys
+
+    def items(self) -> Iterator[Tuple[int, ScriptRecord]]:
+        for identifier in self.keys(): yield identifier, self.get(identifier)
+
+    def add(self, identifier: int, class_name: bytes, namespace: bytes, assembly: bytes) -> bool:
+        if identifier in self: return False
+        self.pending[identifier] = class_name, namespace, assembly
+        return True
+
+    def flush(self):  # appends pending records at the real end of file, other handles' records are kept
+        if not self.pending: return
+        with self.lock():
+            self.reload()
+            pending = [(k, v) for k, v in self.pending.items() if self.find(k) < 0]  # first writer wins like add()
+            if pending:
+                with open(self.file_path, 'ab') as fp:
+                    fp.write(b''.join(encode_record(k, v) for k, v in pending))
+                    fp.flush()
+                    os.fsync(fp.fileno())
+                self.reload()
+            self.pending = {}
+            if len(self.tail) > REINDEX_TAIL: self.merge_index()
+
+    def merge_index(self):  # callers hold the lock and have a fresh view
+        merged = dict(self.get_entry(n) for n in range(self.entry_count))
+        merged.update(self.tail)
+        self.write_index(merged, length=len(self.__data) if self.__data else 0)
+
+    def compact(self) -> Tuple[int, int]:
+        self.flush()
+        with self.lock():
+            self.reload()
+            return self.compact_locked()
+
+    def compact_locked(self) -> Tuple[int, int]:
+        before = p.getsize(self.file_path)
+        records = [(k, self.get(k)) for k in sorted(self.keys())]
+        offsets = {}
+        def generate():
+            offset = 0
+            for identifier, record in records:
+                chunk = encode_record(identifier, record)
+                offsets[identifier] = offset
+                offset += len(chunk)
+                yield chunk
+        self.close()
+        write_atomic(self.file_path, generate())
+        self.open_data()
+        self.write_index(offsets, length=p.getsize(self.file_path))
+        return before, p.getsize(self.file_path)
+
+    def close(self):
+        if self.__data:
+            self.__data.close()
+            self.__data = None
+        if self.__index:
+            self.__index.close()
+            self.__index = None
+
+def open_default_store() -> ScriptStore:
+    return ScriptStore(p.join(p.dirname(p.abspath(__file__)), 'mono_scrips.bin'))
+
+def main():
+    arguments = argparse.ArgumentParser()
+    arguments.add_argument('--file', '-f')
+    arguments.add_argument('--compact', action='store_true')
+    arguments.add_argument('--reindex', action='store_true')
+    arguments.add_argument('--lookup', '-l', nargs='+', type=int)
+    options = arguments.parse_args(sys.argv[1:])
+    store = ScriptStore(options.file) if options.file else open_default_store()
+    if options.reindex:
+        with store.lock(): store.rebuild_index()
+        print('[+] indexed {:,} scripts'.format(len(store)))
+    if options.compact:
+        before, after = store.compact()
+        print('[+] compacted {:,} => {:,} bytes, {:,} scripts'.format(before, after, len(store)))
+    for identifier in options.lookup or []:
+        record = store.get(identifier)
+        if record is None: print('\033[31m{} not found\033[0m'.format(identifier))
+        else:
+            class_name, namespace, assembly = [x.decode('utf-8') for x in record]
+            print('\033[36m{} \033[33m{}::\033[4m{}\033[0m \033[2m{}\033[0m'.format(identifier, namespace if namespace else 'global', class_name, assembly))
+    store.close()
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,44 @@
 from stream import FileStream
-from typing import List, Dict
+from typing import List, Dict, Tuple
 from strings import get_caculate_string
 from unity import FileNode
-import io, uuid, os, traceback
+import io, struct, uuid, os, traceback
+import records
+from budget import DecodeBudget
 import os.path as p
 
 MONO_BEHAVIOUR_PERSISTENT_ID = 114
 MONO_SCRIPT_PERSISTENT_ID = 115
 
+class PrimitiveType(object):
+    def __init__(self, code: str, reader, writer):
+        self.code: str = code  # struct format character, also a numpy dtype and array.array typecode
+        self.size: int = struct.calcsize('<' + code)
+        self.reader = reader
+        self.writer = writer
+
+PRIMITIVE_TYPES: Dict[str, PrimitiveType] = {  # fixed-size type tree leaves, shared by every decoder and writer
+    'bool': PrimitiveType('?', FileStream.read_boolean, FileStream.write_boolean),
+    'SInt8': PrimitiveType('b', FileStream.read_sint8, FileStream.write_sbyte),
+    'UInt8': PrimitiveType('B', FileStream.read_uint8, FileStream.write_ubyte),
+    'char': PrimitiveType('B', FileStream.read_uint8, FileStream.write_ubyte),
+    'SInt16': PrimitiveType('h', FileStream.read_sint16, FileStream.write_sint16),
+    'UInt16': PrimitiveType('H', FileStream.read_uint16, FileStream.write_uint16),
+    'short': PrimitiveType('h', FileStream.read_sint16, FileStream.write_sint16),
+    'unsigned short': PrimitiveType('H', FileStream.read_uint16, FileStream.write_uint16),
+    'SInt32': PrimitiveType('i', FileStream.read_sint32, FileStream.write_sint32),
+    'UInt32': PrimitiveType('I', FileStream.read_uint32, FileStream.write_uint32),
+    'int': PrimitiveType('i', FileStream.read_sint32, FileStream.write_sint32),
+    'unsigned int': PrimitiveType('I', FileStream.read_uint32, FileStream.write_uint32),
+    'SInt64': PrimitiveType('q', FileStream.read_sint64, FileStream.write_sint64),
+    'UInt64': PrimitiveType('Q', FileStream.read_uint64, FileStream.write_uint64),
+    'long': PrimitiveType('q', FileStream.read_sint64, FileStream.write_sint64),
+    'unsigned long': PrimitiveType('Q', FileStream.read_uint64, FileStream.write_uint64),
+    'float': PrimitiveType('f', FileStream.read_float, FileStream.write_float),
+    'double': PrimitiveType('d', FileStream.read_double, FileStream.write_double),
+    'Type*': PrimitiveType('I', FileStream.read_uint32, FileStream.write_uint32),
+}
+
 class SerializeFileHeader(object):
     def __init__(self):
         self.metadata_size: int = 0
@@ -22,6 +53,7 @@ class MetadataType(object):
         self.name: str = name
         self.index: int = index
         self.type_tree: MetadataTypeTree = type_tree
+        self.fixed_size: int = None  # byte size when the layout has no arrays, strings or alignment, otherwise -1
 
 class MetadataTypeTree(object):
     def __init__(self, type_tree_enabled: bool):
@@ -186,27 +218,7 @@ class SerializedFile(object):
         self.objects: List[ObjectInfo] = []
         self.typeinfos: List[ScriptTypeInfo] = []
         self.externals: List[ExternalInfo] = []
-        self.__premitive_decoders = {
-            'bool': FileStream.read_boolean,
-            'SInt8': FileStream.read_sint8,
-            'UInt8': FileStream.read_uint8,
-            'char': FileStream.read_uint8,
-            'SInt16': FileStream.read_sint16,
-            'UInt16': FileStream.read_uint16,
-            'short': FileStream.read_short,
-            'unsigned short': FileStream.read_uint16,
-            'SInt32': FileStream.read_sint32,
-            'UInt32': FileStream.read_uint32,
-            'int': FileStream.read_sint32,
-            'unsigned int': FileStream.read_uint32,
-            'SInt64': FileStream.read_sint64,
-            'UInt64': FileStream.read_uint64,
-            'long': FileStream.read_sint64,
-            'unsigned long': FileStream.read_uint64,
-            'float': FileStream.read_float,
-            'double': FileStream.read_double,
-            'Type*': FileStream.read_uint32,
-        }
+        self.budget: DecodeBudget = None  # optional limits checked while decoding objects
 
     def print(self, *args):
         if self.debug: print(*args)
@@ -239,12 +251,15 @@ class SerializedFile(object):
     def deserialize(self, fs: FileStream, meta_type: MetadataType):
         result = {}
         if not meta_type: return result
+        budget = self.budget if self.budget and self.budget.active else None
+        if budget: budget.enter(fs, meta_type.name)
         type_map = meta_type.type_tree.type_dict
         for n in range(len(meta_type.fields)):
             node = meta_type.fields[n]
             if node.is_array:
                 element_type = meta_type.type_tree.nodes[node.index + 2]
                 element_count = fs.read_sint32()
+                if budget: budget.check_count(fs, node.name, element_count, self.get_element_size(meta_type.type_tree, element_type))
                 array = result[node.name] = {'size': element_count}
                 if element_count == 0: continue
                 if element_type.byte_size == 1:
@@ -252,13 +267,14 @@ class SerializedFile(object):
                     fs.align()
                 else:
                     items = []
-                    if element_type.type in self.__premitive_decoders:
-                        decode = self.__premitive_decoders.get(element_type.type)
+                    if element_type.type in PRIMITIVE_TYPES:
+                        decode = PRIMITIVE_TYPES[element_type.type].reader
                         for _ in range(element_count):
                             items.append(decode(fs))
                     elif element_type.type == 'string':
                         for _ in range(element_count):
                             size = fs.read_sint32()
+                            if budget: budget.check_count(fs, node.name, size, 1)
                             items.append(fs.read(size) if size > 0 else b'')
                             fs.align()
                     else:
@@ -269,16 +285,160 @@ class SerializedFile(object):
                     array['data'] = items
             elif node.type == 'string':
                 size = fs.read_sint32()
+                if budget: budget.check_count(fs, node.name, size, 1)
                 result[node.name] = fs.read(size) if size > 0 else b''
                 fs.align()
-            elif node.type in self.__premitive_decoders:
-                result[node.name] = self.__premitive_decoders.get(node.type)(fs)
+            elif node.type in PRIMITIVE_TYPES:
+                result[node.name] = PRIMITIVE_TYPES[node.type].reader(fs)
                 if node.meta_flags & 0x4000 != 0: fs.align()
             elif node.byte_size == 0: continue
             else:
                 result[node.name] = self.deserialize(fs, meta_type=type_map.get(node.index))
+        if budget: budget.leave()
+        return result
+
+    def deserialize_record(self, fs: FileStream, meta_type: MetadataType) -> records.Record:  # same walk as deserialize into slotted records
+        if not meta_type: return records.Record()
+        record = records.get_record_class(meta_type)()
+        attributes = record.__attributes__
+        budget = self.budget if self.budget and self.budget.active else None
+        if budget: budget.enter(fs, meta_type.name)
+        type_map = meta_type.type_tree.type_dict
+        for node in meta_type.fields:
+            if node.is_array:
+                element_type = meta_type.type_tree.nodes[node.index + 2]
+                element_count = fs.read_sint32()
+                if budget: budget.check_count(fs, node.name, element_count, self.get_element_size(meta_type.type_tree, element_type))
+                if element_count <= 0:
+                    value = b'' if element_type.byte_size == 1 else []
+                elif element_type.byte_size == 1:
+                    value = fs.read(element_count)
+                    fs.align()
+                elif element_type.type in PRIMITIVE_TYPES:  # single byte elements are handled above
+                    value = records.read_typed_array(fs, PRIMITIVE_TYPES[element_type.type].code, element_count)
+                elif element_type.type == 'string':
+                    value = []
+                    for _ in range(element_count):
+                        size = fs.read_sint32()
+                        if budget: budget.check_count(fs, node.name, size, 1)
+                        value.append(fs.read(size) if size > 0 else b'')
+                        fs.align()
+                else:
+                    element_meta = type_map.get(element_type.index)
+                    value = [self.deserialize_record(fs, meta_type=element_meta) for _ in range(element_count)]
+                    fs.align()
+            elif node.type == 'string':
+                size = fs.read_sint32()
+                if budget: budget.check_count(fs, node.name, size, 1)
+                value = fs.read(size) if size > 0 else b''
+                fs.align()
+            elif node.type in PRIMITIVE_TYPES:
+                value = PRIMITIVE_TYPES[node.type].reader(fs)
+                if node.meta_flags & 0x4000 != 0: fs.align()
+            elif node.byte_size == 0: continue
+            else:
+                value = self.deserialize_record(fs, meta_type=type_map.get(node.index))
+            setattr(record, attributes[node.name], value)
+        if budget: budget.leave()
+        return record
+
+    def get_element_size(self, type_tree: MetadataTypeTree, element_type: 'TypeField') -> int:  # lower bound of an array element in bytes
+        if element_type.type in PRIMITIVE_TYPES or element_type.byte_size == 1: return element_type.byte_size
+        if element_type.type == 'string': return 4
+        element_meta = type_tree.type_dict.get(element_type.index)
+        size = self.get_fixed_size(element_meta) if element_meta else 0
+        return size if size >= 0 else 4  # variable layouts carry at least one count or aligned field
+
+    def get_fixed_size(self, meta_type: MetadataType) -> int:
+        if meta_type.fixed_size is not None: return meta_type.fixed_size
+        size = 0
+        for node in meta_type.fields:
+            if node.is_array or node.type == 'string' or node.meta_flags & 0x4000 != 0:
+                size = -1
+                break
+            if node.type in PRIMITIVE_TYPES: size += node.byte_size
+            elif node.byte_size == 0: continue
+            else:
+                nested = meta_type.type_tree.type_dict.get(node.index)
+                nested_size = self.get_fixed_size(nested) if nested else 0
+                if nested_size < 0:
+                    size = -1
+                    break
+                size += nested_size
+        meta_type.fixed_size = size
+        return size
+
+    def skip(self, fs: FileStream, meta_type: MetadataType):
+        if not meta_type: return
+        size = self.get_fixed_size(meta_type)
+        if size >= 0:
+            fs.seek(size, os.SEEK_CUR)
+            return
+        for node in meta_type.fields:
+            self.skip_field(fs, meta_type, node)
+
+    def skip_array(self, fs: FileStream, type_tree: MetadataTypeTree, element_type: 'TypeField', element_count: int):
+        budget = self.budget if self.budget and self.budget.active else None
+        if budget: budget.check_count(fs, element_type.name, element_count, self.get_element_size(type_tree, element_type))
+        if element_count <= 0: return
+        if element_type.byte_size == 1:
+            fs.seek(element_count, os.SEEK_CUR)
+            fs.align()
+        elif element_type.type in PRIMITIVE_TYPES:
+            fs.seek(element_count * element_type.byte_size, os.SEEK_CUR)
+        elif element_type.type == 'string':
+            for _ in range(element_count):
+                size = fs.read_sint32()
+                if budget: budget.check_count(fs, element_type.name, size, 1)
+                if size > 0: fs.seek(size, os.SEEK_CUR)
+                fs.align()
+        else:
+            element_meta = type_tree.type_dict.get(element_type.index)
+            size = self.get_fixed_size(element_meta) if element_meta else 0
+            if size >= 0: fs.seek(element_count * size, os.SEEK_CUR)
+            else:
+                for _ in range(element_count):
+                    self.skip(fs, element_meta)
+            fs.align()
+
+    def skip_field(self, fs: FileStream, meta_type: MetadataType, node: 'TypeField'):
+        type_tree = meta_type.type_tree
+        if node.is_array:
+            self.skip_array(fs, type_tree, type_tree.nodes[node.index + 2], fs.read_sint32())
+        elif node.type == 'string':
+            size = fs.read_sint32()
+            if self.budget and self.budget.active: self.budget.check_count(fs, node.name, size, 1)
+            if size > 0: fs.seek(size, os.SEEK_CUR)
+            fs.align()
+        elif node.type in PRIMITIVE_TYPES:
+            fs.seek(node.byte_size, os.SEEK_CUR)
+            if node.meta_flags & 0x4000 != 0: fs.align()
+        elif node.byte_size == 0: return
+        else:
+            self.skip(fs, type_tree.type_dict.get(node.index))
+
+    def deserialize_field(self, fs: FileStream, meta_type: MetadataType, node: 'TypeField'):
+        field_type = MetadataType(name=meta_type.name, index=meta_type.index, fields=[node], type_tree=meta_type.type_tree)
+        return self.deserialize(fs, meta_type=field_type).get(node.name)
+
+    def deserialize_fields(self, fs: FileStream, meta_type: MetadataType, names: set) -> dict:
+        result = {}
+        if not meta_type: return result
+        for node in meta_type.fields:
+            if len(result) == len(names): break  # stop once every wanted field is decoded
+            if node.name in names: result[node.name] = self.deserialize_field(fs, meta_type, node)
+            else: self.skip_field(fs, meta_type, node)
         return result
 
+    @staticmethod
+    def read_array_header(fs: FileStream, meta_type: MetadataType, node: 'TypeField') -> Tuple['TypeField', int]:
+        type_tree = meta_type.type_tree
+        while not node.is_array:  # unwrap containers like vector/map to their Array node
+            nested = type_tree.type_dict.get(node.index)
+            assert nested and len(nested.fields) == 1, node
+            node = nested.fields[0]
+        return type_tree.nodes[node.index + 2], fs.read_sint32()
+
     def dump(self, fs: FileStream):
         for o in self.objects:
             fs.seek(self.node.offset + self.header.data_offset + o.byte_start)
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+import argparse, contextlib, json, os, socket, socketserver, sys, threading, time, traceback
+import os.path as p
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+import serialize
+import unity
+import scripts
+from sink import create_sink
+from stream import FileStream
+
+class BundleEntry(object):
+    def __init__(self, file_path: str, signature: Tuple[int, int]):
+        self.file_path: str = file_path
+        self.signature: Tuple[int, int] = signature
+        self.archive: unity.UnityArchiveFile = None
+        self.stream: FileStream = None
+        self.serializers: List[serialize.SerializedFile] = []
+        self.hierarchies: Dict[str, any] = {}  # node path -> HierarchyIndex
+        self.hit_count: int = 0
+
+    def find_serializer(self, node: str = None) -> serialize.SerializedFile:
+        for serializer in self.serializers:
+            if not node or serializer.node.path == node: return serializer
+        raise KeyError('node not found: {}'.format(node))
+
+    def find_object(self, path_id: int, node: str = None) -> Tuple[serialize.SerializedFile, serialize.ObjectInfo]:
+        for serializer in self.serializers:
+            if node and serializer.node.path != node: continue
+            for o in serializer.objects:
+                if o.local_identifier_in_file == path_id: return serializer, o
+        raise KeyError('object not found: {}'.format(path_id))
+
+class BundleCache(object):
+    def __init__(self, capacity: int = 16):
+        self.capacity: int = capacity
+        self.entries: OrderedDict = OrderedDict()  # type: OrderedDict[str, BundleEntry]
+
+    def get(self, file_path: str) -> BundleEntry:
+        file_path = p.abspath(file_path)
+        stat = os.stat(file_path)
+        signature = stat.st_size, stat.st_mtime_ns
+        entry = self.entries.get(file_path)  # type: BundleEntry
+        if entry and entry.signature == signature:
+            self.entries.move_to_end(file_path)
+            entry.hit_count += 1
+            return entry
+        entry = BundleEntry(file_path, signature)
+        entry.archive, entry.stream, nodes = unity.open_archive(file_path)
+        for node in nodes:
+            serializer = unity.decode_serialized_file(node, entry.stream)
+            unity.collect_mono_scripts(serializer, entry.stream)
+            entry.serializers.append(serializer)
+        self.entries[file_path] = entry
+        while len(self.entries) > self.capacity:
+            _, evicted = self.entries.popitem(last=False)  # type: str, BundleEntry
+            evicted.stream.close()
+        return entry
+
+    def evict(self, file_path: str = None) -> int:
+        keys = [p.abspath(file_path)] if file_path else list(self.entries.keys())
+        count = 0
+        for key in keys:
+            entry = self.entries.pop(key, None)  # type: BundleEntry
+            if entry:
+                entry.stream.close()
+                count += 1
+        return count
+
+class ResidentServer(object):
+    def __init__(self, capacity: int = 16):
+        self.cache: BundleCache = BundleCache(capacity=capacity)
+        self.lock: threading.Lock = threading.Lock()
+        self.start_time: float = time.time()
+        self.request_count: int = 0
+        self.running: bool = True
+        self.handlers = {
+            'ping': self.ping,
+            'list': self.list_objects,
+            'types': self.list_types,
+            'decode': self.decode_object,
+            'hierarchy': self.hierarchy,
+            'scripts': self.lookup_scripts,
+            'export': self.export,
+            'evict': self.evict,
+            'shutdown': self.shutdown,
+        }
+
+    def ping(self) -> dict:
+        return {'pid': os.getpid(), 'uptime': time.time() - self.start_time, 'requests': self.request_count,
+                'bundles': [{'file': x.file_path, 'hits': x.hit_count} for x in self.cache.entries.values()]}
+
+    def list_objects(self, file: str, node: str = None, types: List[int] = None) -> List[dict]:
+        entry = self.cache.get(file)
+        result = []
+        for serializer in entry.serializers:
+            if node and serializer.node.path != node: continue
+            for o in serializer.objects:
+                type_tree = serializer.type_trees[o.type_id]
+                if types and type_tree.persistent_type_id not in types: continue
+                result.append({'node': serializer.node.path, 'path_id': o.local_identifier_in_file, 'type': type_tree.name,
+                               'type_id': type_tree.persistent_type_id, 'offset': o.byte_start, 'size': o.byte_size})
+        return result
+
+    def list_types(self, file: str, node: str = None) -> List[dict]:
+        entry = self.cache.get(file)
+        result = []
+        for serializer in entry.serializers:
+            if node and serializer.node.path != node: continue
+            for type_tree in serializer.type_trees:
+                result.append({'node': serializer.node.path, 'type': type_tree.name, 'type_id': type_tree.persistent_type_id,
+                               'type_hash': type_tree.type_hash.hex(), 'script_index': type_tree.script_index, 'complete': bool(type_tree.type_dict)})
+        return result
+
+    def decode_object(self, file: str, path_id: int, node: str = None) -> dict:
+        entry = self.cache.get(file)
+        serializer, o = entry.find_object(path_id, node=node)
+        type_tree = serializer.type_trees[o.type_id]
+        if not type_tree.type_dict: raise ValueError('incomplete type tree: {}'.format(type_tree.name))
+        entry.stream.seek(serializer.node.offset + serializer.header.data_offset + o.byte_start)
+        target = serializer.deserialize(entry.stream, meta_type=type_tree.type_dict.get(0))
+        unity.standardize(target)
+        return {'node': serializer.node.path, 'path_id': path_id, 'type': type_tree.name, 'data': target}
+
+    def hierarchy(self, file: str, node: str = None, path: str = None) -> List[dict]:
+        from hierarchy import HierarchyIndex
+        entry = self.cache.get(file)
+        serializer = entry.find_serializer(node)
+        index = entry.hierarchies.get(serializer.node.path)
+        if not index: index = entry.hierarchies[serializer.node.path] = HierarchyIndex().decode(serializer, entry.stream, resolve_script=unity.get_script_resolver(unity.get_local_scripts(serializer, entry.stream)))
+        roots = index.find(path) if path else index.roots
+        result = []
+        for root in roots:
+            for depth, transform in index.walk(root):
+                game_object = index.game_objects.get(transform, 0)
+                result.append({'depth': depth, 'transform': transform, 'game_object': game_object, 'name': index.names.get(game_object, ''),
+                               'components': [{'path_id': x, 'type': index.component_types.get(x, 'Missing')} for x in index.components.get(game_object, [])]})
+        return result
+
+    def lookup_scripts(self, path_ids: List[int]) -> Dict[str, list]:
+        result = {}
+        for identifier in path_ids:
+            record = unity.mono_scripts.get(identifier)
+            result[str(identifier)] = [unity.b2s(x) for x in record] if record else None
+        return result
+
+    def export(self, file: str, **parameters) -> dict:
+        entry = self.cache.get(file)
+        options = unity.create_arguments().parse_args(['--file', file, '--command', unity.Commands.save])
+        for name, value in parameters.items():
+            if not hasattr(options, name): raise ValueError('unknown option: {}'.format(name))
+            setattr(options, name, value)
+        sink = create_sink(options.sink, output=options.output, compact=options.compact, group=options.group)
+        try:
+            for serializer in entry.serializers:
+                unity.processs(parameters={'serializer': serializer, 'options': options, 'archive': entry.archive,
+                                           'stream': entry.stream, 'sink': sink, 'file_path': entry.file_path})
+        finally:
+            sink.close()
+        return {'output': options.output, 'nodes': [x.node.path for x in entry.serializers]}
+
+    def evict(self, file: str = None) -> int:
+        return self.cache.evict(file)
+
+    def shutdown(self) -> bool:
+        self.running = False
+        return True
+
+    def handle(self, request: dict) -> dict:
+        response = {'id': request.get('id')}
+        method = request.get('method')
+        handler = self.handlers.get(method)
+        try:
+            if not handler: raise ValueError('unknown method: {}'.format(method))
+            with self.lock, contextlib.redirect_stdout(sys.stderr):  # keep progress output off the protocol stream
+                self.request_count += 1
+                response['result'] = handler(**request.get('params', {}))
+        except Exception as error:
+            traceback.print_exc(file=sys.stderr)
+            response['error'] = {'type': type(error).__name__, 'message': str(error)}
+        return response
+
+    def handle_line(self, line: str) -> str:
+        try: request = json.loads(line)
+        except ValueError as error: return json.dumps({'id': None, 'error': {'type': 'ParseError', 'message': str(error)}})
+        return json.dumps(self.handle(request), ensure_ascii=False, default=repr)
+
+    def serve_stdio(self, input_stream=sys.stdin, output_stream=sys.stdout):
+        for line in input_stream:
+            if not line.strip(): continue
+            output_stream.write(self.handle_line(line) + '\n')
+            output_stream.flush()
+            if not self.running: break
+
+    def serve_socket(self, socket_path: str):
+        server = self
+        class RequestHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    if not line.strip(): continue
+                    self.wfile.write(server.handle_line(line.decode('utf-8')).encode('utf-8') + b'\n')
+                    self.wfile.flush()
+                    if not server.running: break
+        if p.exists(socket_path): os.remove(socket_path)
+        with socketserver.ThreadingUnixStreamServer(socket_path, RequestHandler) as listener:
+            listener.daemon_threads = True
+            thread = threading.Thread(target=listener.serve_forever, daemon=True)
+            thread.start()
+            print('[+] listening on {}'.format(socket_path), file=sys.stderr)
+            try:
+                while self.running: time.sleep(0.2)
+            finally:
+                listener.shutdown()
+                os.remove(socket_path)
+
+def request(socket_path: str, method: str, **params) -> any:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path)
+        connection.sendall(json.dumps({'id': 1, 'method': method, 'params': params}).encode('utf-8') + b'\n')
+        with connection.makefile('rb') as fp:
+            response = json.loads(fp.readline())
+    if 'error' in response: raise RuntimeError('{type}: {message}'.format(**response['error']))
+    return response['result']
+
+def main():
+    arguments = argparse.ArgumentParser()
+    arguments.add_argument('--socket', '-s')
+    arguments.add_argument('--capacity', '-n', type=int, default=16)
+    options = arguments.parse_args(sys.argv[1:])
+    unity.mono_scripts = scripts.open_default_store()
+    server = ResidentServer(capacity=options.capacity)
+    try:
+        if options.socket: server.serve_socket(options.socket)
+        else: server.serve_stdio()
+    finally:
+        server.cache.evict()
+        unity.mono_scripts.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+import struct
+import lz4.block
+from concurrent.futures import Executor
+from stream import FileStream
+from typing import List, Dict, Tuple
+
+PLATFORMS = {  # ShaderCompilerPlatform
+    0: 'None', 1: 'GL', 2: 'D3D9', 3: 'Xbox360', 4: 'PS3', 5: 'D3D11', 6: 'GLES20', 7: 'NaCl', 8: 'Flash', 9: 'D3D11_9x',
+    10: 'GLES3Plus', 11: 'PSP2', 12: 'PS4', 13: 'XboxOne', 14: 'PSM', 15: 'Metal', 16: 'OpenGLCore', 17: 'N3DS', 18: 'WiiU',
+    19: 'Vulkan', 20: 'Switch', 21: 'XboxOneD3D12',
+}
+BLOB_FIELDS = ('platforms', 'offsets', 'compressedLengths', 'decompressedLengths')
+
+class ShaderBlob(object):
+    def __init__(self, index: int, platform: int, offset: int, compressed_length: int, decompressed_length: int):
+        self.index: int = index  # position in the shader's blob table
+        self.platform: int = platform
+        self.offset: int = offset  # inside compressedBlob
+        self.compressed_length: int = compressed_length
+        self.decompressed_length: int = decompressed_length
+        self.data: bytes = None  # decompressed on demand
+        self.programs: List[Tuple[int, int]] = None  # sub-program offset and length inside data
+
+    @property
+    def platform_name(self) -> str:
+        return PLATFORMS.get(self.platform, str(self.platform))
+
+    def decode_programs(self, endian: str = '<') -> List[Tuple[int, int]]:
+        data = self.data
+        count, = struct.unpack_from(endian + 'i', data, 0) if len(data) >= 4 else (-1,)
+        if count < 0 or 4 + count * 8 > len(data):
+            self.programs = [(0, len(data))]  # unknown table layout, keep the blob whole
+            return self.programs
+        table = struct.unpack_from('{}{}i'.format(endian, count * 2), data, 4)
+        programs = list(zip(table[0::2], table[1::2]))
+        if any(o < 4 + count * 8 or s < 0 or o + s > len(data) for o, s in programs): programs = [(0, len(data))]
+        self.programs = programs
+        return programs
+
+    def __repr__(self):
+        return '{{platform={}, offset={:,}, compressed={:,}, decompressed={:,}}}'.format(self.platform_name, self.offset, self.compressed_length, self.decompressed_length)
+
+class ShaderData(object):
+    def __init__(self, stream: FileStream):
+        self.name: str = ''
+        self.stream: FileStream = stream
+        self.blob_position: int = 0  # stream position of the first compressedBlob byte
+        self.blob_size: int = 0
+        self.blobs: List[ShaderBlob] = []
+
+    def read_compressed(self, blob: ShaderBlob) -> bytes:
+        assert blob.offset + blob.compressed_length <= self.blob_size, blob
+        self.stream.seek(self.blob_position + blob.offset)
+        return self.stream.read(blob.compressed_length)
+
+    def decompress(self, blob: ShaderBlob) -> bytes:
+        if blob.data is None:
+            blob.data = decompress_blob(self.read_compressed(blob), blob.decompressed_length)
+            blob.decode_programs(self.stream.endian)
+        return blob.data
+
+    def decompress_all(self, executor: Executor = None) -> List[bytes]:  # stream reads stay serial, LZ4 runs in the executor
+        pending = [x for x in self.blobs if x.data is None]
+        compressed = [self.read_compressed(x) for x in pending]
+        sizes = [x.decompressed_length for x in pending]
+        results = executor.map(decompress_blob, compressed, sizes) if executor else map(decompress_blob, compressed, sizes)
+        for blob, data in zip(pending, results):
+            blob.data = data
+            blob.decode_programs(self.stream.endian)
+        return [x.data for x in self.blobs]
+
+    def iter_programs(self, blob: ShaderBlob):
+        data = memoryview(self.decompress(blob))
+        for offset, size in blob.programs:
+            yield data[offset:offset + size]
+
+    @property
+    def compressed_size(self) -> int: return sum(x.compressed_length for x in self.blobs)
+
+    @property
+    def decompressed_size(self) -> int: return sum(x.decompressed_length for x in self.blobs)
+
+    def __repr__(self):
+        return '{{name={}, blobs={}, compressed={:,}, decompressed={:,}}}'.format(self.name, len(self.blobs), self.compressed_size, self.decompressed_size)
+
+def decompress_blob(data: bytes, size: int) -> bytes:
+    if len(data) == size: return data  # stored without compression
+    return lz4.block.decompress(data, uncompressed_size=size)
+
+def get_values(target: dict) -> list:
+    return target['Array'].get('data', []) if 'Array' in target else target.get('data', [])
+
+def extract_shader(serializer, stream: FileStream, o) -> ShaderData:  # decodes the blob table and skips the blob bytes
+    type_tree = serializer.type_trees[o.type_id]
+    meta_type = type_tree.type_dict.get(0)
+    stream.seek(serializer.node.offset + serializer.header.data_offset + o.byte_start)
+    shader = ShaderData(stream)
+    fields: Dict[str, list] = {}
+    for node in meta_type.fields:
+        if node.name == 'compressedBlob':
+            element_type, count = serializer.read_array_header(stream, meta_type, node)
+            shader.blob_position, shader.blob_size = stream.position, count
+            serializer.skip_array(stream, type_tree, element_type, count)
+        elif node.name == 'm_Name':
+            name = serializer.deserialize_field(stream, meta_type, node)
+            shader.name = name.decode('utf-8', errors='replace') if isinstance(name, bytes) else name
+        elif node.name in BLOB_FIELDS:
+            fields[node.name] = get_values(serializer.deserialize_field(stream, meta_type, node))
+        else:
+            serializer.skip_field(stream, meta_type, node)
+    for n, (platform, offset, compressed_length, decompressed_length) in enumerate(zip(*(fields.get(x, []) for x in BLOB_FIELDS))):
+        shader.blobs.append(ShaderBlob(n, platform, offset, compressed_length, decompressed_length))
+    return shader
+
+def encode_index(shader: ShaderData) -> dict:
+    blobs = []
+    for blob in shader.blobs:
+        item = {'index': blob.index, 'platform': blob.platform_name, 'offset': blob.offset, 'compressed_length': blob.compressed_length,
+                'decompressed_length': blob.decompressed_length}
+        if blob.programs is not None: item['programs'] = [{'offset': o, 'length': s} for o, s in blob.programs]
+        blobs.append(item)
+    return {'name': shader.name, 'compressed_size': shader.compressed_size, 'decompressed_size': shader.decompressed_size, 'blobs': blobs}
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+import io, json, os, sqlite3, tarfile, time, zipfile
+import os.path as p
+from typing import Callable, Dict, BinaryIO, Iterator, Tuple, List, Set
+
+INDEX_NAME = 'index.ndjson'
+
+class SinkType(object):
+    file = 'file'
+    ndjson = 'ndjson'
+    zip = 'zip'
+    tar = 'tar'
+    sqlite = 'sqlite'
+
+    @classmethod
+    def get_option_choices(cls):
+        choices = []
+        for name, value in vars(SinkType).items():
+            if name == value: choices.append(name)
+        return choices
+
+class GroupType(object):
+    bundle = 'bundle'
+    type = 'type'
+
+class ExportSink(object):
+    def __init__(self, output: str, compact: bool = False):
+        self.output: str = p.abspath(output)
+        self.compact: bool = compact
+
+    def encode_json(self, data) -> str:
+        if self.compact: return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+        return json.dumps(data, ensure_ascii=False, indent=4)
+
+    def write(self, path: str, data, mode: str = 'w', verbose: bool = True):
+        raise NotImplementedError
+
+    def write_json(self, path: str, data, verbose: bool = True):
+        self.write(path, self.encode_json(data), mode='w', verbose=verbose)
+
+    def write_object(self, path: str, data, type_tree: 'MetadataTypeTree', o: 'ObjectInfo', verbose: bool = True):
+        self.write_json(path, data, verbose=verbose)
+
+    def write_resource(self, path: str, reader: 'ResourceReader', resource: dict, verbose: bool = True):  # chunked, only sinks that buffer write_stream hold the whole resource
+        def copy(fp: BinaryIO):
+            for chunk in reader.iter_chunks(resource): fp.write(chunk)
+        self.write_stream(path, copy, verbose=verbose)
+
+    def write_stream(self, path: str, writer: Callable[[BinaryIO], None], verbose: bool = True):  # writer emits binary data into the file object it is given
+        buffer = io.BytesIO()
+        writer(buffer)
+        self.write(path, buffer.getvalue(), mode='wb', verbose=verbose)
+
+    def close(self):
+        pass
+
+class FileSink(ExportSink):
+    def write(self, path: str, data, mode: str = 'w', verbose: bool = True):
+        path = p.join(self.output, path)
+        output = p.dirname(path)
+        os.makedirs(output, exist_ok=True)
+        with open(path, mode) as fp:
+            fp.write(data)
+            if verbose: print('# {}'.format(fp.name))
+
+    def write_resource(self, path: str, reader: 'ResourceReader', resource: dict, verbose: bool = True):
+        path = p.join(self.output, path)
+        os.makedirs(p.dirname(path), exist_ok=True)
+        with open(path, 'wb') as fp:
+            reader.copy_to(resource, fp)
+            if verbose: print('# {}'.format(fp.name))
+
+    def write_stream(self, path: str, writer: Callable[[BinaryIO], None], verbose: bool = True):
+        path = p.join(self.output, path)
+        os.makedirs(p.dirname(path), exist_ok=True)
+        with open(path, 'wb') as fp:
+            writer(fp)
+            if verbose: print('# {}'.format(fp.name))
+
+class NDJsonSink(ExportSink):
+    MAX_OPEN_STREAMS = 64
+
+    def __init__(self, output: str, group: str = GroupType.bundle):
+        super(NDJsonSink, self).__init__(output, compact=True)
+        self.group: str = group
+        self.__streams: Dict[str, List[BinaryIO]] = {}
+        self.__created: Set[str] = set()
+
+    def get_group_key(self, path: str) -> str:
+        if self.group == GroupType.type: return p.dirname(path)
+        return path.split('/')[0]
+
+    def __create(self, path: str) -> BinaryIO:
+        mode = 'ab' if path in self.__created else 'wb'  # truncate outputs left by previous runs
+        self.__created.add(path)
+        return open(path, mode)
+
+    def __open(self, key: str) -> List[BinaryIO]:
+        streams = self.__streams.pop(key, None)
+        if not streams:
+            if len(self.__streams) >= self.MAX_OPEN_STREAMS:
+                oldest = next(iter(self.__streams))
+                for fp in self.__streams.pop(oldest):
+                    if fp: fp.close()
+            base = p.join(self.output, key)
+            if not p.exists(p.dirname(base)): os.makedirs(p.dirname(base))
+            streams = [self.__create(base + '.ndjson'), None]
+        self.__streams[key] = streams  # keep most recently used streams at the end
+        return streams
+
+    def __append(self, path: str, record: dict, verbose: bool):
+        fp, _ = self.__open(self.get_group_key(path))
+        fp.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        fp.write(b'\n')
+        if verbose: print('# {}:{}'.format(fp.name, path))
+
+    def write(self, path: str, data, mode: str = 'w', verbose: bool = True):
+        if isinstance(data, bytes):
+            key = self.get_group_key(path)
+            streams = self.__open(key)
+            if not streams[1]: streams[1] = self.__create(p.join(self.output, key) + '.blob')
+            offset = streams[1].tell()
+            streams[1].write(data)
+            self.__append(path, {'path': path, 'blob': [offset, len(data)]}, verbose)
+        else:
+            self.__append(path, {'path': path, 'text': data}, verbose)
+
+    def write_stream(self, path: str, writer: Callable[[BinaryIO], None], verbose: bool = True):
+        key = self.get_group_key(path)
+        streams = self.__open(key)
+        if not streams[1]: streams[1] = self.__create(p.join(self.output, key) + '.blob')
+        offset = streams[1].tell()
+        writer(streams[1])
+        self.__append(path, {'path': path, 'blob': [offset, streams[1].tell() - offset]}, verbose)
+
+    def write_json(self, path: str, data, verbose: bool = True):
+        self.__append(path, {'path': path, 'data': data}, verbose)
+
+    def close(self):
+        for streams in self.__streams.values():
+            for fp in streams:
+                if fp: fp.close()
+        self.__streams = {}
+
+class ChunkFile(object):  # read() over an iterator of byte chunks, for consumers that pull data such as tarfile
+    def __init__(self, chunks: Iterator[bytes]):
+        self.chunks: Iterator[bytes] = chunks
+        self.chunk: bytes = b''
+        self.position: int = 0
+
+    def read(self, n: int = -1) -> bytes:
+        parts = []
+        while n != 0:
+            if self.position >= len(self.chunk):
+                self.chunk, self.position = next(self.chunks, b''), 0
+                if not self.chunk: break
+            end = len(self.chunk) if n < 0 else min(len(self.chunk), self.position + n)
+            parts.append(self.chunk[self.position:end])
+            if n > 0: n -= end - self.position
+            self.position = end
+        return b''.join(parts)
+
+class ArchiveSink(ExportSink):
+    def __init__(self, output: str, compact: bool = False, format: str = SinkType.zip):
+        super(ArchiveSink, self).__init__(output, compact)
+        self.format: str = format
+        self.file_path: str = '{}.{}'.format(self.output, format)
+        self.index: List[dict] = []
+        output = p.dirname(self.file_path)
+        if not p.exists(output): os.makedirs(output)
+        if format == SinkType.zip:
+            self.__archive = zipfile.ZipFile(self.file_path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1)
+        else:
+            self.__archive = tarfile.open(self.file_path, 'w|')
+
+    def __add(self, path: str, data: bytes):
+        if self.format == SinkType.zip:
+            self.__archive.writestr(path, data)
+        else:
+            info = tarfile.TarInfo(name=path)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            self.__archive.addfile(info, io.BytesIO(data))
+
+    def write(self, path: str, data, mode: str = 'w', verbose: bool = True):
+        binary = isinstance(data, bytes)
+        if not binary: data = data.encode('utf-8')
+        self.__add(path, data)
+        self.index.append({'path': path, 'size': len(data), 'binary': binary})
+        if verbose: print('# {}:{}'.format(self.file_path, path))
+
+    def write_resource(self, path: str, reader: 'ResourceReader', resource: dict, verbose: bool = True):
+        if self.format == SinkType.zip: return super(ArchiveSink, self).write_resource(path, reader, resource, verbose=verbose)
+        _, size = reader.resolve(resource)  # tar headers carry the size, the data then streams in chunks
+        info = tarfile.TarInfo(name=path)
+        info.size = size
+        info.mtime = int(time.time())
+        self.__archive.addfile(info, ChunkFile(reader.iter_chunks(resource)))
+        self.index.append({'path': path, 'size': size, 'binary': True})
+        if verbose: print('# {}:{}'.format(self.file_path, path))
+
+    def write_stream(self, path: str, writer: Callable[[BinaryIO], None], verbose: bool = True):
+        if self.format != SinkType.zip: return super(ArchiveSink, self).write_stream(path, writer, verbose=verbose)  # tar headers need the size up front
+        with self.__archive.open(path, 'w') as fp: writer(fp)
+        self.index.append({'path': path, 'size': self.__archive.getinfo(path).file_size, 'binary': True})
+        if verbose: print('# {}:{}'.format(self.file_path, path))
+
+    def close(self):
+        if not self.__archive: return
+        index = io.BytesIO()
+        for entry in self.index:
+            index.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+            index.write(b'\n')
+        self.__add(INDEX_NAME, index.getvalue())
+        self.__archive.close()
+        self.__archive = None
+        print('>> {}'.format(self.file_path))
+
+class SqliteSink(ExportSink):
+    BATCH_SIZE = 5000
+    TRANSACTION_SIZE = 100000
+    COLUMN_TYPES = {
+        'bool': 'INTEGER', 'SInt8': 'INTEGER', 'UInt8': 'INTEGER', 'char': 'INTEGER',
+        'SInt16': 'INTEGER', 'UInt16': 'INTEGER', 'short': 'INTEGER', 'unsigned short': 'INTEGER',
+        'SInt32': 'INTEGER', 'UInt32': 'INTEGER', 'int': 'INTEGER', 'unsigned int': 'INTEGER',
+        'SInt64': 'INTEGER', 'UInt64': 'INTEGER', 'long': 'INTEGER', 'unsigned long': 'INTEGER',
+        'Type*': 'INTEGER', 'float': 'REAL', 'double': 'REAL', 'string': 'TEXT',
+    }
+
+    def __init__(self, output: str):
+        super(SqliteSink, self).__init__(output, compact=True)
+        self.file_path: str = '{}.sqlite'.format(self.output)
+        output = p.dirname(self.file_path)
+        if not p.exists(output): os.makedirs(output)
+        self.__connection = sqlite3.connect(self.file_path)
+        self.__connection.execute('PRAGMA journal_mode=WAL')
+        self.__connection.execute('PRAGMA synchronous=OFF')
+        self.__connection.execute('CREATE TABLE IF NOT EXISTS "__files" (path TEXT PRIMARY KEY, data BLOB)')
+        self.__tables: Dict[str, Set[str]] = {}
+        self.__pending: Dict[Tuple[str, tuple], List[tuple]] = {}
+        self.__pending_count: int = 0
+        self.__transaction_count: int = 0
+        self.__connection.execute('BEGIN')
+
+    @staticmethod
+    def quote(name: str) -> str:
+        return '"{}"'.format(name.replace('"', '""'))
+
+    def __prepare_table(self, table: str, columns: List[Tuple[str, str]]):
+        known = self.__tables.get(table)
+        if known is None:
+            rows = self.__connection.execute('PRAGMA table_info({})'.format(self.quote(table))).fetchall()
+            known = self.__tables[table] = set(x[1] for x in rows)
+            if not known:
+                self.__connection.execute('CREATE TABLE {} (bundle TEXT, node TEXT, path_id INTEGER)'.format(self.quote(table)))
+                self.__connection.execute('CREATE UNIQUE INDEX {} ON {} (bundle, node, path_id)'.format(self.quote(table + '__bundle_node_path_id'), self.quote(table)))
+                self.__connection.execute('CREATE INDEX {} ON {} (path_id)'.format(self.quote(table + '__path_id'), self.quote(table)))
+                known.update(('bundle', 'node', 'path_id'))
+        for name, column_type in columns:
+            if name in known: continue
+            self.__connection.execute('ALTER TABLE {} ADD COLUMN {} {}'.format(self.quote(table), self.quote(name), column_type))
+            if name.endswith('m_Script'):
+                self.__connection.execute('CREATE INDEX {} ON {} ({})'.format(self.quote('{}__{}'.format(table, name)), self.quote(table), self.quote(name)))
+            known.add(name)
+
+    def write_object(self, path: str, data, type_tree: 'MetadataTypeTree', o: 'ObjectInfo', verbose: bool = True):
+        components = path.split('/')
+        values = [components[0], '/'.join(components[1:-2]), o.local_identifier_in_file]
+        columns = []
+        for field in type_tree.type_dict.get(0).fields:
+            if field.name not in data: continue
+            value = data.get(field.name)
+            if field.type.startswith('PPtr<') and isinstance(value, dict):
+                # store pointers as plain path ids so they can be indexed and joined on
+                columns.append((field.name, 'INTEGER'))
+                values.append(value.get('m_PathID'))
+                columns.append((field.name + '.m_FileID', 'INTEGER'))
+                values.append(value.get('m_FileID'))
+            elif field.type in self.COLUMN_TYPES and not field.is_array:
+                columns.append((field.name, self.COLUMN_TYPES.get(field.type)))
+                values.append(value)
+            else:
+                columns.append((field.name, 'TEXT'))
+                values.append(json.dumps(value, ensure_ascii=False, separators=(',', ':')))
+        table = type_tree.name
+        self.__prepare_table(table, columns)
+        key = table, tuple(x for x, _ in columns)
+        rows = self.__pending.get(key)
+        if rows is None: rows = self.__pending[key] = []
+        rows.append(tuple(values))
+        self.__pending_count += 1
+        if self.__pending_count >= self.BATCH_SIZE: self.flush()
+        if verbose: print('# {}:{}/{}'.format(self.file_path, table, o.local_identifier_in_file))
+
+    def write(self, path: str, data, mode: str = 'w', verbose: bool = True):
+        self.__connection.execute('INSERT OR REPLACE INTO "__files" (path, data) VALUES (?, ?)', (path, data))
+        if verbose: print('# {}:{}'.format(self.file_path, path))
+
+    def write_json(self, path: str, data, verbose: bool = True):
+        self.write(path, json.dumps(data, ensure_ascii=False, separators=(',', ':')), verbose=verbose)
+
+    def flush(self):
+        for (table, columns), rows in self.__pending.items():
+            statement = 'INSERT OR REPLACE INTO {} ({}) VALUES ({})'.format(
+                self.quote(table), ','.join(self.quote(x) for x in ('bundle', 'node', 'path_id') + columns), ','.join('?' * (len(columns) + 3)))
+            self.__connection.executemany(statement, rows)
+        self.__transaction_count += self.__pending_count
+        self.__pending = {}
+        self.__pending_count = 0
+        if self.__transaction_count >= self.TRANSACTION_SIZE:
+            self.__connection.commit()
+            self.__connection.execute('BEGIN')
+            self.__transaction_count = 0
+
+    def close(self):
+        if not self.__connection: return
+        self.flush()
+        self.__connection.commit()
+        self.__connection.close()
+        self.__connection = None
+        print('>> {}'.format(self.file_path))
+
+def create_sink(sink_type: str, output: str, compact: bool = False, group: str = GroupType.bundle) -> ExportSink:
+    if sink_type == SinkType.sqlite: return SqliteSink(output)
+    if sink_type == SinkType.ndjson: return NDJsonSink(output, group=group)
+    if sink_type in (SinkType.zip, SinkType.tar): return ArchiveSink(output, compact=compact, format=sink_type)
+    return FileSink(output, compact=compact)
+
+def decode_entry(path: str, data: bytes):
+    if path.endswith('.json'): return json.loads(data.decode('utf-8'))
+    return data
+
+def iter_ndjson(file_path: str) -> Iterator[Tuple[str, any]]:
+    blob_path = file_path[:file_path.rfind('.')] + '.blob'
+    blob = None
+    try:
+        with open(file_path, 'rb') as fp:
+            for line in fp:
+                if not line.strip(): continue
+                record = json.loads(line)
+                if 'data' in record:
+                    yield record['path'], record['data']
+                elif 'blob' in record:
+                    if not blob: blob = open(blob_path, 'rb')
+                    offset, size = record['blob']
+                    blob.seek(offset)
+                    yield record['path'], blob.read(size)
+                else:
+                    yield record['path'], record.get('text')
+    finally:
+        if blob: blob.close()
+
+def iter_archive(file_path: str) -> Iterator[Tuple[str, any]]:
+    if zipfile.is_zipfile(file_path):
+        with zipfile.ZipFile(file_path, 'r') as archive:
+            for info in archive.infolist():
+                if info.filename == INDEX_NAME: continue
+                yield info.filename, decode_entry(info.filename, archive.read(info))
+    else:
+        with tarfile.open(file_path, 'r|*') as archive:
+            for info in archive:
+                if not info.isfile() or info.name == INDEX_NAME: continue
+                yield info.name, decode_entry(info.name, archive.extractfile(info).read())
+
+def iter_records(file_path: str) -> Iterator[Tuple[str, any]]:
+    if file_path.endswith('.ndjson'): return iter_ndjson(file_path)
+    return iter_archive(file_path)
+
+def main():
+    import argparse, sys
+    arguments = argparse.ArgumentParser()
+    arguments.add_argument('--file', '-f', nargs='+', required=True)
+    arguments.add_argument('--list', '-l', action='store_true')
+    options = arguments.parse_args(sys.argv[1:])
+    for file_path in options.file:
+        for path, data in iter_records(file_path):
+            if options.list: print(path)
+            elif isinstance(data, bytes): print(path, '{:,}'.format(len(data)))
+            else: print(path, json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+
+if __name__ == '__main__':
+    main()
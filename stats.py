@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+import argparse, bisect, csv, json, os, struct, sys, time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Tuple
+
+import serialize
+import unity
+from duplicates import find_bundles
+from stream import FileStream
+
+SERIALIZED_HEADER = struct.Struct('>iiii')  # metadata size, file size, version, data offset
+METADATA_TYPE = '<metadata>'
+RESOURCE_TYPE = '<resource>'
+
+StatsKey = Tuple[str, str, str]  # node, type, script
+
+class BlockTable(object):
+    def __init__(self, blocks: List[unity.StorageBlock]):
+        self.starts: List[int] = []
+        self.blocks: List[unity.StorageBlock] = blocks
+        offset = 0
+        for block in blocks:
+            self.starts.append(offset)
+            offset += block.uncompressed_size
+        self.uncompressed_size: int = offset
+        self.compressed_size: int = sum(x.compressed_size for x in blocks)
+
+    def get_compressed_size(self, offset: int, size: int) -> float:  # share of the overlapping blocks, prorated by overlap
+        if not self.blocks: return size
+        compressed = 0.0
+        n = max(0, bisect.bisect_right(self.starts, offset) - 1)
+        end = offset + size
+        while n < len(self.blocks) and self.starts[n] < end:
+            block = self.blocks[n]
+            overlap = min(end, self.starts[n] + block.uncompressed_size) - max(offset, self.starts[n])
+            if overlap > 0 and block.uncompressed_size > 0: compressed += overlap * block.compressed_size / block.uncompressed_size
+            n += 1
+        return compressed
+
+class BundleStats(object):
+    def __init__(self, file_path: str):
+        self.file_path: str = file_path
+        self.file_size: int = 0
+        self.uncompressed_size: int = 0
+        self.compressed_size: int = 0
+        self.block_count: int = 0
+        self.object_count: int = 0
+        self.rows: Dict[StatsKey, List] = {}  # -> [count, bytes, compressed bytes]
+
+    def add(self, node: str, type_name: str, script: str, size: int, compressed: float):
+        row = self.rows.get((node, type_name, script))
+        if not row: row = self.rows[node, type_name, script] = [0, 0, 0.0]
+        row[0] += 1
+        row[1] += size
+        row[2] += compressed
+
+    @property
+    def ratio(self) -> float:
+        return self.compressed_size / self.uncompressed_size if self.uncompressed_size else 1.0
+
+    def to_json(self) -> dict:
+        return {'bundle': self.file_path, 'file_size': self.file_size, 'uncompressed': self.uncompressed_size, 'compressed': self.compressed_size,
+                'ratio': round(self.ratio, 4), 'blocks': self.block_count, 'objects': self.object_count}
+
+def get_script_name(serializer: serialize.SerializedFile, type_tree: serialize.MetadataTypeTree) -> str:
+    if type_tree.persistent_type_id != serialize.MONO_BEHAVIOUR_PERSISTENT_ID: return ''
+    if 0 <= type_tree.script_index < len(serializer.typeinfos):
+        entity = serializer.typeinfos[type_tree.script_index].local_identifier_in_file
+        class_name = unity.resolve_script(entity)
+        return class_name if class_name else 'script:{}'.format(entity)
+    return 'hash:{}'.format(type_tree.mono_hash.hex())
+
+def decode_metadata(archive: unity.UnityArchiveFile, fs: FileStream, node: unity.FileNode) -> serialize.SerializedFile:
+    header = archive.read_range(fs, node.offset, SERIALIZED_HEADER.size)
+    _, _, _, data_offset = SERIALIZED_HEADER.unpack(header)
+    local = unity.FileNode()  # the metadata is decoded from its own buffer so the node starts at zero
+    local.size, local.flags, local.path, local.index = node.size, node.flags, node.path, node.index
+    stream = FileStream(data=archive.read_range(fs, node.offset, data_offset))
+    serializer = unity.decode_serialized_file(local, stream)
+    serializer.node = node
+    return serializer
+
+def scan_bundle(file_path: str) -> BundleStats:
+    stats = BundleStats(file_path)
+    archive = unity.UnityArchiveFile(debug=False)
+    fs = FileStream(file_path=file_path)
+    try:
+        archive.decode_metadata(fs)
+        table = BlockTable(archive.blocks_info.blocks)
+        stats.file_size = fs.length
+        stats.uncompressed_size, stats.compressed_size, stats.block_count = table.uncompressed_size, table.compressed_size, len(table.blocks)
+        for node in archive.direcory_info.nodes:
+            if not node.is_serialized_file:
+                stats.add(node.path, RESOURCE_TYPE, '', node.size, table.get_compressed_size(node.offset, node.size))
+                continue
+            serializer = decode_metadata(archive, fs, node)
+            base_offset = node.offset + serializer.header.data_offset
+            stats.add(node.path, METADATA_TYPE, '', serializer.header.data_offset, table.get_compressed_size(node.offset, serializer.header.data_offset))
+            for o in serializer.objects:
+                type_tree = serializer.type_trees[o.type_id]
+                compressed = table.get_compressed_size(base_offset + o.byte_start, o.byte_size)
+                stats.add(node.path, type_tree.name, get_script_name(serializer, type_tree), o.byte_size, compressed)
+                stats.object_count += 1
+    finally:
+        fs.close()
+    return stats
+
+def scan_bundle_safely(file_path: str) -> Tuple[str, BundleStats, str]:
+    try: return file_path, scan_bundle(file_path), ''
+    except Exception as error: return file_path, None, '{}: {}'.format(type(error).__name__, error)
+
+def aggregate(bundles: List[BundleStats], index: int) -> List[Tuple[str, int, int, float]]:  # groups rows by the key column at index
+    totals = {}  # type: Dict[str, List]
+    for bundle in bundles:
+        for key, (count, size, compressed) in bundle.rows.items():
+            name = key[index]
+            if not name: continue
+            total = totals.get(name)
+            if not total: total = totals[name] = [0, 0, 0.0]
+            total[0] += count
+            total[1] += size
+            total[2] += compressed
+    return [(k, v[0], v[1], v[2]) for k, v in totals.items()]
+
+SORT_KEYS = {'bytes': lambda x: -x[2], 'count': lambda x: -x[1], 'compressed': lambda x: -x[3]}
+
+def print_table(title: str, rows: List[Tuple[str, int, int, float]], top: int):
+    print('\033[32m[{}]\033[0m'.format(title))
+    for name, count, size, compressed in rows[:top]:
+        ratio = compressed / size if size else 1.0
+        print('\033[33m{:>14,} \033[36m{:>12,.0f} \033[2m{:6.1%} \033[0m{:>9,} {}'.format(size, compressed, ratio, count, name))
+
+def main():
+    arguments = argparse.ArgumentParser()
+    arguments.add_argument('--directory', '-d')
+    arguments.add_argument('--file', '-f', nargs='+')
+    arguments.add_argument('--jobs', '-j', type=int, default=0)
+    arguments.add_argument('--top', type=int, default=20)
+    arguments.add_argument('--sort', choices=tuple(SORT_KEYS.keys()), default='bytes')
+    arguments.add_argument('--output', '-o')
+    arguments.add_argument('--csv')
+    options = arguments.parse_args(sys.argv[1:])
+    if not options.directory and not options.file: arguments.error('one of --directory or --file is required')
+    start = time.perf_counter()
+    files = list(options.file or [])
+    if options.directory: files.extend(find_bundles(options.directory))
+    print('[+] {:,} bundles'.format(len(files)))
+    bundles = []  # type: List[BundleStats]
+    jobs = options.jobs if options.jobs > 0 else os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=jobs, initializer=unity.init_worker) as executor:
+        for file_path, stats, error in executor.map(scan_bundle_safely, files, chunksize=max(1, min(64, len(files) // (jobs * 4) or 1))):
+            if error: print('\033[31m[E] {} {}\033[0m'.format(file_path, error))
+            else: bundles.append(stats)
+    sort_key = SORT_KEYS[options.sort]
+    types = sorted(aggregate(bundles, index=1), key=sort_key)
+    scripts = sorted(aggregate(bundles, index=2), key=sort_key)
+    bundle_rows = sorted(((x.file_path, x.object_count, x.uncompressed_size, x.compressed_size) for x in bundles), key=sort_key)
+    uncompressed = sum(x.uncompressed_size for x in bundles)
+    compressed = sum(x.compressed_size for x in bundles)
+    print('[=] bundles={:,} objects={:,} uncompressed={:,} compressed={:,} ratio={:.1%} elapsed={:.1f}s'.format(
+        len(bundles), sum(x.object_count for x in bundles), uncompressed, compressed, compressed / uncompressed if uncompressed else 1.0, time.perf_counter() - start))
+    print_table('types', types, options.top)
+    print_table('scripts', scripts, options.top)
+    print_table('bundles', bundle_rows, options.top)
+    if options.output:
+        def encode(rows): return [{'name': n, 'count': c, 'bytes': s, 'compressed': round(z)} for n, c, s, z in rows]
+        with open(options.output, 'w') as fp:
+            json.dump({'uncompressed': uncompressed, 'compressed': compressed, 'types': encode(types), 'scripts': encode(scripts),
+                       'bundles': [x.to_json() for x in sorted(bundles, key=lambda x: x.file_path)]}, fp, indent=1)
+    if options.csv:
+        with open(options.csv, 'w', newline='') as fp:
+            writer = csv.writer(fp)
+            writer.writerow(('bundle', 'node', 'type', 'script', 'count', 'bytes', 'compressed'))
+            for bundle in sorted(bundles, key=lambda x: x.file_path):
+                for (node, type_name, script), (count, size, estimate) in sorted(bundle.rows.items()):
+                    writer.writerow((bundle.file_path, node, type_name, script, count, size, round(estimate)))
+
+if __name__ == '__main__':
+    main()
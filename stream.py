@@ -29,6 +29,9 @@ class FileStream(object):
             return True
         return False
 
+    def attach(self, buffer: BinaryIO):  # any seekable file-like object, e.g. an mmap of a scratch file
+        self.__buffer = buffer
+
     def close(self):
         self.__buffer.close()
 
@@ -86,7 +89,7 @@ class FileStream(object):
         self.__buffer.write(data)
 
     def write_boolean(self, v: bool):
-        self.__buffer.write(bytes(1 if v else 0))
+        self.__buffer.write(struct.pack('?', v))
 
     def write_sbyte(self, v: int):
         self.write(struct.pack('b', v))
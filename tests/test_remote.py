@@ -0,0 +1,95 @@
+import functools, http.server, os, struct, sys, threading
+import os.path as p
+
+import lz4.block
+import pytest
+
+sys.path.insert(0, p.dirname(p.dirname(p.abspath(__file__))))
+import serialize
+import remote
+
+BLOCK_SIZE = 1 << 14
+NODES = [('CAB-first', os.urandom(200 << 10)), ('CAB-second', bytes(range(256)) * 400), ('CAB-third', os.urandom(100 << 10))]
+
+def write_bundle(file_path: str, nodes) -> list:  # UnityFS with lz4 blocks, returns the compressed size of each block
+    data, entries = b'', []
+    for name, raw in nodes:
+        entries.append((len(data), len(raw), 0, name))
+        data += raw
+    blocks, payload = [], b''
+    for offset in range(0, len(data), BLOCK_SIZE):
+        chunk = data[offset:offset + BLOCK_SIZE]
+        compressed = lz4.block.compress(chunk, store_size=False)
+        blocks.append((len(chunk), len(compressed), 2))
+        payload += compressed
+    info = bytes(16) + struct.pack('>I', len(blocks)) + b''.join(struct.pack('>IIH', *x) for x in blocks)
+    info += struct.pack('>I', len(entries)) + b''.join(struct.pack('>QQI', o, s, f) + n.encode() + b'\0' for o, s, f, n in entries)
+    compressed_info = lz4.block.compress(info, store_size=False)
+    header = b'UnityFS\0' + struct.pack('>i', 6) + b'5.x.x\0' + b'2018.4.2f1\0'
+    header += struct.pack('>QIII', len(header) + 20 + len(compressed_info) + len(payload), len(compressed_info), len(info), 0x40 | 3)
+    with open(file_path, 'wb') as fp: fp.write(header + compressed_info + payload)
+    return [x[1] for x in blocks]
+
+class IgnoreRangeHandler(http.server.SimpleHTTPRequestHandler):  # answers every GET with the whole file
+    def log_message(self, format, *args): pass
+
+class AdvertiseRangeHandler(IgnoreRangeHandler):  # claims range support on HEAD, still ignores it
+    def end_headers(self):
+        self.send_header('Accept-Ranges', 'bytes')
+        super(AdvertiseRangeHandler, self).end_headers()
+
+def start(server: http.server.ThreadingHTTPServer) -> str:
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return 'http://{}:{}/test.bundle'.format(*server.server_address)
+
+@pytest.fixture
+def bundle_path(tmp_path):
+    file_path = str(tmp_path / 'test.bundle')
+    write_bundle(file_path, NODES)
+    return file_path
+
+@pytest.fixture
+def server(bundle_path):
+    server = remote.serve(p.dirname(bundle_path))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_read_node_fetches_only_its_blocks(server, bundle_path):
+    bundle = remote.RemoteBundle(start(server)).open()
+    try:
+        assert bundle.file.length == os.path.getsize(bundle_path)
+        node = bundle.find_node('CAB-third')
+        requests, received = bundle.file.request_count, bundle.file.bytes_received
+        assert bundle.read_node(node) == NODES[2][1]
+        assert bundle.file.request_count - requests == 1  # consecutive blocks coalesce into one range
+        assert bundle.file.bytes_received - received <= len(NODES[2][1]) + 2 * remote.PAGE_SIZE
+        requests, received = bundle.file.request_count, bundle.file.bytes_received
+        assert bundle.read_node(node) == NODES[2][1]
+        assert (bundle.file.request_count, bundle.file.bytes_received) == (requests, received)
+    finally:
+        bundle.close()
+
+def test_read_range_within_node(server):
+    bundle = remote.RemoteBundle(start(server), page_size=BLOCK_SIZE, gap=0).open()
+    try:
+        node = bundle.find_node('CAB-first')
+        requests, received = bundle.file.request_count, bundle.file.bytes_received
+        assert bundle.read(node.offset + 100000, 1000) == NODES[0][1][100000:101000]
+        assert bundle.file.request_count - requests == 1
+        assert bundle.file.bytes_received - received <= 2 * BLOCK_SIZE + 64  # one lz4 block, split over at most two pages
+    finally:
+        bundle.close()
+
+@pytest.mark.parametrize('handler', [IgnoreRangeHandler, AdvertiseRangeHandler])
+def test_ignored_range_downloads_once(bundle_path, handler):
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(handler, directory=p.dirname(bundle_path)))
+    bundle = remote.RemoteBundle(start(server), page_size=BLOCK_SIZE).open()
+    try:
+        for name, raw in NODES: assert bundle.read_node(bundle.find_node(name)) == raw
+        assert bundle.file.request_count == 1
+        assert bundle.file.bytes_received == os.path.getsize(bundle_path)
+    finally:
+        bundle.close()
+        server.shutdown()
+        server.server_close()
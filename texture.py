@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+import struct, zlib
+from typing import Tuple
+
+import numpy as np
+
+from format import TextureFormat
+
+# bytes per 4x4 block for block compressed formats
+BLOCK_FORMATS = {
+    TextureFormat.DXT1: 8,
+    TextureFormat.DXT5: 16,
+    TextureFormat.BC4: 8,
+    TextureFormat.BC5: 16,
+    TextureFormat.ETC_RGB4: 8,
+    TextureFormat.ETC2_RGB: 8,
+    TextureFormat.ETC2_RGBA1: 8,
+    TextureFormat.ETC2_RGBA8: 16,
+    TextureFormat.EAC_R: 8,
+    TextureFormat.EAC_R_SIGNED: 8,
+    TextureFormat.EAC_RG: 16,
+    TextureFormat.EAC_RG_SIGNED: 16,
+}
+
+# bytes per pixel for uncompressed formats
+PIXEL_FORMATS = {
+    TextureFormat.Alpha8: 1,
+    TextureFormat.R8: 1,
+    TextureFormat.ARGB4444: 2,
+    TextureFormat.RGBA4444: 2,
+    TextureFormat.RGB565: 2,
+    TextureFormat.R16: 2,
+    TextureFormat.RG16: 2,
+    TextureFormat.RHalf: 2,
+    TextureFormat.RGB24: 3,
+    TextureFormat.RGBA32: 4,
+    TextureFormat.ARGB32: 4,
+    TextureFormat.BGRA32: 4,
+    TextureFormat.RGHalf: 4,
+    TextureFormat.RFloat: 4,
+    TextureFormat.RGBAHalf: 8,
+    TextureFormat.RGFloat: 8,
+    TextureFormat.RGBAFloat: 16,
+}
+
+ETC1_MODIFIERS = np.array([[2, 8, -2, -8], [5, 17, -5, -17], [9, 29, -9, -29], [13, 42, -13, -42],
+                           [18, 60, -18, -60], [24, 80, -24, -80], [33, 106, -33, -106], [47, 183, -47, -183]], dtype=np.int32)
+
+ETC2_DISTANCES = np.array([3, 6, 11, 16, 23, 32, 41, 64], dtype=np.int32)
+
+EAC_MODIFIERS = np.array([
+    [-3, -6, -9, -15, 2, 5, 8, 14], [-3, -7, -10, -13, 2, 6, 9, 12], [-2, -5, -8, -13, 1, 4, 7, 12],
+    [-2, -4, -6, -13, 1, 3, 5, 12], [-3, -6, -8, -12, 2, 5, 7, 11], [-3, -7, -9, -11, 2, 6, 8, 10],
+    [-4, -7, -8, -11, 3, 6, 7, 10], [-3, -5, -8, -11, 2, 4, 7, 10], [-2, -6, -8, -10, 1, 5, 7, 9],
+    [-2, -5, -8, -10, 1, 4, 7, 9], [-2, -4, -8, -10, 1, 3, 7, 9], [-2, -5, -7, -10, 1, 4, 6, 9],
+    [-3, -4, -7, -10, 2, 3, 6, 9], [-1, -2, -3, -10, 0, 1, 2, 9], [-4, -6, -8, -9, 3, 5, 7, 8],
+    [-3, -5, -7, -9, 2, 4, 6, 8]], dtype=np.int32)
+
+def is_supported(texture_format: int) -> bool:
+    return texture_format in BLOCK_FORMATS or texture_format in PIXEL_FORMATS
+
+def get_image_size(texture_format: int, width: int, height: int) -> int:
+    if texture_format in BLOCK_FORMATS:
+        return ((width + 3) // 4) * ((height + 3) // 4) * BLOCK_FORMATS[texture_format]
+    if texture_format in PIXEL_FORMATS:
+        return width * height * PIXEL_FORMATS[texture_format]
+    raise NotImplementedError('unsupported texture format {!r}'.format(TextureFormat(texture_format)))
+
+def get_mip_size(width: int, height: int, level: int) -> Tuple[int, int]:
+    return max(1, width >> level), max(1, height >> level)
+
+def get_mip_offset(texture_format: int, width: int, height: int, level: int) -> int:
+    offset = 0
+    for n in range(level):
+        offset += get_image_size(texture_format, *get_mip_size(width, height, n))
+    return offset
+
+def select_mip(width: int, height: int, mip_count: int, max_size: int) -> int:
+    level = 0
+    while level + 1 < mip_count and max(get_mip_size(width, height, level)) > max_size:
+        level += 1
+    return level
+
+def expand_bits(v: np.ndarray, bits: int) -> np.ndarray:
+    return (v << (8 - bits)) | (v >> (2 * bits - 8))
+
+def unblock(pixels: np.ndarray, width: int, height: int) -> np.ndarray:
+    bx, by = (width + 3) // 4, (height + 3) // 4
+    image = pixels.reshape(by, bx, 4, 4, 4).transpose(0, 2, 1, 3, 4).reshape(by * 4, bx * 4, 4)
+    return np.ascontiguousarray(image[:height, :width])
+
+def column_major(pixels: np.ndarray) -> np.ndarray:
+    # ETC/EAC pixel indices run down columns, blocks are assembled row by row
+    return pixels.reshape(pixels.shape[0], 4, 4, *pixels.shape[2:]).swapaxes(1, 2).reshape(pixels.shape)
+
+def decode_bc1_colors(blocks: np.ndarray, three_color: bool) -> np.ndarray:
+    count = blocks.shape[0]
+    endpoints = blocks[:, :4].copy().view('<u2').astype(np.int32)
+    c0, c1 = endpoints[:, 0], endpoints[:, 1]
+    palette = np.empty((count, 4, 4), dtype=np.int32)
+    for n, c in enumerate((c0, c1)):
+        palette[:, n, 0] = expand_bits((c >> 11) & 0x1F, 5)
+        palette[:, n, 1] = expand_bits((c >> 5) & 0x3F, 6)
+        palette[:, n, 2] = expand_bits(c & 0x1F, 5)
+    palette[:, :, 3] = 255
+    p0, p1 = palette[:, 0, :3], palette[:, 1, :3]
+    four = (c0 > c1) | (not three_color)
+    palette[:, 2, :3] = np.where(four[:, None], (2 * p0 + p1) // 3, (p0 + p1) // 2)
+    palette[:, 3, :3] = np.where(four[:, None], (p0 + 2 * p1) // 3, 0)
+    indices = blocks[:, 4:8].copy().view('<u4').astype(np.int64)
+    indices = (indices >> (2 * np.arange(16))) & 0x3
+    return palette[np.arange(count)[:, None], indices]
+
+def decode_bc4_values(blocks: np.ndarray) -> np.ndarray:
+    count = blocks.shape[0]
+    a0, a1 = blocks[:, 0].astype(np.int32), blocks[:, 1].astype(np.int32)
+    eight = (a0 > a1)[:, None]
+    interpolated = np.where(eight, np.stack([((7 - n) * a0 + n * a1) // 7 for n in range(1, 7)], axis=1),
+                            np.stack([((5 - n) * a0 + n * a1) // 5 for n in range(1, 5)] + [0 * a0, 0 * a0 + 255], axis=1))
+    palette = np.concatenate([a0[:, None], a1[:, None], interpolated], axis=1)
+    bits = np.zeros(count, dtype=np.uint64)
+    for n in range(6):
+        bits |= blocks[:, 2 + n].astype(np.uint64) << np.uint64(8 * n)
+    indices = ((bits[:, None] >> (3 * np.arange(16, dtype=np.uint64))) & np.uint64(7)).astype(np.intp)
+    return palette[np.arange(count)[:, None], indices]
+
+def decode_eac_values(blocks: np.ndarray, signed: bool = False, precise: bool = False) -> np.ndarray:
+    count = blocks.shape[0]
+    base = blocks[:, 0].astype(np.int8 if signed else np.uint8).astype(np.int32)
+    multiplier = (blocks[:, 1] >> 4).astype(np.int32)
+    table = EAC_MODIFIERS[blocks[:, 1] & 0xF]
+    bits = np.zeros(count, dtype=np.uint64)
+    for n in range(6):
+        bits = (bits << np.uint64(8)) | blocks[:, 2 + n].astype(np.uint64)
+    indices = ((bits[:, None] >> (45 - 3 * np.arange(16, dtype=np.uint64))) & np.uint64(7)).astype(np.intp)
+    modifiers = table[np.arange(count)[:, None], indices]
+    if not precise:
+        values = np.clip(base[:, None] + modifiers * multiplier[:, None], 0, 255)
+    elif signed:
+        # 11 bit signed channel, -1023..1023
+        values = np.maximum(base, -127)[:, None] * 8 + modifiers * np.where(multiplier == 0, 1, multiplier * 8)[:, None]
+        values = (np.clip(values, -1023, 1023) + 1023) >> 3
+    else:
+        # 11 bit unsigned channel, 0..2047
+        values = base[:, None] * 8 + 4 + modifiers * np.where(multiplier == 0, 1, multiplier * 8)[:, None]
+        values = np.clip(values, 0, 2047) >> 3
+    return column_major(values)
+
+def decode_etc_colors(blocks: np.ndarray, punchthrough: bool = False) -> np.ndarray:
+    count = blocks.shape[0]
+    b = blocks.astype(np.int32)
+    flip = (b[:, 3] & 1) != 0
+    differential = ((b[:, 3] & 2) != 0) | punchthrough
+    opaque = ((b[:, 3] & 2) != 0) | (not punchthrough)
+    # individual mode, 4 bit colors
+    individual = np.stack([np.stack([b[:, n] >> 4, b[:, n] & 0xF], axis=1) * 17 for n in range(3)], axis=2)
+    # differential mode, 5 bit base color plus 3 bit signed delta
+    base = np.stack([b[:, n] >> 3 for n in range(3)], axis=1)
+    delta = np.stack([b[:, n] & 7 for n in range(3)], axis=1)
+    delta = np.where(delta >= 4, delta - 8, delta)
+    second = base + delta
+    overflow = (second < 0) | (second > 31)
+    subblock_colors = np.where(differential[:, None, None],
+                               np.stack([expand_bits(base, 5), expand_bits(np.clip(second, 0, 31), 5)], axis=1), individual)
+    tables = np.stack([b[:, 3] >> 5, (b[:, 3] >> 2) & 7], axis=1)
+    low = (b[:, 4].astype(np.int64) << 24) | (b[:, 5] << 16) | (b[:, 6] << 8) | b[:, 7]
+    position = np.arange(16)  # column major, x * 4 + y
+    msb = (low[:, None] >> (16 + position)) & 1
+    lsb = (low[:, None] >> position) & 1
+    indices = (msb << 1) | lsb
+    x, y = position // 4, position % 4
+    subblock = np.where(flip[:, None], (y >= 2)[None, :], (x >= 2)[None, :]).astype(np.intp)
+    rows = np.arange(count)[:, None]
+    modifiers = ETC1_MODIFIERS[tables[rows, subblock], indices]
+    if punchthrough:
+        modifiers = np.where(~opaque[:, None] & ((indices & 1) == 0), 0, modifiers)
+    colors = np.clip(subblock_colors[rows, subblock] + modifiers[:, :, None], 0, 255)
+    alpha = np.full((count, 16), 255, dtype=np.int32)
+    if punchthrough: alpha = np.where(~opaque[:, None] & (indices == 2), 0, alpha)
+    t_mode = differential & overflow[:, 0]
+    h_mode = differential & ~overflow[:, 0] & overflow[:, 1]
+    planar = differential & ~overflow[:, 0] & ~overflow[:, 1] & overflow[:, 2]
+    paint_mode = t_mode | h_mode
+    if paint_mode.any():
+        t1 = np.stack([(((b[:, 0] >> 3) & 3) << 2) | (b[:, 0] & 3), b[:, 1] >> 4, b[:, 1] & 0xF], axis=1) * 17
+        t2 = np.stack([b[:, 2] >> 4, b[:, 2] & 0xF, b[:, 3] >> 4], axis=1) * 17
+        td = ETC2_DISTANCES[(((b[:, 3] >> 2) & 3) << 1) | (b[:, 3] & 1)][:, None]
+        h1 = np.stack([(b[:, 0] >> 3) & 0xF, ((b[:, 0] & 7) << 1) | ((b[:, 1] >> 4) & 1),
+                       (b[:, 1] & 8) | ((b[:, 1] & 3) << 1) | (b[:, 2] >> 7)], axis=1) * 17
+        h2 = np.stack([(b[:, 2] >> 3) & 0xF, ((b[:, 2] & 7) << 1) | (b[:, 3] >> 7), (b[:, 3] >> 3) & 0xF], axis=1) * 17
+        order = ((h1[:, 0] << 16) | (h1[:, 1] << 8) | h1[:, 2]) >= ((h2[:, 0] << 16) | (h2[:, 1] << 8) | h2[:, 2])
+        hd = ETC2_DISTANCES[(b[:, 3] & 4) | ((b[:, 3] & 1) << 1) | order.astype(np.int32)][:, None]
+        t_paint = np.stack([t1, t2 + td, t2, t2 - td], axis=1)
+        h_paint = np.stack([h1 + hd, h1 - hd, h2 + hd, h2 - hd], axis=1)
+        paint = np.clip(np.where(t_mode[:, None, None], t_paint, h_paint), 0, 255)
+        colors = np.where(paint_mode[:, None, None], paint[rows, indices], colors)
+        if punchthrough:
+            alpha = np.where((paint_mode & ~opaque)[:, None] & (indices == 2), 0, np.where(paint_mode[:, None], 255, alpha))
+    if planar.any():
+        o = np.stack([expand_bits((b[:, 0] >> 1) & 0x3F, 6),
+                      expand_bits(((b[:, 0] & 1) << 6) | ((b[:, 1] >> 1) & 0x3F), 7),
+                      expand_bits(((b[:, 1] & 1) << 5) | (b[:, 2] & 0x18) | ((b[:, 2] & 3) << 1) | (b[:, 3] >> 7), 6)], axis=1)
+        h = np.stack([expand_bits(((b[:, 3] & 0x7C) >> 1) | (b[:, 3] & 1), 6),
+                      expand_bits(b[:, 4] >> 1, 7),
+                      expand_bits(((b[:, 4] & 1) << 5) | (b[:, 5] >> 3), 6)], axis=1)
+        v = np.stack([expand_bits(((b[:, 5] & 7) << 3) | (b[:, 6] >> 5), 6),
+                      expand_bits(((b[:, 6] & 0x1F) << 2) | (b[:, 7] >> 6), 7),
+                      expand_bits(b[:, 7] & 0x3F, 6)], axis=1)
+        gradient = (x[None, :, None] * (h - o)[:, None, :] + y[None, :, None] * (v - o)[:, None, :] + 4 * o[:, None, :] + 2) >> 2
+        colors = np.where(planar[:, None, None], np.clip(gradient, 0, 255), colors)
+        if punchthrough: alpha = np.where(planar[:, None], 255, alpha)
+    return column_major(np.concatenate([colors, alpha[:, :, None]], axis=2))
+
+def decode_blocks(data: bytes, texture_format: int, width: int, height: int) -> np.ndarray:
+    block_size = BLOCK_FORMATS[texture_format]
+    count = ((width + 3) // 4) * ((height + 3) // 4)
+    blocks = np.frombuffer(data, dtype=np.uint8, count=count * block_size).reshape(count, block_size)
+    pixels = np.empty((count, 16, 4), dtype=np.int32)
+    if texture_format == TextureFormat.DXT1:
+        pixels[:] = decode_bc1_colors(blocks, three_color=True)
+    elif texture_format == TextureFormat.DXT5:
+        pixels[:] = decode_bc1_colors(blocks[:, 8:], three_color=False)
+        pixels[:, :, 3] = decode_bc4_values(blocks[:, :8])
+    elif texture_format in (TextureFormat.BC4, TextureFormat.BC5):
+        pixels[:] = 0
+        pixels[:, :, 0] = decode_bc4_values(blocks[:, :8])
+        if texture_format == TextureFormat.BC5: pixels[:, :, 1] = decode_bc4_values(blocks[:, 8:])
+        pixels[:, :, 3] = 255
+    elif texture_format in (TextureFormat.ETC_RGB4, TextureFormat.ETC2_RGB):
+        # ETC2 decoding is a superset of ETC1 and matches what the hardware does with invalid ETC1 blocks
+        pixels[:] = decode_etc_colors(blocks)
+    elif texture_format == TextureFormat.ETC2_RGBA1:
+        pixels[:] = decode_etc_colors(blocks, punchthrough=True)
+    elif texture_format == TextureFormat.ETC2_RGBA8:
+        pixels[:] = decode_etc_colors(blocks[:, 8:])
+        pixels[:, :, 3] = decode_eac_values(blocks[:, :8])
+    else:
+        signed = texture_format in (TextureFormat.EAC_R_SIGNED, TextureFormat.EAC_RG_SIGNED)
+        pixels[:] = 0
+        pixels[:, :, 0] = decode_eac_values(blocks[:, :8], signed=signed, precise=True)
+        if block_size == 16: pixels[:, :, 1] = decode_eac_values(blocks[:, 8:], signed=signed, precise=True)
+        pixels[:, :, 3] = 255
+    return unblock(pixels.astype(np.uint8), width, height)
+
+def decode_pixels(data: bytes, texture_format: int, width: int, height: int) -> np.ndarray:
+    count = width * height
+    image = np.empty((count, 4), dtype=np.uint8)
+    image[:, 3] = 255
+    if texture_format in (TextureFormat.Alpha8, TextureFormat.R8):
+        values = np.frombuffer(data, dtype=np.uint8, count=count)
+        if texture_format == TextureFormat.Alpha8:
+            image[:, :3] = 255
+            image[:, 3] = values
+        else: image[:, :3] = values[:, None]
+    elif texture_format in (TextureFormat.ARGB4444, TextureFormat.RGBA4444, TextureFormat.RGB565):
+        values = np.frombuffer(data, dtype='<u2', count=count).astype(np.int32)
+        if texture_format == TextureFormat.RGB565:
+            image[:, 0] = expand_bits((values >> 11) & 0x1F, 5)
+            image[:, 1] = expand_bits((values >> 5) & 0x3F, 6)
+            image[:, 2] = expand_bits(values & 0x1F, 5)
+        else:
+            shifts = (8, 4, 0, 12) if texture_format == TextureFormat.ARGB4444 else (12, 8, 4, 0)
+            for channel, shift in enumerate(shifts):
+                image[:, channel] = ((values >> shift) & 0xF) * 17
+    elif texture_format == TextureFormat.R16:
+        image[:, :3] = (np.frombuffer(data, dtype='<u2', count=count) >> 8)[:, None]
+    elif texture_format == TextureFormat.RG16:
+        image[:, :2] = np.frombuffer(data, dtype=np.uint8, count=count * 2).reshape(count, 2)
+        image[:, 2] = 0
+    elif texture_format in (TextureFormat.RGB24, TextureFormat.RGBA32, TextureFormat.ARGB32, TextureFormat.BGRA32):
+        channels = PIXEL_FORMATS[texture_format]
+        values = np.frombuffer(data, dtype=np.uint8, count=count * channels).reshape(count, channels)
+        order = {TextureFormat.RGB24: (0, 1, 2), TextureFormat.RGBA32: (0, 1, 2, 3),
+                 TextureFormat.ARGB32: (1, 2, 3, 0), TextureFormat.BGRA32: (2, 1, 0, 3)}.get(texture_format)
+        image[:, :channels] = values[:, order]
+    else:
+        dtype = '<f2' if texture_format in (TextureFormat.RHalf, TextureFormat.RGHalf, TextureFormat.RGBAHalf) else '<f4'
+        channels = PIXEL_FORMATS[texture_format] // np.dtype(dtype).itemsize
+        values = np.frombuffer(data, dtype=dtype, count=count * channels).reshape(count, channels)
+        image[:, :channels] = (np.clip(np.nan_to_num(values.astype(np.float32)), 0, 1) * 255 + 0.5).astype(np.uint8)
+        if channels < 3: image[:, channels:3] = image[:, :1] if channels == 1 else 0
+    return image.reshape(height, width, 4)
+
+def decode_image(data: bytes, texture_format: int, width: int, height: int, mip: int = 0) -> np.ndarray:
+    """returns top-down RGBA pixels of shape (height, width, 4) for the requested mip level"""
+    if not is_supported(texture_format):
+        raise NotImplementedError('unsupported texture format {!r}'.format(TextureFormat(texture_format)))
+    offset = get_mip_offset(texture_format, width, height, mip)
+    width, height = get_mip_size(width, height, mip)
+    size = get_image_size(texture_format, width, height)
+    data = memoryview(data)[offset:offset + size]
+    if len(data) < size: raise ValueError('expect {} bytes of image data but {} found'.format(size, len(data)))
+    if texture_format in BLOCK_FORMATS: image = decode_blocks(data, texture_format, width, height)
+    else: image = decode_pixels(data, texture_format, width, height)
+    return image[::-1]  # unity stores rows bottom-up
+
+def decode_texture(texture: dict, data: bytes = None, mip: int = 0, max_size: int = 0) -> np.ndarray:
+    width, height = texture['m_Width'], texture['m_Height']
+    if max_size > 0: mip = max(mip, select_mip(width, height, texture.get('m_MipCount', 1), max_size))
+    texture_format = texture['m_TextureFormat']
+    if isinstance(texture_format, str): texture_format = TextureFormat[texture_format[texture_format.find('.') + 1:texture_format.rfind(':')]]
+    if data is None: data = texture['image data']['data']
+    return decode_image(data, texture_format, width, height, mip=mip)
+
+def encode_png(image: np.ndarray, level: int = 6) -> bytes:
+    height, width, channels = image.shape
+    rows = np.empty((height, width * channels + 1), dtype=np.uint8)
+    rows[:, 0] = 0  # no filter
+    rows[:, 1:] = image.reshape(height, width * channels)
+
+    def chunk(name: bytes, payload: bytes) -> bytes:
+        return struct.pack('>I', len(payload)) + name + payload + struct.pack('>I', zlib.crc32(name + payload) & 0xFFFFFFFF)
+
+    color_type = {1: 0, 2: 4, 3: 2, 4: 6}.get(channels)
+    header = struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(rows.tobytes(), level)) + chunk(b'IEND', b'')
+
+def main():
+    import argparse, sys, json
+    import os.path as p
+    arguments = argparse.ArgumentParser()
+    arguments.add_argument('--file', '-f', nargs='+', required=True, help='.tex files exported by unity.py with their .json siblings')
+    arguments.add_argument('--mip', '-m', type=int, default=0)
+    arguments.add_argument('--max-size', type=int, default=0)
+    options = arguments.parse_args(sys.argv[1:])
+    for file_path in options.file:
+        base = file_path[:file_path.rfind('.')]
+        with open(base + '.json', 'r') as fp:
+            texture = json.load(fp)
+        with open(file_path, 'rb') as fp:
+            data = fp.read()
+        try:
+            image = decode_texture(texture, data=data, mip=options.mip, max_size=options.max_size)
+        except NotImplementedError as error:
+            print('\033[31m[E] {} {}\033[0m'.format(file_path, error))
+            continue
+        with open(base + '.png', 'wb') as fp:
+            fp.write(encode_png(image))
+            print('# {} {}x{}'.format(p.abspath(fp.name), image.shape[1], image.shape[0]))
+
+if __name__ == '__main__':
+    main()
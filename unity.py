@@ -3,15 +3,18 @@
 import argparse
 import enum
 import sys
-import struct
-import io, traceback
+import io, mmap, shutil, tempfile, traceback
 
 import lz4.block
 
 from format import TextureFormat
 from stream import FileStream
-from typing import List, Dict, BinaryIO
-import lxml.etree as etree
+from sink import SinkType, GroupType, ExportSink, create_sink
+from hierarchy import HierarchyIndex
+from budget import DecodeBudget, DecodeError
+from cache import DecompressedCache
+import scripts
+from typing import Callable, List, Dict, Tuple
 
 import serialize
 import os, json
@@ -191,13 +194,12 @@ class UnityArchiveFile(object):
         self.blocks_info: BlocksInfo = BlocksInfo()
         self.direcory_info: DirectoryInfo = DirectoryInfo()
         self.data_offset: int = 0
+        self.blocks_offset: int = 0  # file position of the first storage block
 
     def print(self, *args):
         if self.debug: print(*args)
 
-    def decode(self, file_path: str):
-        fs = FileStream()
-        fs.open(file_path)
+    def decode_metadata(self, fs: FileStream):
         self.header.decode(fs)
         blocks_info_offset = self.header.get_blocks_info_offset()
         self.print(vars(self.header), blocks_info_offset, fs.position, self.header.compression_type)
@@ -212,23 +214,89 @@ class UnityArchiveFile(object):
         else:
             assert self.header.compressed_blocks_info_size == self.header.uncompressed_blocks_info_size
             self.read_blocks_and_directory(fs)
-        import io
-        buffer = io.BytesIO()
-        for block in self.blocks_info.blocks:
-            if block.compression_type != CompressionType.NONE:
-                compressed_data = fs.read(block.compressed_size)
-                uncompressed_data = lz4.block.decompress(compressed_data, block.uncompressed_size)
-                assert len(uncompressed_data) == block.uncompressed_size, uncompressed_data
-                buffer.write(uncompressed_data)
-            else:
-                uncompressed_data = fs.read(block.uncompressed_size)
-                buffer.write(uncompressed_data)
-        assert fs.position == fs.length
+        self.blocks_offset = self.header.get_data_offset() if self.header.has_blocks_at_the_end else fs.position  # blocks follow the header when their info is at the end
+
+    def decode(self, file_path: str, memory_limit: int = 0, scratch_dir: str = None, cache: 'DecompressedCache' = None):
+        fs = FileStream()
+        fs.open(file_path)
+        self.decode_metadata(fs)
+        uncompressed_size = sum(x.uncompressed_size for x in self.blocks_info.blocks)
+        cache_key = None
+        if cache and uncompressed_size > 0 and any(x.compression_type != CompressionType.NONE for x in self.blocks_info.blocks):
+            cache_key = cache.get_key(file_path, fs, self)
+            data = cache.open(cache_key, uncompressed_size)
+            if data is not None and not self.debug:  # debug still walks the blocks to dump data.bin
+                fs.close()
+                stream = FileStream()
+                stream.attach(data)
+                return stream
+            if data is not None: data.close()
+        if cache_key:
+            buffer = cache.create()
+        elif 0 < memory_limit < uncompressed_size:  # spill into an unlinked scratch file, mapped pages stay reclaimable by the kernel
+            buffer = tempfile.TemporaryFile(dir=scratch_dir)
+        else:
+            buffer = io.BytesIO()
+        try:
+            fs.seek(self.blocks_offset)
+            for block in self.blocks_info.blocks:
+                if block.compression_type != CompressionType.NONE:
+                    compressed_data = fs.read(block.compressed_size)
+                    uncompressed_data = lz4.block.decompress(compressed_data, block.uncompressed_size)
+                    assert len(uncompressed_data) == block.uncompressed_size, uncompressed_data
+                    buffer.write(uncompressed_data)
+                else:
+                    uncompressed_data = fs.read(block.uncompressed_size)
+                    buffer.write(uncompressed_data)
+            assert fs.position == (self.header.get_blocks_info_offset() if self.header.has_blocks_at_the_end else fs.length)
+        except:
+            if cache_key: cache.abort(buffer)
+            raise
+        finally:
+            fs.close()
+        if self.debug:
+            with open('data.bin', 'wb') as fp:
+                buffer.seek(0)
+                shutil.copyfileobj(buffer, fp)
         buffer.seek(0)
-        with open('data.bin', 'wb') as fp:
-            fp.write(buffer.read())
-            buffer.seek(0)
-        return FileStream(data=buffer.read())
+        stream = FileStream()
+        if cache_key:
+            stream.attach(cache.commit(buffer, cache_key))
+        elif isinstance(buffer, io.BytesIO) or uncompressed_size == 0:
+            stream.attach(buffer)
+        else:
+            buffer.flush()
+            stream.attach(mmap.mmap(buffer.fileno(), 0, access=mmap.ACCESS_READ))
+            buffer.close()
+        return stream
+
+    def read_range(self, fs: FileStream, offset: int, size: int) -> bytes:  # decompress only the blocks overlapping the range
+        chunks = []
+        position, uncompressed_offset = self.blocks_offset, 0
+        for block in self.blocks_info.blocks:
+            end = uncompressed_offset + block.uncompressed_size
+            if end > offset and uncompressed_offset < offset + size:
+                fs.seek(position)
+                if block.compression_type != CompressionType.NONE:
+                    data = lz4.block.decompress(fs.read(block.compressed_size), block.uncompressed_size)
+                else:
+                    data = fs.read(block.uncompressed_size)
+                chunks.append(data[max(0, offset - uncompressed_offset):offset + size - uncompressed_offset])
+            elif uncompressed_offset >= offset + size: break
+            position += block.compressed_size
+            uncompressed_offset = end
+        return b''.join(chunks)
+
+    def get_block_ranges(self, offset: int, size: int) -> List[Tuple[int, int]]:  # file position and size of the blocks read_range touches
+        ranges = []
+        position, uncompressed_offset = self.blocks_offset, 0
+        for block in self.blocks_info.blocks:
+            end = uncompressed_offset + block.uncompressed_size
+            if end > offset and uncompressed_offset < offset + size: ranges.append((position, block.compressed_size))
+            elif uncompressed_offset >= offset + size: break
+            position += block.compressed_size
+            uncompressed_offset = end
+        return ranges
 
     def read_blocks_and_directory(self, fs: FileStream):
         self.blocks_info.decode(fs)
@@ -241,6 +309,10 @@ class Commands(object):
     dump = 'dump'
     save = 'save'
     type = 'type'
+    mesh = 'mesh'
+    animation = 'animation'
+    hierarchy = 'hierarchy'
+    shader = 'shader'
 
     @classmethod
     def get_option_choices(cls):
@@ -249,6 +321,8 @@ class Commands(object):
             if name == value: choices.append(name)
         return choices
 
+RESOURCE_EXTENSIONS = {'AudioClip': '.fsb', 'VideoClip': '.bin'}  # .resS audio is an FMOD sound bank, video keeps its source extension
+
 def standardize(data):
     if isinstance(data, dict):
         for key, value in data.items():  # type: str, any
@@ -273,12 +347,20 @@ def processs(parameters: Dict[str, any]):
     command = options.command  # type: str
     stream = parameters.get('stream')  # type: FileStream
 
+    sink = parameters.get('sink')  # type: ExportSink
+
     def write(__path, __data, mode='w', verbose=True):
-        output = p.dirname(__path)
-        if not p.exists(output): os.makedirs(output)
-        with open(__path, mode) as __fp:
-            __fp.write(__data)
-            if verbose: print('# {}'.format(__fp.name))
+        sink.write(__path, __data, mode=mode, verbose=verbose)
+
+    def write_object(__path, __data, __type_tree, __o, verbose=True):
+        sink.write_object(__path, __data, type_tree=__type_tree, o=__o, verbose=verbose)
+
+    readers = []
+    def get_resource_reader():
+        if not readers:
+            import resources
+            readers.append(resources.ResourceReader(archive, stream, file_path=parameters.get('file_path')))
+        return readers[0]
 
     if command == Commands.dump:
         serializer.dump(stream)
@@ -289,64 +371,67 @@ def processs(parameters: Dict[str, any]):
     elif command == Commands.save:
         file_name = p.basename(parameters.get('file_path'))
         file_name = file_name[:file_name.rfind('.')]
-        objects = {}  # type: dict[int, tuple]
-        hierarchy = {}  # type: dict[int, list]
-        prefabs = []  # type: list[tuple]
-        workspace = p.join('__export/{}/{}'.format(file_name, serializer.node.path))
+        workspace = '{}/{}'.format(file_name, serializer.node.path)
+        index = None  # type: HierarchyIndex
+        local_scripts = get_local_scripts(serializer, stream)
+        if not options.types or 1 in options.types or 4 in options.types:
+            index = HierarchyIndex().decode(serializer, stream, resolve_script=get_script_resolver(local_scripts))
+        script_objects = filter_scripts(serializer, stream, set(options.script), local_scripts) if options.script else None
         for o in serializer.objects:
             type_tree = serializer.type_trees[o.type_id]
             if not type_tree.type_dict:
                 print('\033[31m[E][INCOMPLETE_TYPE_TREE] \033[33m{}\033[0m'.format(type_tree))
                 continue
-            export_path = p.join('{}/{}'.format(workspace, type_tree.name))
+            if script_objects is not None and type_tree.persistent_type_id == serialize.MONO_BEHAVIOUR_PERSISTENT_ID and o.local_identifier_in_file not in script_objects: continue
+            export_path = '{}/{}'.format(workspace, type_tree.name)
             if not options.types or type_tree.persistent_type_id in options.types:
-                if not p.exists(export_path): os.makedirs(export_path)
                 stream.seek(serializer.node.offset + serializer.header.data_offset + o.byte_start)
                 stream.lock(size=o.byte_size)
                 # print(vars(o))
                 # print(type_tree)
                 try:
+                    if serializer.budget: serializer.budget.begin(o)
                     target = serializer.deserialize(stream, meta_type=type_tree.type_dict.get(0))
+                except DecodeError as error:
+                    print('\033[31m[E][BUDGET] {}\033[0m'.format(json.dumps(error.to_json())))
+                    if error.reason == 'file_seconds': break
+                    continue
                 except Exception:
                     traceback.print_exc()
                     continue
+                finally:
+                    if serializer.budget: serializer.budget.finish()
                 stream.unlock()
                 name = repr(o.local_identifier_in_file)
                 # if not name: name = '{}_{}'.format(o.local_identifier_in_file, type_tree.name)
                 # else: name = name.decode('utf-8')
                 print('\033[33m{}'.format(o), end=' ')
-                if type_tree.persistent_type_id == 1:
-                    components = target['m_Component']['Array']  # type: dict
-                    objects[o.local_identifier_in_file] = target['m_Name'], [] if components['size'] == 0 else [x['component']['m_PathID'] for x in components['data']]
-                else:
-                    objects[o.local_identifier_in_file] = type_tree.name,
-                if type_tree.persistent_type_id == 4:
-                    father = target['m_Father']['m_PathID']
-                    item = o.local_identifier_in_file, target['m_GameObject']['m_PathID']
-                    if father != 0:
-                        if father not in hierarchy: hierarchy[father] = []
-                        hierarchy[father].append(item)
-                    else:
-                        prefabs.append(item)
-
                 if type_tree.name == 'Texture2D':
                     print(target)
                     target['m_TextureFormat'] = TextureFormat(target['m_TextureFormat']).__repr__()
                     if 'm_ForcedFallbackFormat' in target:
                         target['m_ForcedFallbackFormat'] = TextureFormat(target['m_ForcedFallbackFormat']).__repr__()
                     data = target['image data'].get('data', b'')  # type: bytes
-                    if not data and archive.direcory_info.nodes:
-                        stream_data = target.get('m_StreamData')  # type: dict
-                        offset = stream_data.get('offset')
-                        size = stream_data.get('size')
-                        node = archive.direcory_info.nodes[1]
-                        stream.seek(node.offset + offset)
-                        data = stream.read(size)
+                    stream_data = target.get('m_StreamData')  # type: dict
                     print('\033[0m')
-                    write('{}/{}.tex'.format(export_path, name), data, mode='wb')
+                    try:
+                        if not data and stream_data and not options.png:  # nothing decodes the pixels, stream them to the sink
+                            sink.write_resource('{}/{}.tex'.format(export_path, name), get_resource_reader(), stream_data)
+                        else:
+                            if not data and stream_data: data = get_resource_reader().read(stream_data)
+                            write('{}/{}.tex'.format(export_path, name), data, mode='wb')
+                    except (KeyError, ValueError) as error:
+                        print('\033[31m[E] {}\033[0m'.format(error))
+                    if options.png and data:
+                        import texture
+                        try:
+                            image = texture.decode_texture(target, data=data, mip=options.mip, max_size=options.png_max_size)
+                            write('{}/{}.png'.format(export_path, name), texture.encode_png(image), mode='wb')
+                        except (NotImplementedError, ValueError) as error:
+                            print('\033[31m[E] {}\033[0m'.format(error))
                     del target['image data']
                     standardize(target)
-                    write('{}/{}.json'.format(export_path, name), json.dumps(target, ensure_ascii=False, indent=4), mode='w', verbose=False)
+                    write_object('{}/{}.json'.format(export_path, name), target, type_tree, o, verbose=False)
                     print('\033[36m{}'.format(target))
                 elif type_tree.name == 'TextAsset':
                     data = target.get('m_Script')
@@ -358,49 +443,192 @@ def processs(parameters: Dict[str, any]):
                     if type_tree.persistent_type_id == serialize.MONO_BEHAVIOUR_PERSISTENT_ID and target:
                         ptr = target.get('m_Script')  # type: dict
                         entity = ptr.get('m_PathID')  # type: int
-                        if entity in mono_scripts:
-                            class_name, namespace, assembly = [b2s(x) for x in mono_scripts.get(entity)]  # type: tuple
+                        script = get_script(ptr.get('m_FileID'), entity, local_scripts)
+                        if script:
+                            class_name, namespace, assembly = script
                             definition = '<{}::\033[4m{}\033[0m,\033[2m{}\033[0m>'.format(namespace if namespace else 'global', class_name, assembly)
                             name = '{}_{}'.format(o.local_identifier_in_file, class_name)
-                            objects[o.local_identifier_in_file] = class_name,
                         else:
                             print('\033[31m[E]{}\033[0m'.format(entity))
                     print('{} \033[36m{}\033[0m'.format(definition, target))
-                    data = json.dumps(target, ensure_ascii=False, indent=4)
-                    write('{}/{}.json'.format(export_path, name), data, mode='w')
+                    write_object('{}/{}.json'.format(export_path, name), target, type_tree, o)
+                    if type_tree.name in RESOURCE_EXTENSIONS:
+                        import resources
+                        resource = target.get(resources.get_stream_field(type_tree.type_dict.get(0)))
+                        extension = RESOURCE_EXTENSIONS.get(type_tree.name)
+                        if type_tree.name == 'VideoClip': extension = p.splitext(target.get('m_OriginalPath', ''))[1] or extension
+                        try:
+                            if resource: sink.write_resource('{}/{}{}'.format(export_path, name, extension), get_resource_reader(), resource)
+                        except (KeyError, ValueError) as error:
+                            print('\033[31m[E] {}\033[0m'.format(error))
                 print('\033[0m')
-        prefab_output = p.join(workspace, 'Prefabs')
-        if not p.exists(prefab_output): os.makedirs(prefab_output)
-        for identifer, go in prefabs:
-            prefab = dump_prefab((identifer, go), objects, hierarchy)
-            name, _ = objects[go]
-            with open('{}/{}_{}.xml'.format(prefab_output, b2s(name), go), 'wb') as fp:
-                content = etree.tostring(prefab, encoding='utf-8', pretty_print=True)
-                fp.write(content)
-                print('>> {}'.format(p.abspath(fp.name)))
-
-
-def dump_prefab(entity, objects, hierarchy):
-    identifier, go = entity
-    node = etree.Element('GameObject')
-    name, components = objects[go]
-    node.set('name', s2u(name))
-    node.set('id', repr(go))
-    nodeComponents = etree.Element('Components')
-    for cid in components:
-        name, = objects[cid]
-        c = etree.Element(s2u(name))
-        c.set('id', repr(cid))
-        nodeComponents.append(c)
-    node.append(nodeComponents)
-    children = hierarchy.get(identifier)
-    if children:
-        length = len(children)
-        for n in range(length):
-            identifier, go = children[n]
-            child = dump_prefab((identifier, go), objects, hierarchy)
-            node.append(child)
-    return node
+        if index: write_prefabs(index, workspace, sink)
+    elif command == Commands.hierarchy:
+        file_name = p.basename(parameters.get('file_path'))
+        file_name = file_name[:file_name.rfind('.')]
+        workspace = '{}/{}'.format(file_name, serializer.node.path)
+        index = HierarchyIndex().decode(serializer, stream, resolve_script=get_script_resolver(get_local_scripts(serializer, stream)))
+        print('[=] {} {}'.format(serializer.node.path, index))
+        for root in index.roots:
+            for depth, transform in index.walk(root):
+                game_object = index.game_objects.get(transform, 0)
+                components = [index.component_types.get(x, 'Missing') for x in index.components.get(game_object, [])]
+                print('{}\033[33m{} \033[2m{}\033[0m \033[36m{}\033[0m'.format('  ' * depth, index.names.get(game_object, ''), game_object, ','.join(components)))
+        write_prefabs(index, workspace, sink)
+    elif command == Commands.mesh:
+        import mesh
+        file_name = p.basename(parameters.get('file_path'))
+        file_name = file_name[:file_name.rfind('.')]
+        workspace = '{}/{}'.format(file_name, serializer.node.path)
+        mesh_count = vertex_count = triangle_count = 0
+        for o in serializer.objects:
+            type_tree = serializer.type_trees[o.type_id]
+            if type_tree.name != 'Mesh' or not type_tree.type_dict: continue
+            try:
+                if serializer.budget: serializer.budget.begin(o)
+                data = mesh.extract_mesh(serializer, stream, o)
+            except DecodeError as error:
+                print('\033[31m[E][BUDGET] {}\033[0m'.format(json.dumps(error.to_json())))
+                continue
+            except Exception:
+                traceback.print_exc()
+                continue
+            finally:
+                if serializer.budget: serializer.budget.finish()
+            mesh_count += 1
+            vertex_count += data.vertex_count
+            triangle_count += data.triangle_count
+            print('\033[33m{} \033[36m{}\033[0m'.format(o, data))
+            export_path = '{}/{}/{}'.format(workspace, type_tree.name, o.local_identifier_in_file)
+            if options.mesh_format == 'npz':
+                write('{}.npz'.format(export_path), mesh.encode_npz(data), mode='wb')
+            elif options.mesh_format == 'obj':
+                write('{}.obj'.format(export_path), mesh.encode_obj(data), mode='wb')
+        print('[=] {} meshes={:,} vertices={:,} triangles={:,}'.format(serializer.node.path, mesh_count, vertex_count, triangle_count))
+    elif command == Commands.animation:
+        import animation, time
+        file_name = p.basename(parameters.get('file_path'))
+        file_name = file_name[:file_name.rfind('.')]
+        workspace = '{}/{}'.format(file_name, serializer.node.path)
+        clip_count = curve_count = key_count = 0
+        start = time.perf_counter()
+        for o in serializer.objects:
+            type_tree = serializer.type_trees[o.type_id]
+            if type_tree.name != 'AnimationClip' or not type_tree.type_dict: continue
+            try:
+                if serializer.budget: serializer.budget.begin(o)
+                data = animation.decode_animation(serializer, stream, o)
+            except DecodeError as error:
+                print('\033[31m[E][BUDGET] {}\033[0m'.format(json.dumps(error.to_json())))
+                continue
+            except Exception:
+                traceback.print_exc()
+                continue
+            finally:
+                if serializer.budget: serializer.budget.finish()
+            clip_count += 1
+            curve_count += len(data.curves)
+            key_count += data.key_count
+            print('\033[33m{} \033[36m{}\033[0m'.format(o, data))
+            if options.anim_format == 'npz':
+                write('{}/{}/{}.npz'.format(workspace, type_tree.name, o.local_identifier_in_file), animation.encode_npz(data), mode='wb')
+        elapsed = time.perf_counter() - start
+        print('[=] {} clips={:,} curves={:,} keys={:,} elapsed={:.3f}s'.format(serializer.node.path, clip_count, curve_count, key_count, elapsed))
+    elif command == Commands.shader:
+        import shader
+        from concurrent.futures import ThreadPoolExecutor
+        file_name = p.basename(parameters.get('file_path'))
+        file_name = file_name[:file_name.rfind('.')]
+        workspace = '{}/{}'.format(file_name, serializer.node.path)
+        platforms = {x.lower() for x in options.shader_platforms or []}
+        shader_count = program_count = compressed_size = decompressed_size = 0
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:  # lz4 releases the GIL while decompressing
+            for o in serializer.objects:
+                type_tree = serializer.type_trees[o.type_id]
+                if type_tree.name != 'Shader' or not type_tree.type_dict: continue
+                try:
+                    if serializer.budget: serializer.budget.begin(o)
+                    data = shader.extract_shader(serializer, stream, o)
+                    if platforms: data.blobs = [x for x in data.blobs if x.platform_name.lower() in platforms or str(x.platform) in platforms]
+                    data.decompress_all(executor)
+                except DecodeError as error:
+                    print('\033[31m[E][BUDGET] {}\033[0m'.format(json.dumps(error.to_json())))
+                    continue
+                except Exception:
+                    traceback.print_exc()
+                    continue
+                finally:
+                    if serializer.budget: serializer.budget.finish()
+                shader_count += 1
+                compressed_size += data.compressed_size
+                decompressed_size += data.decompressed_size
+                print('\033[33m{} \033[36m{}\033[0m'.format(o, data))
+                export_path = '{}/{}/{}'.format(workspace, type_tree.name, o.local_identifier_in_file)
+                for blob in data.blobs:
+                    for index, program in enumerate(data.iter_programs(blob)):
+                        write('{}/{}_{}/{}.bin'.format(export_path, blob.platform_name, blob.index, index), bytes(program), mode='wb', verbose=False)
+                        program_count += 1
+                write('{}/index.json'.format(export_path), json.dumps(shader.encode_index(data), indent=2 if not options.compact else None))
+        print('[=] {} shaders={:,} programs={:,} compressed={:,} decompressed={:,}'.format(serializer.node.path, shader_count, program_count, compressed_size, decompressed_size))
+
+def resolve_script(entity: int) -> str:
+    return b2s(mono_scripts[entity][0]) if entity in mono_scripts else None
+
+def get_script_names(class_name: str, namespace: str) -> Tuple[str, ...]:  # ClassName and Namespace.ClassName
+    return (class_name, '{}.{}'.format(namespace, class_name)) if namespace else (class_name,)
+
+def get_local_scripts(serializer, stream: FileStream) -> Dict[int, Tuple[str, str, str]]:  # MonoScripts of this file by path id, class name, namespace and assembly
+    scripts = {}
+    for o in serializer.objects:
+        type_tree = serializer.type_trees[o.type_id]
+        if type_tree.persistent_type_id != serialize.MONO_SCRIPT_PERSISTENT_ID or not type_tree.type_dict: continue
+        stream.seek(serializer.node.offset + serializer.header.data_offset + o.byte_start)
+        script = serializer.deserialize_fields(stream, type_tree.type_dict.get(0), {'m_ClassName', 'm_Namespace', 'm_AssemblyName'})
+        scripts[o.local_identifier_in_file] = tuple(b2s(script.get(x, b'')) for x in ('m_ClassName', 'm_Namespace', 'm_AssemblyName'))
+    return scripts
+
+def get_script(file_id: int, path_id: int, local_scripts: Dict[int, Tuple[str, str, str]]) -> Tuple[str, str, str]:  # None when unknown
+    if file_id == 0 and path_id in local_scripts: return local_scripts[path_id]
+    if path_id in mono_scripts:  # external scripts, the global store is keyed by path id alone
+        return tuple(b2s(x) for x in mono_scripts.get(path_id))
+    return None
+
+def get_script_resolver(local_scripts: Dict[int, Tuple[str, str, str]]) -> Callable[[int, int], str]:  # class name by m_FileID and m_PathID
+    def resolve(file_id: int, path_id: int) -> str:
+        script = get_script(file_id, path_id, local_scripts)
+        return script[0] if script else None
+    return resolve
+
+def resolve_script_names(file_id: int, path_id: int, local_scripts: Dict[int, Tuple[str, str, str]]) -> Tuple[str, ...]:
+    script = get_script(file_id, path_id, local_scripts)
+    return get_script_names(script[0], script[1]) if script else ()
+
+def read_script_pointer(serializer, stream: FileStream, o) -> dict:  # decodes fields up to the leading m_Script PPtr only
+    meta_type = serializer.type_trees[o.type_id].type_dict.get(0)
+    stream.seek(serializer.node.offset + serializer.header.data_offset + o.byte_start)
+    return serializer.deserialize_fields(stream, meta_type, {'m_Script'}).get('m_Script')
+
+def filter_scripts(serializer, stream: FileStream, names: set, local_scripts: Dict[int, Tuple[str, str, str]]) -> set:  # path ids of MonoBehaviours whose script matches any name
+    matched = set()
+    for o in serializer.objects:
+        type_tree = serializer.type_trees[o.type_id]
+        if type_tree.persistent_type_id != serialize.MONO_BEHAVIOUR_PERSISTENT_ID or not type_tree.type_dict: continue
+        if 0 <= type_tree.script_index < len(serializer.typeinfos):  # the type entry already names its script
+            info = serializer.typeinfos[type_tree.script_index]
+            file_id, path_id = info.local_serialized_file_index, info.local_identifier_in_file
+        else:
+            script = read_script_pointer(serializer, stream, o)
+            file_id, path_id = (script['m_FileID'], script['m_PathID']) if script else (0, 0)
+        if names.intersection(resolve_script_names(file_id, path_id, local_scripts)): matched.add(o.local_identifier_in_file)
+    return matched
+
+def write_prefabs(index, workspace: str, sink: ExportSink):  # each prefab streams into the sink, large hierarchies are never buffered whole
+    prefab_output = '{}/Prefabs'.format(workspace)
+    for transform in index.roots:
+        go = index.game_objects.get(transform, 0)
+        path = '{}/{}_{}.xml'.format(prefab_output, index.names.get(go, ''), go)
+        sink.write_stream(path, lambda fp, root=transform: index.write_prefab(fp, root), verbose=False)
+        print('>> {}'.format(path))
 
 def collect_mono_scripts(serializer, stream: FileStream):
     MONO_SCRIPT_TYPE_ID = -1
@@ -419,25 +647,101 @@ def collect_mono_scripts(serializer, stream: FileStream):
             type_name = script.get('m_ClassName')
             namespace = script.get('m_Namespace')
             assembly = script.get('m_AssemblyName')
-            # encode mono scripts to cache storage
-            if o.local_identifier_in_file not in mono_scripts:
-                mono_scripts_stream.write(struct.pack('q', o.local_identifier_in_file))
-                mono_scripts_stream.write(struct.pack('i', len(type_name)))
-                mono_scripts_stream.write(type_name)
-                mono_scripts_stream.write(struct.pack('i', len(namespace)))
-                mono_scripts_stream.write(namespace)
-                mono_scripts_stream.write(struct.pack('i', len(assembly)))
-                mono_scripts_stream.write(assembly)
-                mono_scripts[o.local_identifier_in_file] = type_name, namespace, assembly
+            mono_scripts.add(o.local_identifier_in_file, type_name, namespace, assembly)
+    mono_scripts.flush()
 
-def main():
+def open_archive(file_path: str, debug: bool = False, memory_limit: int = 0, scratch_dir: str = None, cache: 'DecompressedCache' = None) -> Tuple['UnityArchiveFile', FileStream, List[FileNode]]:
+    archive = UnityArchiveFile(debug=debug)
+    try:
+        stream = archive.decode(file_path=file_path, memory_limit=memory_limit, scratch_dir=scratch_dir, cache=cache)
+        nodes = [x for x in archive.direcory_info.nodes if x.flags == NodeFlags.SerializedFile]
+    except:
+        stream = FileStream(file_path=file_path)
+        node = FileNode()
+        node.size = stream.length
+        nodes = [node]
+    return archive, stream, nodes
+
+def decode_serialized_file(node: FileNode, stream: FileStream, debug: bool = False):
+    stream.endian = '>'
+    serializer = serialize.SerializedFile(debug=debug, node=node)
+    serializer.decode(stream)
+    return serializer
+
+def create_arguments() -> argparse.ArgumentParser:
     arguments = argparse.ArgumentParser()
-    arguments.add_argument('--file', '-f', nargs='+', required=True)
+    arguments.add_argument('--file', '-f', nargs='+')
     arguments.add_argument('--command', '-c', choices=Commands.get_option_choices(), default=Commands.dump)
     arguments.add_argument('--debug', '-d', action='store_true')
     arguments.add_argument('--types', '-t', nargs='+', type=int)
+    arguments.add_argument('--script', nargs='+')  # ClassName or Namespace.ClassName, other MonoBehaviours are not decoded
     arguments.add_argument('--dump-mono-scripts', '-dms', action='store_true')
+    arguments.add_argument('--output', '-o', default='__export')
+    arguments.add_argument('--sink', '-s', choices=SinkType.get_option_choices(), default=SinkType.file)
+    arguments.add_argument('--group', '-g', choices=(GroupType.bundle, GroupType.type), default=GroupType.bundle)
+    arguments.add_argument('--compact', action='store_true')
+    arguments.add_argument('--png', action='store_true')
+    arguments.add_argument('--mip', type=int, default=0)
+    arguments.add_argument('--png-max-size', type=int, default=0)
+    arguments.add_argument('--mesh-format', choices=('npz', 'obj'))
+    arguments.add_argument('--anim-format', choices=('npz',))
+    arguments.add_argument('--shader-platforms', nargs='+')  # platform names or ids to decompress, all when omitted
+    arguments.add_argument('--watch', '-w')
+    arguments.add_argument('--watch-pattern', default='*')
+    arguments.add_argument('--watch-settle', type=float, default=2.0)
+    arguments.add_argument('--watch-interval', type=float, default=1.0)
+    arguments.add_argument('--watch-timeout', type=float, default=0)
+    arguments.add_argument('--watch-state')
+    arguments.add_argument('--jobs', '-j', type=int, default=0)
+    arguments.add_argument('--memory-limit', type=int, default=0)  # MiB of decompressed data kept in memory, larger archives go to a mapped scratch file
+    arguments.add_argument('--scratch-dir')
+    arguments.add_argument('--cache-dir')  # decompressed data shared between runs and workers, opt-in
+    arguments.add_argument('--cache-size', type=int, default=4096)  # MiB, least recently used entries are evicted beyond it
+    arguments.add_argument('--max-object-bytes', type=int, default=0)
+    arguments.add_argument('--max-elements', type=int, default=0)
+    arguments.add_argument('--max-depth', type=int, default=0)
+    arguments.add_argument('--max-object-seconds', type=float, default=0)
+    arguments.add_argument('--max-file-seconds', type=float, default=0)
+    return arguments
+
+def create_budget(options) -> DecodeBudget:
+    limits = options.max_object_bytes, options.max_elements, options.max_depth, options.max_object_seconds, options.max_file_seconds
+    if not any(limits): return None
+    return DecodeBudget(*limits)
+
+def create_cache(options) -> DecompressedCache:
+    return DecompressedCache(options.cache_dir, max_bytes=options.cache_size << 20) if options.cache_dir else None
+
+def process_file(file_path: str, options, sink: ExportSink):
+    print('>>>', file_path)
+    archive, stream, nodes = open_archive(file_path, debug=options.debug, memory_limit=options.memory_limit << 20, scratch_dir=options.scratch_dir, cache=create_cache(options))
+    budget = create_budget(options)
+    if budget: budget.begin_file()
+    for node in nodes:
+        if archive.direcory_info.nodes: print('[+] {} {:,}'.format(node.path, node.size))
+        serializer = decode_serialized_file(node, stream, debug=options.debug)
+        serializer.budget = budget
+        collect_mono_scripts(serializer, stream)
+        processs(parameters=locals())
+
+def init_worker():
+    global mono_scripts
+    mono_scripts = scripts.open_default_store()
+
+def export_bundle(file_path: str, options):
+    import os.path as p
+    output = options.output
+    if options.sink != SinkType.file:  # archive and database sinks cannot be shared between worker processes
+        name = p.basename(file_path)
+        output = '{}/{}'.format(options.output, name[:name.rfind('.')] if '.' in name else name)
+    sink = create_sink(options.sink, output=output, compact=options.compact, group=options.group)
+    try: process_file(file_path, options, sink)
+    finally: sink.close()
+
+def main():
+    arguments = create_arguments()
     options = arguments.parse_args(sys.argv[1:])
+    if not options.file and not options.watch: arguments.error('one of --file or --watch is required')
     if options.dump_mono_scripts:
         mono_script_keys = list(mono_scripts.keys())
         mono_script_keys.sort()
@@ -445,52 +749,20 @@ def main():
             class_name, namespace, assembly = [b2s(x) for x in mono_scripts.get(identifier)]
             print('\033[36m{} \033[33m{}::\033[4m{}\033[0m \033[2m{}\033[0m'.format(identifier, namespace if namespace else 'global', class_name, assembly))
 
-    for file_path in options.file:
-        print('>>>', file_path)
-        archive = UnityArchiveFile(debug=options.debug)
-        try:
-            stream = archive.decode(file_path=file_path)
-            node = archive.direcory_info.nodes[0]
-        except:
-            stream = FileStream(file_path=file_path)
-            node = FileNode()
-            node.size = stream.length
-        if archive.direcory_info.nodes:
-            for node in archive.direcory_info.nodes:
-                if node.flags == NodeFlags.SerializedFile:
-                    print('[+] {} {:,}'.format(node.path, node.size))
-                    stream.endian = '>'
-                    serializer = serialize.SerializedFile(debug=options.debug, node=node)
-                    serializer.decode(stream)
-                    collect_mono_scripts(serializer, stream)
-                    processs(parameters=locals())
-        else:
-            serializer = serialize.SerializedFile(debug=options.debug, node=node)
-            serializer.decode(stream)
-            collect_mono_scripts(serializer, stream)
-            processs(parameters=locals())
-
-def load_scripts():
-    import os.path as p
-    fp = open(p.join(p.dirname(p.abspath(__file__)), 'mono_scrips.bin'), 'a+b')
-    fp.seek(0, os.SEEK_END)
-    length = fp.tell()
-    fp.seek(0)
-    position = 0
+    if options.watch:
+        import watch, functools
+        watcher = watch.DirectoryWatcher(options.watch, pattern=options.watch_pattern, settle=options.watch_settle, state_path=options.watch_state)
+        watch.run(watcher, functools.partial(export_bundle, options=options), jobs=options.jobs, interval=options.watch_interval,
+                  idle_timeout=options.watch_timeout, initializer=init_worker)
+        return
+    sink = create_sink(options.sink, output=options.output, compact=options.compact, group=options.group)
     try:
-        while fp.tell() < length:
-            identifer, = struct.unpack('q', fp.read(8))
-            values = []
-            for _ in range(3):
-                size, = struct.unpack('i', fp.read(4))
-                values.append(fp.read(size) if size > 0 else b'')
-            mono_scripts[identifer] = tuple(values)
-            position = fp.tell()
-        assert fp.tell() == length
-    except: fp.truncate(position)
-    return fp
+        for file_path in options.file:
+            process_file(file_path, options, sink)
+    finally:
+        sink.close()
 
 if __name__ == '__main__':
-    mono_scripts = {}
-    mono_scripts_stream = load_scripts()  # type: BinaryIO
-    main()
+    mono_scripts = scripts.open_default_store()
+    try: main()
+    finally: mono_scripts.close()
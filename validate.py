@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+import argparse, json, os, sys, time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
+import serialize
+import unity
+from budget import DecodeBudget, DecodeError
+from duplicates import find_bundles
+from stream import FileStream
+
+class ValidationFailure(object):
+    def __init__(self, node: str, path_id: int, type_name: str, offset: int, byte_size: int, consumed: int, error: str):
+        self.node: str = node
+        self.path_id: int = path_id
+        self.type_name: str = type_name
+        self.offset: int = offset  # decompressed position of the object inside its node
+        self.byte_size: int = byte_size
+        self.consumed: int = consumed
+        self.error: str = error
+
+    def to_json(self) -> dict:
+        return {'node': self.node, 'path_id': self.path_id, 'type': self.type_name, 'offset': self.offset,
+                'byte_size': self.byte_size, 'consumed': self.consumed, 'error': self.error}
+
+    def __repr__(self):
+        return '{} {} {} offset={:,} size={:,} consumed={:,} {}'.format(self.node, self.path_id, self.type_name, self.offset, self.byte_size, self.consumed, self.error)
+
+class NodeReport(object):
+    def __init__(self, file_path: str, node: str):
+        self.file_path: str = file_path
+        self.node: str = node
+        self.objects: int = 0
+        self.bytes: int = 0
+        self.unchecked: int = 0  # objects without a type tree
+        self.failures: List[ValidationFailure] = []
+        self.error: str = ''
+
+    def to_json(self) -> dict:
+        return {'file': self.file_path, 'node': self.node, 'objects': self.objects, 'bytes': self.bytes, 'unchecked': self.unchecked,
+                'failures': [x.to_json() for x in self.failures], 'error': self.error}
+
+def list_nodes(file_path: str) -> Tuple[str, List[int], str]:
+    archive = unity.UnityArchiveFile(debug=False)
+    fs = FileStream(file_path=file_path)
+    try:
+        archive.decode_metadata(fs)
+        return file_path, [x.index for x in archive.direcory_info.nodes if x.is_serialized_file], ''
+    except Exception as error: return file_path, [], '{}: {}'.format(type(error).__name__, error)
+    finally: fs.close()
+
+def validate_objects(serializer: serialize.SerializedFile, stream: FileStream, report: NodeReport):  # walks each type tree advancing the cursor only
+    base_offset = serializer.node.offset + serializer.header.data_offset
+    budget = serializer.budget = DecodeBudget()  # no limits, bounds counts by the bytes left in the object
+    for o in serializer.objects:
+        type_tree = serializer.type_trees[o.type_id]
+        meta_type = type_tree.type_dict.get(0) if type_tree.type_dict else None
+        if not meta_type:
+            report.unchecked += 1
+            continue
+        offset = base_offset + o.byte_start
+        stream.seek(offset)
+        error = ''
+        try:
+            budget.begin(o)
+            budget.enter(stream, meta_type.name)
+            serializer.skip(stream, meta_type)
+            budget.leave()
+        except DecodeError as e: error = str(e)
+        except Exception as e: error = '{}: {}'.format(type(e).__name__, e)
+        finally: budget.finish()
+        consumed = stream.position - offset
+        report.objects += 1
+        report.bytes += o.byte_size
+        if not error and consumed != o.byte_size: error = 'consumed {:,} of {:,} bytes'.format(consumed, o.byte_size)
+        if error: report.failures.append(ValidationFailure(serializer.node.path, o.local_identifier_in_file, type_tree.name, offset, o.byte_size, consumed, error))
+
+def validate_node(file_path: str, node_index: int) -> NodeReport:
+    archive = unity.UnityArchiveFile(debug=False)
+    fs = FileStream(file_path=file_path)
+    report = NodeReport(file_path, '')
+    try:
+        archive.decode_metadata(fs)
+        node = archive.direcory_info.nodes[node_index]
+        report.node = node.path
+        local = unity.FileNode()  # only the blocks of this node are decompressed, so it starts at zero
+        local.size, local.flags, local.path, local.index = node.size, node.flags, node.path, node.index
+        stream = FileStream(data=archive.read_range(fs, node.offset, node.size))
+        serializer = unity.decode_serialized_file(local, stream)
+        validate_objects(serializer, stream, report)
+    except Exception as error: report.error = '{}: {}'.format(type(error).__name__, error)
+    finally: fs.close()
+    return report
+
+def validate_node_task(task: Tuple[str, int]) -> NodeReport:
+    return validate_node(*task)
+
+def validate_bundles(files: List[str], jobs: int = 0, initializer=None) -> Tuple[List[NodeReport], List[Tuple[str, str]]]:  # every serialized node of every bundle is a task
+    jobs = jobs if jobs > 0 else os.cpu_count() or 1
+    reports, errors = [], []
+    with ProcessPoolExecutor(max_workers=jobs, initializer=initializer) as executor:
+        tasks = []
+        for file_path, nodes, error in executor.map(list_nodes, files, chunksize=max(1, min(64, len(files) // (jobs * 4) or 1))):
+            if error: errors.append((file_path, error))
+            tasks.extend((file_path, x) for x in nodes)
+        reports.extend(executor.map(validate_node_task, tasks, chunksize=max(1, min(16, len(tasks) // (jobs * 4) or 1))))
+    return reports, errors
+
+def main():
+    arguments = argparse.ArgumentParser()
+    arguments.add_argument('--directory', '-d')
+    arguments.add_argument('--file', '-f', nargs='+')
+    arguments.add_argument('--jobs', '-j', type=int, default=0)
+    arguments.add_argument('--output', '-o')
+    options = arguments.parse_args(sys.argv[1:])
+    if not options.directory and not options.file: arguments.error('one of --directory or --file is required')
+    start = time.perf_counter()
+    files = list(options.file or [])
+    if options.directory: files.extend(find_bundles(options.directory))
+    reports, errors = validate_bundles(files, jobs=options.jobs, initializer=unity.init_worker)
+    for file_path, error in errors: print('\033[31m[E] {} {}\033[0m'.format(file_path, error))
+    failed = 0
+    for report in reports:
+        if report.error: print('\033[31m[E] {} {} {}\033[0m'.format(report.file_path, report.node, report.error))
+        for failure in report.failures: print('\033[31m[F] {} {}\033[0m'.format(report.file_path, failure))
+        failed += len(report.failures) + (1 if report.error else 0)
+    elapsed = time.perf_counter() - start
+    total = sum(x.bytes for x in reports)
+    print('[=] bundles={:,} nodes={:,} objects={:,} unchecked={:,} failed={:,} bytes={:,} elapsed={:.2f}s throughput={:.1f}MiB/s'.format(
+        len(files), len(reports), sum(x.objects for x in reports), sum(x.unchecked for x in reports), failed + len(errors), total, elapsed,
+        total / elapsed / (1 << 20) if elapsed > 0 else 0))
+    if options.output:
+        with open(options.output, 'w') as fp:
+            json.dump({'errors': [{'file': k, 'error': v} for k, v in errors], 'nodes': [x.to_json() for x in reports]}, fp, indent=1)
+    if failed or errors: sys.exit(1)
+
+if __name__ == '__main__':
+    main()
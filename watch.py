@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+import fnmatch, json, os, time
+import os.path as p
+from concurrent.futures import ProcessPoolExecutor, Future
+from typing import Dict, List, Tuple, Callable
+
+ARCHIVE_SIGNATURE = b'UnityFS\x00'
+
+Signature = Tuple[int, int]  # size, mtime
+
+class DirectoryWatcher(object):
+    def __init__(self, directory: str, pattern: str = '*', settle: float = 2.0, state_path: str = None):
+        self.directory: str = directory
+        self.pattern: str = pattern
+        self.settle: float = settle  # seconds a file must stay unchanged before it is picked up
+        self.state_path: str = state_path
+        self.observed: Dict[str, Tuple[Signature, float]] = {}  # path -> (signature, first seen with it)
+        self.processed: Dict[str, Signature] = {}
+        self.load_state()
+
+    def load_state(self):
+        if not self.state_path or not p.exists(self.state_path): return
+        with open(self.state_path) as fp:
+            self.processed = {k: tuple(v) for k, v in json.load(fp).items()}
+
+    def save_state(self):
+        if not self.state_path: return
+        temp_path = '{}.tmp'.format(self.state_path)
+        with open(temp_path, 'w') as fp:
+            json.dump(self.processed, fp)
+        os.replace(temp_path, self.state_path)
+
+    def scan(self) -> Dict[str, Signature]:
+        files = {}
+        stack = [self.directory]
+        while stack:
+            try: entries = list(os.scandir(stack.pop()))
+            except OSError: continue
+            for entry in entries:
+                if entry.name.startswith('.'): continue
+                if entry.is_dir(follow_symlinks=False): stack.append(entry.path)
+                elif entry.is_file() and fnmatch.fnmatch(entry.name, self.pattern):
+                    try: stat = entry.stat()
+                    except OSError: continue
+                    files[entry.path] = stat.st_size, stat.st_mtime_ns
+        return files
+
+    @staticmethod
+    def is_archive(file_path: str) -> bool:
+        try:
+            with open(file_path, 'rb') as fp: return fp.read(len(ARCHIVE_SIGNATURE)) == ARCHIVE_SIGNATURE
+        except OSError: return False
+
+    def poll(self, now: float = None) -> List[Tuple[str, Signature]]:  # files that settled since they were last processed
+        now = time.time() if now is None else now
+        files = self.scan()
+        ready = []
+        for file_path in list(self.observed.keys()):
+            if file_path not in files: del self.observed[file_path]
+        for file_path, signature in files.items():
+            if self.processed.get(file_path) == signature: continue
+            observed = self.observed.get(file_path)
+            if not observed or observed[0] != signature:
+                self.observed[file_path] = signature, now
+                continue
+            if now - observed[1] < self.settle: continue
+            del self.observed[file_path]
+            if not self.is_archive(file_path):
+                self.processed[file_path] = signature  # not a bundle, remember it so it is not probed again
+                continue
+            ready.append((file_path, signature))
+        return ready
+
+    def mark_processed(self, file_path: str, signature: Signature):
+        self.processed[file_path] = signature
+        self.save_state()
+
+def run(watcher: DirectoryWatcher, process: Callable[[str], any], jobs: int = 0, interval: float = 1.0, idle_timeout: float = 0,
+        initializer: Callable = None):
+    jobs = jobs if jobs > 0 else os.cpu_count() or 1
+    queue = []  # type: List[Tuple[str, Signature]]
+    running = {}  # type: Dict[Future, Tuple[str, Signature, float]]
+    last_activity = time.time()
+    print('[+] watching {} jobs={} settle={}s'.format(watcher.directory, jobs, watcher.settle))
+    with ProcessPoolExecutor(max_workers=jobs, initializer=initializer) as executor:
+        while True:
+            busy = {x[0] for x in running.values()} | {x[0] for x in queue}
+            for file_path, signature in watcher.poll():
+                if file_path in busy: continue  # changed again while queued or running, picked up once it is done
+                queue.append((file_path, signature))
+            while queue and len(running) < jobs:
+                file_path, signature = queue.pop(0)
+                running[executor.submit(process, file_path)] = file_path, signature, time.time()
+            for future in [x for x in running.keys() if x.done()]:
+                file_path, signature, start = running.pop(future)
+                error = future.exception()
+                if error: print('\033[31m[E] {} {}\033[0m'.format(file_path, error))
+                else: print('\033[32m[=] {} {:.2f}s\033[0m'.format(file_path, time.time() - start))
+                watcher.mark_processed(file_path, signature)  # failed bundles are retried once they change again
+            if queue or running or watcher.observed: last_activity = time.time()
+            elif idle_timeout > 0 and time.time() - last_activity >= idle_timeout: break
+            time.sleep(interval)